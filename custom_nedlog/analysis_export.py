@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, achref louati and contributors
+# For license information, please see license.txt
+
+import csv
+import hashlib
+import io
+import os
+import tempfile
+
+import frappe
+from frappe import _
+from frappe.utils import now_datetime
+
+EXPORT_FORMATS = ("csv", "xlsx")
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+}
+
+# Au-delà de cette taille le tampon d'export est écrit sur disque
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# Colonnes (champ, libellé) de l'analyse BOM par Sales Order (api.get_sales_order_bom_info)
+BOM_ANALYSIS_COLUMNS = [
+    ("sales_order", "Sales Order"),
+    ("customer", "Client"),
+    ("item_code", "Article Fini"),
+    ("item_name", "Désignation Article Fini"),
+    ("qty", "Qté Commandée"),
+    ("delivery_date", "Date de Livraison"),
+    ("bom_name", "BOM"),
+    ("raw_material", "Code Article"),
+    ("raw_material_name", "Description"),
+    ("qty_per_unit", "Qté par Unité"),
+    ("total_qty", "Qté Nécessaire"),
+    ("uom", "Unité"),
+    ("rate", "Prix"),
+    ("amount", "Montant"),
+    ("total_available", "Stock Disponible")
+]
+
+# Colonnes de l'analyse des besoins (production_analysis.calculate_stock_requirements)
+REQUIREMENTS_COLUMNS = [
+    ("type", "Type"),
+    ("item_code", "Item Code"),
+    ("item_name", "Description"),
+    ("sales_order", "Sales Order"),
+    ("customer", "Client"),
+    ("customer_po_no", "Order Number"),
+    ("required_qty", "Qty Requise"),
+    ("total_required_qty", "Qty Totale"),
+    ("available_qty", "Stock Disponible"),
+    ("shortage_qty", "Manque"),
+    ("stock_uom", "Unité"),
+    ("supplier_name", "Fournisseur"),
+    ("item_group", "Item Group"),
+    ("brand", "Brand"),
+    ("weight_per_unit", "Weight")
+]
+
+
+# Colonnes du tableau des besoins affiché dans la liste des Sales Orders
+# (mêmes clés et libellés que AVAILABLE_COLUMNS dans sales_order_list.js)
+REQUIREMENT_TABLE_COLUMNS = {
+    "item-code": "Item Code",
+    "description": "Description",
+    "qty-required": "Qty Requise",
+    "stock-available": "Stock Disponible",
+    "shortage": "Manque",
+    "warehouses-list": "Emplacements",
+    "warehouses-qty": "Qtés par Emplacement",
+    "supplier": "Fournisseur",
+    "order-number": "Order Number",
+    "status": "Statut",
+    "item-group": "Item Group",
+    "brand": "Brand",
+    "weight": "Weight"
+}
+
+
+def order_requirements_for_display(requirements):
+    """
+    Ordonne les lignes comme le tableau affiché: les détails de chaque article
+    suivis de sa ligne de total
+    """
+    details_by_item = {}
+    totals_by_item = {}
+
+    for row in requirements:
+        if row.get("type") == "total":
+            totals_by_item[row["item_code"]] = row
+        else:
+            details_by_item.setdefault(row["item_code"], []).append(row)
+
+    for item_code, details in details_by_item.items():
+        yield from details
+
+        if item_code in totals_by_item:
+            yield totals_by_item[item_code]
+
+
+def format_requirement_cell(row, col_key):
+    """
+    Valeur d'une cellule du tableau des besoins, telle qu'affichée dans le navigateur
+    """
+    is_total = row.get("type") == "total"
+    shortage = max(0, (row.get("total_required_qty") or 0) - (row.get("available_qty") or 0))
+
+    if col_key == "item-code":
+        return row.get("item_code")
+    if col_key == "description":
+        return row.get("item_name") or ""
+    if col_key == "qty-required":
+        return (row.get("total_required_qty") if is_total else row.get("required_qty")) or 0
+    if col_key == "stock-available":
+        return (row.get("available_qty") or 0) if is_total else "-"
+    if col_key == "shortage":
+        return shortage if is_total else "-"
+    if col_key == "warehouses-list":
+        if is_total and row.get("warehouses"):
+            return ", ".join(w["warehouse"] for w in row["warehouses"])
+        return "-"
+    if col_key == "warehouses-qty":
+        if is_total and row.get("warehouses"):
+            return " | ".join(f"{w['warehouse']}: {w.get('actual_qty') or 0}" for w in row["warehouses"])
+        return "-"
+    if col_key == "supplier":
+        return row.get("supplier_name") or row.get("default_supplier") or "Non défini"
+    if col_key == "order-number":
+        return f"TOTAL ({row.get('orders_count') or 0} orders)" if is_total else row.get("customer_po_no") or ""
+    if col_key == "status":
+        if not is_total:
+            return "DÉTAIL"
+        return "MANQUE" if shortage > 0 else "DISPONIBLE"
+    if col_key == "item-group":
+        return row.get("item_group") or "-"
+    if col_key == "brand":
+        return row.get("brand") or "-"
+    if col_key == "weight":
+        return row.get("weight_per_unit") or "-"
+
+    return "-"
+
+
+def get_requirement_table_columns(visible_columns=None):
+    """
+    Colonnes (clé, libellé) demandées, dans l'ordre du tableau
+    """
+    visible_columns = visible_columns or list(REQUIREMENT_TABLE_COLUMNS)
+
+    return [
+        (col_key, label) for col_key, label in REQUIREMENT_TABLE_COLUMNS.items()
+        if col_key in visible_columns
+    ]
+
+
+def iter_requirement_table_rows(rows, visible_columns=None):
+    """
+    Convertit les lignes de besoins en lignes du tableau (clé = libellé de colonne),
+    au format attendu par les rapports PDF et email
+    """
+    columns = get_requirement_table_columns(visible_columns)
+
+    for row in rows:
+        table_row = {label: format_requirement_cell(row, col_key) for col_key, label in columns}
+        table_row["_type"] = "total" if row.get("type") == "total" else "detail"
+        yield table_row
+
+
+def iter_export_values(rows, columns):
+    """
+    Convertit chaque ligne (dict) en liste de valeurs selon les colonnes
+    """
+    fields = [field for field, label in columns]
+
+    for row in rows:
+        yield [row.get(field) for field in fields]
+
+
+def write_csv(rows, columns, fileobj):
+    """
+    Écrit l'en-tête puis les lignes en CSV, une à une, dans un fichier binaire
+    """
+    # utf-8-sig pour qu'Excel détecte l'encodage des accents
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="", write_through=True)
+
+    try:
+        writer = csv.writer(text)
+        writer.writerow([label for field, label in columns])
+
+        for values in iter_export_values(rows, columns):
+            writer.writerow(["" if value is None else value for value in values])
+
+        text.flush()
+    finally:
+        # Rendre le fichier sous-jacent à l'appelant sans le fermer
+        text.detach()
+
+
+def write_xlsx(rows, columns, fileobj, sheet_title="Analyse"):
+    """
+    Écrit les lignes en XLSX avec openpyxl en mode write-only:
+    les lignes ne sont pas conservées en mémoire après leur ajout
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append([label for field, label in columns])
+
+    for values in iter_export_values(rows, columns):
+        sheet.append(values)
+
+    workbook.save(fileobj)
+
+
+def write_export(rows, columns, file_format, fileobj):
+    """
+    Écrit l'export dans le format demandé
+    """
+    if file_format == "xlsx":
+        write_xlsx(rows, columns, fileobj)
+    else:
+        write_csv(rows, columns, fileobj)
+
+
+def get_export_format(file_format=None, filename=None):
+    """
+    Détermine le format d'export à partir du paramètre ou de l'extension du fichier
+    """
+    if not file_format and filename and "." in filename:
+        file_format = filename.rsplit(".", 1)[-1]
+
+    file_format = (file_format or "csv").lower()
+
+    if file_format not in EXPORT_FORMATS:
+        frappe.throw(_("Format d'export non supporté: {0}").format(file_format))
+
+    return file_format
+
+
+def get_export_filename(prefix, file_format, filename=None):
+    """
+    Nom de fichier de l'export, avec la bonne extension
+    """
+    if not filename:
+        filename = f"{prefix}_{now_datetime().strftime('%Y%m%d_%H%M%S')}"
+
+    base = filename.rsplit(".", 1)[0] if filename.lower().endswith(EXPORT_FORMATS) else filename
+
+    return f"{base}.{file_format}"
+
+
+def build_export_response(rows, columns, file_format, filename):
+    """
+    Écrit l'export dans un tampon temporaire (disque au-delà de SPOOL_MAX_SIZE)
+    et renvoie une réponse HTTP qui le transmet par blocs
+    """
+    from werkzeug.wrappers import Response
+    from werkzeug.wsgi import wrap_file
+
+    # Le tampon est écrit pendant la requête: le flux SQL doit être consommé
+    # avant la fermeture de la connexion à la base par Frappe
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    try:
+        write_export(rows, columns, file_format, buffer)
+        content_length = buffer.tell()
+        buffer.seek(0)
+    except Exception:
+        buffer.close()
+        raise
+
+    response = Response(
+        wrap_file(frappe.local.request.environ, buffer),
+        mimetype=EXPORT_MIMETYPES[file_format],
+        direct_passthrough=True
+    )
+    response.headers["Content-Length"] = str(content_length)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    return response
+
+
+def save_export_file(rows, columns, file_format, filename):
+    """
+    Écrit l'export directement dans les fichiers privés du site
+    et crée le document File correspondant sans recharger son contenu
+    """
+    from frappe.utils.file_manager import get_file_name
+
+    file_name = get_file_name(filename, frappe.generate_hash(length=6))
+    file_path = frappe.get_site_path("private", "files", file_name)
+
+    content_hash = hashlib.md5()
+
+    with open(file_path, "wb") as f:
+        write_export(rows, columns, file_format, f)
+
+    # Hash calculé par blocs pour éviter la lecture complète par File
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            content_hash.update(chunk)
+
+    file_doc = frappe.get_doc({
+        "doctype": "File",
+        "file_name": file_name,
+        "file_url": f"/private/files/{file_name}",
+        "is_private": 1,
+        "file_size": os.path.getsize(file_path),
+        "content_hash": content_hash.hexdigest(),
+        "folder": "Home"
+    })
+    file_doc.insert(ignore_permissions=True)
+
+    return file_doc
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2024, achref louati and contributors
+# For license information, please see license.txt
+
+import json
+import zlib
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now
+
+# Durée de conservation par défaut d'une analyse (secondes)
+DEFAULT_ANALYSIS_TTL = 6 * 60 * 60
+
+# Nombre de lignes par bloc compressé
+ROWS_PER_CHUNK = 1000
+
+CACHE_PREFIX = "material_analysis"
+
+
+def get_analysis_ttl():
+    """
+    Durée de conservation configurable via site_config (material_analysis_ttl)
+    """
+    return cint(frappe.conf.get("material_analysis_ttl")) or DEFAULT_ANALYSIS_TTL
+
+
+def _key(analysis_id, suffix):
+    return f"{CACHE_PREFIX}:{analysis_id}:{suffix}"
+
+
+def _compress(value):
+    return zlib.compress(json.dumps(value, default=str, separators=(",", ":")).encode())
+
+
+def _decompress(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def save_analysis(analysis, rows, ttl=None):
+    """
+    Enregistre une analyse côté serveur sous un identifiant, avec expiration.
+
+    Les lignes (itérable) sont compressées par blocs de ROWS_PER_CHUNK pour
+    pouvoir être relues en flux; le reste de l'analyse (statistiques, items
+    consolidés...) est stocké dans un bloc de métadonnées.
+
+    Returns:
+        Identifiant de l'analyse
+    """
+    ttl = ttl or get_analysis_ttl()
+    analysis_id = frappe.generate_hash(length=16)
+    cache = frappe.cache()
+
+    chunk = []
+    chunk_count = 0
+    row_count = 0
+
+    for row in rows:
+        chunk.append(row)
+        row_count += 1
+
+        if len(chunk) >= ROWS_PER_CHUNK:
+            cache.set_value(_key(analysis_id, chunk_count), _compress(chunk), expires_in_sec=ttl)
+            chunk_count += 1
+            chunk = []
+
+    if chunk:
+        cache.set_value(_key(analysis_id, chunk_count), _compress(chunk), expires_in_sec=ttl)
+        chunk_count += 1
+
+    meta = {
+        "owner": frappe.session.user,
+        "created": now(),
+        "row_count": row_count,
+        "chunk_count": chunk_count,
+        "analysis": analysis
+    }
+    cache.set_value(_key(analysis_id, "meta"), _compress(meta), expires_in_sec=ttl)
+
+    return analysis_id
+
+
+def get_analysis_meta(analysis_id):
+    """
+    Charge les métadonnées d'une analyse et vérifie qu'elle appartient à l'utilisateur
+    """
+    blob = frappe.cache().get_value(_key(analysis_id, "meta"), expires=True)
+
+    if not blob:
+        frappe.throw(_("L'analyse {0} a expiré, veuillez relancer l'analyse").format(analysis_id))
+
+    meta = _decompress(blob)
+
+    if meta["owner"] != frappe.session.user and frappe.session.user != "Administrator":
+        frappe.throw(_("Vous n'avez pas accès à cette analyse"), frappe.PermissionError)
+
+    return meta
+
+
+def iter_analysis_rows(analysis_id):
+    """
+    Relit les lignes d'une analyse bloc par bloc (un seul bloc en mémoire)
+    """
+    meta = get_analysis_meta(analysis_id)
+    cache = frappe.cache()
+
+    for chunk_no in range(meta["chunk_count"]):
+        blob = cache.get_value(_key(analysis_id, chunk_no), expires=True)
+
+        if not blob:
+            frappe.throw(_("L'analyse {0} a expiré, veuillez relancer l'analyse").format(analysis_id))
+
+        yield from _decompress(blob)
+
+
+def delete_analysis(analysis_id):
+    """
+    Supprime une analyse et tous ses blocs
+    """
+    meta = get_analysis_meta(analysis_id)
+    keys = [_key(analysis_id, chunk_no) for chunk_no in range(meta["chunk_count"])]
+    keys.append(_key(analysis_id, "meta"))
+
+    frappe.cache().delete_value(keys)
@@ -3,76 +3,186 @@
 # For license information, please see license.txt
 
 from __future__ import unicode_literals
+import json
 import frappe
 from frappe import _
+from frappe.utils import cint
+
+def get_default_boms(item_codes):
+    """
+    Récupérer le BOM actif et par défaut de chaque item en une seule requête
+    """
+    if not item_codes:
+        return {}
+    
+    bom_list = frappe.get_list("BOM",
+        filters={
+            "item": ["in", list(item_codes)],
+            "is_active": 1,
+            "is_default": 1,
+            "docstatus": 1
+        },
+        fields=["name", "item", "quantity"],
+        order_by="modified desc, name desc"
+    )
+    
+    default_boms = {}
+    for bom in bom_list:
+        # Garder le BOM modifié le plus récemment, comme l'export (iter_bom_analysis_rows)
+        default_boms.setdefault(bom.item, bom.name)
+    
+    return default_boms
+
+def get_bom_items(bom_names):
+    """
+    Récupérer les lignes de tous les BOMs en une seule requête, groupées par BOM
+    """
+    if not bom_names:
+        return {}
+    
+    bom_item_rows = frappe.get_all("BOM Item",
+        filters={
+            "parent": ["in", list(bom_names)],
+            "parenttype": "BOM"
+        },
+        fields=["parent", "item_code", "item_name", "qty", "uom", "rate"],
+        order_by="parent asc, idx asc"
+    )
+    
+    bom_items = {}
+    for bom_item in bom_item_rows:
+        bom_items.setdefault(bom_item.parent, []).append(bom_item)
+    
+    return bom_items
+
+def get_stock_by_item(item_codes):
+    """
+    Récupérer les Bins de tous les composants en une seule requête, groupés par item
+    """
+    if not item_codes:
+        return {}
+    
+    bins = frappe.get_list("Bin",
+        filters={"item_code": ["in", list(item_codes)]},
+        fields=["item_code", "warehouse", "actual_qty", "reserved_qty", "projected_qty"]
+    )
+    
+    stock_by_item = {}
+    for bin_info in bins:
+        item_code = bin_info.pop("item_code")
+        stock_by_item.setdefault(item_code, []).append(bin_info)
+    
+    return stock_by_item
+
+def get_total_available(stock_by_item):
+    """
+    Stock disponible total par item, calculé une seule fois pour tous les composants
+    """
+    return {
+        item_code: sum([bin_info.actual_qty or 0 for bin_info in stock_info])
+        for item_code, stock_info in stock_by_item.items()
+    }
+
+def build_item_bom_info(item, default_boms, bom_items, stock_by_item, available_by_item):
+    """
+    Construire les informations BOM d'une ligne de Sales Order
+    à partir des index chargés en mémoire
+    """
+    item_info = {
+        "item_code": item.item_code,
+        "item_name": item.item_name,
+        "qty": item.qty,
+        "delivery_date": item.delivery_date,
+        "has_bom": False,
+        "bom_name": None,
+        "raw_materials": []
+    }
+    
+    bom_name = default_boms.get(item.item_code)
+    if not bom_name:
+        return item_info
+    
+    item_info["has_bom"] = True
+    item_info["bom_name"] = bom_name
+    
+    # Récupérer les matières premières
+    for bom_item in bom_items.get(bom_name, []):
+        raw_material = {
+            "item_code": bom_item.item_code,
+            "item_name": bom_item.item_name,
+            "qty_per_unit": bom_item.qty,
+            "total_qty": bom_item.qty * item.qty,
+            "uom": bom_item.uom,
+            "rate": bom_item.rate or 0,
+            "amount": (bom_item.rate or 0) * (bom_item.qty * item.qty),
+            "stock_info": stock_by_item.get(bom_item.item_code, []),
+            "total_available": available_by_item.get(bom_item.item_code, 0)
+        }
+        
+        item_info["raw_materials"].append(raw_material)
+    
+    return item_info
+
+def load_bom_indexes(items):
+    """
+    Charger en bloc les BOMs par défaut, leurs lignes et le stock de tous
+    les composants pour un ensemble de lignes de Sales Order
+    """
+    default_boms = get_default_boms({item.item_code for item in items})
+    bom_items = get_bom_items(set(default_boms.values()))
+    stock_by_item = get_stock_by_item({
+        bom_item.item_code
+        for rows in bom_items.values()
+        for bom_item in rows
+    })
+    
+    return frappe._dict({
+        "default_boms": default_boms,
+        "bom_items": bom_items,
+        "stock_by_item": stock_by_item,
+        "available_by_item": get_total_available(stock_by_item)
+    })
+
+def get_sales_order_items(sales_orders):
+    """
+    Récupérer les lignes de plusieurs Sales Orders en une seule requête
+    """
+    return frappe.get_all("Sales Order Item",
+        filters={
+            "parent": ["in", list(sales_orders)],
+            "parenttype": "Sales Order"
+        },
+        fields=["parent", "item_code", "item_name", "qty", "delivery_date"],
+        order_by="parent asc, idx asc"
+    )
 
 @frappe.whitelist()
 def get_sales_order_bom_info(sales_order):
     """
-    Récupérer les informations BOM pour une Sales Order donnée
+    Récupérer les informations BOM pour une Sales Order donnée.
+    Le nombre de requêtes est fixe: BOMs par défaut, lignes de BOM
+    et Bins sont chargés en bloc pour toutes les lignes de la commande.
     """
     try:
-        # Récupérer la Sales Order
-        so_doc = frappe.get_doc("Sales Order", sales_order)
-        
-        bom_info = []
-        
-        for item in so_doc.items:
-            # Chercher le BOM actif et par défaut pour l'item
-            bom_list = frappe.get_list("BOM", 
-                filters={
-                    "item": item.item_code,
-                    "is_active": 1,
-                    "is_default": 1
-                },
-                fields=["name", "item", "quantity"]
+        so = frappe.db.get_value("Sales Order", sales_order, ["name", "customer"], as_dict=True)
+        if not so:
+            frappe.throw(_("Sales Order {0} not found").format(sales_order), frappe.DoesNotExistError)
+        
+        items = get_sales_order_items([sales_order])
+        indexes = load_bom_indexes(items)
+        
+        bom_info = [
+            build_item_bom_info(
+                item, indexes.default_boms, indexes.bom_items,
+                indexes.stock_by_item, indexes.available_by_item
             )
-            
-            item_info = {
-                "item_code": item.item_code,
-                "item_name": item.item_name,
-                "qty": item.qty,
-                "delivery_date": item.delivery_date,
-                "has_bom": False,
-                "bom_name": None,
-                "raw_materials": []
-            }
-            
-            if bom_list:
-                bom = frappe.get_doc("BOM", bom_list[0].name)
-                item_info["has_bom"] = True
-                item_info["bom_name"] = bom.name
-                
-                # Récupérer les matières premières
-                for bom_item in bom.items:
-                    # Récupérer les informations de stock
-                    stock_info = frappe.get_list("Bin",
-                        filters={"item_code": bom_item.item_code},
-                        fields=["warehouse", "actual_qty", "reserved_qty", "projected_qty"]
-                    )
-                    
-                    total_available = sum([bin_info.actual_qty or 0 for bin_info in stock_info])
-                    
-                    raw_material = {
-                        "item_code": bom_item.item_code,
-                        "item_name": bom_item.item_name,
-                        "qty_per_unit": bom_item.qty,
-                        "total_qty": bom_item.qty * item.qty,
-                        "uom": bom_item.uom,
-                        "rate": bom_item.rate or 0,
-                        "amount": (bom_item.rate or 0) * (bom_item.qty * item.qty),
-                        "stock_info": stock_info,
-                        "total_available": total_available
-                    }
-                    
-                    item_info["raw_materials"].append(raw_material)
-            
-            bom_info.append(item_info)
+            for item in items
+        ]
         
         return {
             "success": True,
             "sales_order": sales_order,
-            "customer": so_doc.customer,
+            "customer": so.customer,
             "bom_info": bom_info
         }
         
@@ -86,35 +196,62 @@ def get_sales_order_bom_info(sales_order):
 @frappe.whitelist()
 def get_multiple_sales_orders_bom_info(sales_orders):
     """
-    Récupérer les informations BOM pour plusieurs Sales Orders
+    Récupérer les informations BOM pour plusieurs Sales Orders.
+    Lignes, BOMs et stocks de toutes les commandes sont chargés une seule fois;
+    les vues par commande et le total sont construits depuis ces index partagés.
     """
     try:
         if isinstance(sales_orders, str):
-            import json
             sales_orders = json.loads(sales_orders)
         
+        customers = dict(frappe.get_all("Sales Order",
+            filters={"name": ["in", sales_orders]},
+            fields=["name", "customer"],
+            as_list=True
+        ))
+        
+        items_by_order = {}
+        for item in get_sales_order_items(customers):
+            items_by_order.setdefault(item.parent, []).append(item)
+        
+        indexes = load_bom_indexes([item for items in items_by_order.values() for item in items])
+        
         all_bom_info = []
         total_raw_materials = {}
         
+        # Conserver l'ordre de sélection, en ignorant les commandes introuvables
         for so_name in sales_orders:
-            so_info = get_sales_order_bom_info(so_name)
-            if so_info["success"]:
-                all_bom_info.append(so_info)
-                
-                # Accumuler les matières premières
-                for item in so_info["bom_info"]:
-                    if item["has_bom"]:
-                        for material in item["raw_materials"]:
-                            item_code = material["item_code"]
-                            if item_code not in total_raw_materials:
-                                total_raw_materials[item_code] = {
-                                    "item_name": material["item_name"],
-                                    "total_needed": 0,
-                                    "total_available": material["total_available"],
-                                    "uom": material["uom"],
-                                    "stock_info": material["stock_info"]
-                                }
-                            total_raw_materials[item_code]["total_needed"] += material["total_qty"]
+            if so_name not in customers:
+                continue
+            
+            bom_info = [
+                build_item_bom_info(
+                    item, indexes.default_boms, indexes.bom_items,
+                    indexes.stock_by_item, indexes.available_by_item
+                )
+                for item in items_by_order.get(so_name, [])
+            ]
+            
+            all_bom_info.append({
+                "success": True,
+                "sales_order": so_name,
+                "customer": customers[so_name],
+                "bom_info": bom_info
+            })
+            
+            # Accumuler les matières premières
+            for item in bom_info:
+                for material in item["raw_materials"]:
+                    item_code = material["item_code"]
+                    if item_code not in total_raw_materials:
+                        total_raw_materials[item_code] = {
+                            "item_name": material["item_name"],
+                            "total_needed": 0,
+                            "total_available": indexes.available_by_item.get(item_code, 0),
+                            "uom": material["uom"],
+                            "stock_info": indexes.stock_by_item.get(item_code, [])
+                        }
+                    total_raw_materials[item_code]["total_needed"] += material["total_qty"]
         
         return {
             "success": True,
@@ -130,32 +267,230 @@ def get_multiple_sales_orders_bom_info(sales_orders):
             "error": str(e)
         }
 
+# Nombre maximum d'items par appel de get_items_stock_levels
+MAX_STOCK_LEVEL_ITEMS = 5000
+
+def load_items_stock_levels(item_codes, warehouses=None):
+    """
+    Niveaux de stock par item et par entrepôt en une seule requête (Bin joint à Item).
+    Les entrepôts groupes de `warehouses` incluent tous leurs entrepôts enfants.
+    Seuls les entrepôts lisibles par l'utilisateur (permissions utilisateur
+    comprises, comme avec frappe.get_list("Bin")) sont retournés.
+    """
+    permitted_warehouses = frappe.get_list("Warehouse", pluck="name", limit_page_length=0)
+    
+    values = {"item_codes": item_codes, "permitted_warehouses": permitted_warehouses}
+    conditions = "AND bin.warehouse IN %(permitted_warehouses)s" if permitted_warehouses else "AND 1 = 0"
+    
+    if warehouses:
+        conditions += """
+            AND bin.warehouse IN (
+                SELECT child.name
+                FROM `tabWarehouse` child
+                JOIN `tabWarehouse` scope ON child.lft >= scope.lft AND child.rgt <= scope.rgt
+                WHERE scope.name IN %(warehouses)s
+            )
+        """
+        values["warehouses"] = warehouses
+    
+    rows = frappe.db.sql(f"""
+        SELECT
+            item.name as item_code,
+            item.item_name,
+            item.stock_uom,
+            bin.warehouse,
+            bin.actual_qty,
+            bin.reserved_qty,
+            bin.projected_qty,
+            bin.planned_qty
+        FROM `tabItem` item
+        LEFT JOIN `tabBin` bin ON bin.item_code = item.name {conditions}
+        WHERE item.name IN %(item_codes)s
+        ORDER BY item.name, bin.warehouse
+    """, values, as_dict=True)
+    
+    levels = {}
+    for row in rows:
+        if row.item_code not in levels:
+            levels[row.item_code] = {
+                "item_code": row.item_code,
+                "item_name": row.item_name,
+                "stock_uom": row.stock_uom,
+                "stock_info": [],
+                "total_available": 0
+            }
+        
+        if row.warehouse:
+            item_levels = levels[row.item_code]
+            item_levels["stock_info"].append({
+                "warehouse": row.warehouse,
+                "actual_qty": row.actual_qty,
+                "reserved_qty": row.reserved_qty,
+                "projected_qty": row.projected_qty,
+                "planned_qty": row.planned_qty
+            })
+            item_levels["total_available"] += row.actual_qty or 0
+    
+    return levels
+
 @frappe.whitelist()
-def get_item_stock_levels(item_code):
+def get_items_stock_levels(item_codes, warehouses=None):
     """
-    Récupérer les niveaux de stock pour un item donné
+    Récupérer les niveaux de stock de plusieurs items (jusqu'à 5000 par appel),
+    éventuellement limités à une liste d'entrepôts ou de groupes d'entrepôts
     """
     try:
-        stock_info = frappe.get_list("Bin",
-            filters={"item_code": item_code},
-            fields=["warehouse", "actual_qty", "reserved_qty", "projected_qty", "planned_qty"]
-        )
+        if isinstance(item_codes, str):
+            item_codes = json.loads(item_codes)
+        if isinstance(warehouses, str):
+            warehouses = json.loads(warehouses) if warehouses.startswith("[") else [warehouses]
+        
+        item_codes = list(dict.fromkeys(item_codes or []))
+        
+        if len(item_codes) > MAX_STOCK_LEVEL_ITEMS:
+            frappe.throw(_("Maximum {0} items par appel").format(MAX_STOCK_LEVEL_ITEMS))
         
-        # Récupérer aussi les informations de l'item
-        item_info = frappe.get_doc("Item", item_code)
+        frappe.has_permission("Bin", "read", throw=True)
+        
+        levels = load_items_stock_levels(item_codes, warehouses) if item_codes else {}
         
         return {
             "success": True,
-            "item_code": item_code,
-            "item_name": item_info.item_name,
-            "stock_uom": item_info.stock_uom,
-            "stock_info": stock_info,
-            "total_available": sum([bin_info.actual_qty or 0 for bin_info in stock_info])
+            "items": levels,
+            "missing_items": [item_code for item_code in item_codes if item_code not in levels]
         }
         
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Erreur get_items_stock_levels")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+@frappe.whitelist()
+def get_item_stock_levels(item_code):
+    """
+    Récupérer les niveaux de stock pour un item donné
+    """
+    try:
+        frappe.has_permission("Bin", "read", throw=True)
+        
+        levels = load_items_stock_levels([item_code]).get(item_code)
+        
+        if not levels:
+            frappe.throw(_("Item {0} not found").format(item_code), frappe.DoesNotExistError)
+        
+        levels["success"] = True
+        return levels
+        
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Erreur get_item_stock_levels")
         return {
             "success": False,
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+def iter_bom_analysis_rows(sales_orders):
+    """
+    Générateur des lignes de l'analyse BOM (une ligne par matière première
+    et par article de Sales Order), lu en flux avec un curseur non bufferisé
+    """
+    query = """
+        SELECT
+            so.name as sales_order,
+            so.customer,
+            soi.item_code,
+            soi.item_name,
+            soi.qty,
+            soi.delivery_date,
+            bom.name as bom_name,
+            bi.item_code as raw_material,
+            bi.item_name as raw_material_name,
+            bi.qty as qty_per_unit,
+            bi.qty * soi.qty as total_qty,
+            bi.uom,
+            COALESCE(bi.rate, 0) as rate,
+            COALESCE(bi.rate, 0) * bi.qty * soi.qty as amount,
+            COALESCE(stock.total_available, 0) as total_available
+        FROM `tabSales Order Item` soi
+        JOIN `tabSales Order` so ON so.name = soi.parent
+        LEFT JOIN `tabBOM` bom ON bom.name = (
+            SELECT d.name FROM `tabBOM` d
+            WHERE d.item = soi.item_code
+                AND d.is_active = 1
+                AND d.is_default = 1
+                AND d.docstatus = 1
+            ORDER BY d.modified DESC, d.name DESC
+            LIMIT 1
+        )
+        LEFT JOIN `tabBOM Item` bi ON bi.parent = bom.name AND bi.parenttype = 'BOM'
+        LEFT JOIN (
+            SELECT item_code, SUM(actual_qty) as total_available
+            FROM `tabBin`
+            GROUP BY item_code
+        ) stock ON stock.item_code = bi.item_code
+        WHERE soi.parent IN %(sales_orders)s
+        ORDER BY so.name, soi.idx, bi.idx
+    """
+    
+    with frappe.db.unbuffered_cursor():
+        for row in frappe.db.sql(query, {"sales_orders": sales_orders}, as_dict=True, as_iterator=True):
+            yield row
+
+@frappe.whitelist()
+def export_bom_analysis(sales_orders=None, analysis="bom", file_format=None, filename=None, to_file=0,
+        analysis_id=None, visible_columns=None):
+    """
+    Exporter l'analyse BOM ou l'analyse des besoins en CSV / XLSX.
+    Les lignes sont produites par un générateur et écrites une à une,
+    soit dans la réponse HTTP, soit dans un fichier privé (to_file=1).
+    Avec analysis_id, l'analyse des besoins déjà calculée est relue
+    depuis le stockage serveur avec les colonnes choisies.
+    """
+    from custom_nedlog.analysis_export import (
+        BOM_ANALYSIS_COLUMNS,
+        REQUIREMENTS_COLUMNS,
+        build_export_response,
+        get_export_filename,
+        get_export_format,
+        get_requirement_table_columns,
+        iter_requirement_table_rows,
+        save_export_file
+    )
+    from custom_nedlog.analysis_store import iter_analysis_rows
+    from custom_nedlog.production_analysis import iter_stock_requirements_for_orders
+    
+    if isinstance(sales_orders, str):
+        sales_orders = json.loads(sales_orders)
+    if isinstance(visible_columns, str):
+        visible_columns = json.loads(visible_columns)
+    
+    if not sales_orders and not analysis_id:
+        frappe.throw(_("Veuillez sélectionner au moins une Sales Order"))
+    
+    frappe.has_permission("Sales Order", "read", throw=True)
+    
+    file_format = get_export_format(file_format, filename)
+    
+    if analysis_id:
+        rows = iter_requirement_table_rows(iter_analysis_rows(analysis_id), visible_columns)
+        columns = [(label, label) for col_key, label in get_requirement_table_columns(visible_columns)]
+        filename = get_export_filename("besoins_matieres_premieres", file_format, filename)
+    elif analysis == "requirements":
+        rows = iter_stock_requirements_for_orders(sales_orders)
+        columns = REQUIREMENTS_COLUMNS
+        filename = get_export_filename("besoins_matieres_premieres", file_format, filename)
+    else:
+        rows = iter_bom_analysis_rows(sales_orders)
+        columns = BOM_ANALYSIS_COLUMNS
+        filename = get_export_filename("BOM_Analysis", file_format, filename)
+    
+    if cint(to_file):
+        file_doc = save_export_file(rows, columns, file_format, filename)
+        return {
+            "success": True,
+            "file_url": file_doc.file_url,
+            "file_name": file_doc.file_name
+        }
+    
+    return build_export_response(rows, columns, file_format, filename)
@@ -0,0 +1,69 @@
+# Copyright (c) 2026, achref louati and contributors
+# For license information, please see license.txt
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("reconcile-warehouse-counters")
+@click.option("--warehouse", multiple=True, help="Warehouse to check (repeatable, all warehouses by default)")
+@click.option("--fix", is_flag=True, default=False, help="Reset drifted counters from the Bin totals")
+@pass_context
+def reconcile_warehouse_counters(context, warehouse=None, fix=False):
+	"""Compare warehouse stock counters with Bin totals and report drift"""
+	import frappe
+
+	from custom_nedlog.warehouse_control.counter import reconcile_warehouse_counters as reconcile
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+
+	try:
+		drift = reconcile(warehouses=warehouse or None, fix=fix)
+
+		for row in drift:
+			click.echo(
+				f"{row.warehouse}: counter qty={row.counter_qty} items={row.counter_item_count}, "
+				f"bin qty={row.bin_qty} items={row.bin_item_count}"
+			)
+
+		if not drift:
+			click.secho("No drift found", fg="green")
+		elif fix:
+			click.secho(f"{len(drift)} counter(s) reset", fg="yellow")
+		else:
+			click.secho(f"{len(drift)} counter(s) drifted, run with --fix to reset them", fg="red")
+			raise SystemExit(1)
+	finally:
+		frappe.destroy()
+
+
+@click.command("replay-warehouse-history")
+@click.option("--chunk-size", type=int, default=10000, help="Stock ledger rows read per chunk")
+@click.option("--restart", is_flag=True, default=False, help="Ignore the checkpoint and replay from the first posting")
+@pass_context
+def replay_warehouse_history(context, chunk_size=10000, restart=False):
+	"""Rebuild warehouse assignments and the Warehouse Control Log from the stock ledger"""
+	import frappe
+
+	from custom_nedlog.warehouse_control.replay import replay_warehouse_history as replay
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+
+	try:
+		result = replay(
+			chunk_size=chunk_size,
+			restart=restart,
+			progress=lambda checkpoint: click.echo(
+				f"{checkpoint['rows']} rows replayed, {checkpoint['events']} events, at {checkpoint['position'][0]}"
+			)
+		)
+		click.secho(f"Replay complete: {result['rows']} rows, {result['events']} events", fg="green")
+	finally:
+		frappe.destroy()
+
+
+commands = [reconcile_warehouse_counters, replay_warehouse_history]
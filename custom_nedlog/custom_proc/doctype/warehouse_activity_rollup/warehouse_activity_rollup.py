@@ -0,0 +1,13 @@
+# Copyright (c) 2026, achref louati and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WarehouseActivityRollup(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Warehouse Activity Rollup", ["warehouse", "rollup_date"])
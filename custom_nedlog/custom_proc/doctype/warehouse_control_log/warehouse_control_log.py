@@ -1,9 +1,13 @@
 # Copyright (c) 2026, achref louati and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class WarehouseControlLog(Document):
 	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Warehouse Control Log", ["warehouse", "timestamp"])
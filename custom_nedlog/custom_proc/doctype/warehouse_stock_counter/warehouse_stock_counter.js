@@ -0,0 +1,8 @@
+// Copyright (c) 2026, achref louati and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Warehouse Stock Counter", {
+// 	refresh(frm) {
+
+// 	},
+// });
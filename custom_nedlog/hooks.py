@@ -66,13 +66,16 @@ doctype_list_js = {"Sales Order" : "public/js/sales_order_list.js"}
 
 doc_events = {
 	"Purchase Receipt": {
+		"before_submit": "custom_nedlog.warehouse_control.validation.enforce_strict_control",
 		"on_submit": "custom_nedlog.warehouse_control.validation.handle_incoming_transaction"
 	},
 	"Stock Entry": {
+		"before_submit": "custom_nedlog.warehouse_control.validation.enforce_strict_control",
 		"on_submit": "custom_nedlog.warehouse_control.validation.handle_incoming_transaction",
-		"on_update_after_submit": "custom_nedlog.warehouse_control.validation.handle_outgoing_transaction"
+		"on_update_after_submit": "custom_nedlog.warehouse_control.validation.handle_stock_entry_update_after_submit"
 	},
 	"Material Request": {
+		"before_submit": "custom_nedlog.warehouse_control.validation.enforce_strict_control",
 		"on_submit": "custom_nedlog.warehouse_control.validation.handle_incoming_transaction"
 	},
 	"Delivery Note": {
@@ -80,6 +83,13 @@ doc_events = {
 	},
 	"Work Order": {
 		"on_submit": "custom_nedlog.warehouse_control.validation.handle_outgoing_transaction"
+	},
+	"Stock Ledger Entry": {
+		"on_submit": "custom_nedlog.warehouse_control.counter.update_warehouse_counter"
+	},
+	"Warehouse": {
+		"on_update": "custom_nedlog.warehouse_control.cache.on_warehouse_update",
+		"on_trash": "custom_nedlog.warehouse_control.cache.on_warehouse_update"
 	}
 }
 # Generators
@@ -184,6 +194,20 @@ doc_events = {
 # 	],
 # }
 
+scheduler_events = {
+	"cron": {
+		"*/15 * * * *": [
+			"custom_nedlog.warehouse_control.reporting.refresh_warehouse_customer_status_snapshot"
+		]
+	},
+	"daily": [
+		"custom_nedlog.warehouse_control.rollup.rollup_warehouse_activity",
+		"custom_nedlog.warehouse_control.retention.archive_warehouse_control_logs",
+		"custom_nedlog.warehouse_control.counter.reconcile_all_warehouse_counters",
+		"custom_nedlog.warehouse_control.reconciliation.reconcile_warehouse_states"
+	]
+}
+
 # Testing
 # -------
 
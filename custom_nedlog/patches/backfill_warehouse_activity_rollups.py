@@ -0,0 +1,5 @@
+from custom_nedlog.warehouse_control.rollup import backfill_warehouse_activity_rollups
+
+def execute():
+    # Roll up the full history before the daily archiver moves old log rows out
+    backfill_warehouse_activity_rollups()
@@ -0,0 +1,37 @@
+import frappe
+from custom_nedlog.warehouse_control.counter import ensure_counter, reconcile_warehouse_counters
+
+def execute():
+    # Create the counters of warehouses that had stock or postings before they were maintained,
+    # including warehouses with ledger entries but no Bin row
+    missing = frappe.db.sql_list("""
+        SELECT w.name
+        FROM `tabWarehouse` w
+        WHERE w.is_group = 0
+        AND NOT EXISTS (SELECT 1 FROM `tabWarehouse Stock Counter` c WHERE c.name = w.name)
+        AND (
+            EXISTS (SELECT 1 FROM `tabBin` b WHERE b.warehouse = w.name)
+            OR EXISTS (
+                SELECT 1 FROM `tabStock Ledger Entry` sle
+                WHERE sle.warehouse = w.name AND sle.is_cancelled = 0 AND sle.docstatus = 1
+            )
+        )
+    """)
+    for warehouse in missing:
+        ensure_counter(warehouse)
+
+    reconcile_warehouse_counters(fix=True)
+
+    # Drift fixes only touch drifted counters: set the last movement date of every counter
+    frappe.db.sql("""
+        UPDATE `tabWarehouse Stock Counter` c
+        JOIN (
+            SELECT warehouse, MAX(posting_date) as last_movement_date
+            FROM `tabStock Ledger Entry`
+            WHERE is_cancelled = 0
+            AND docstatus = 1
+            GROUP BY warehouse
+        ) sle ON sle.warehouse = c.name
+        SET c.last_movement_date = sle.last_movement_date
+    """)
+    frappe.db.commit()
@@ -243,221 +243,332 @@ def calculate_stock_requirements(consolidated_data):
         
         # Récupérer tous les item codes uniques
         item_codes = list(set([rm['item_code'] for rm in raw_materials_by_order]))
+        lookups = get_stock_requirement_lookups(item_codes)
         
-        # Récupérer les stocks disponibles
-        stock_data = frappe.db.sql("""
-            SELECT 
-                item_code,
-                warehouse,
-                actual_qty,
-                projected_qty,
-                reserved_qty,
-                ordered_qty,
-                planned_qty
-            FROM `tabBin`
-            WHERE item_code IN %(item_codes)s
-            AND actual_qty != 0
-        """, {'item_codes': item_codes}, as_dict=True)
+        # Détails puis totaux, dans l'ordre produit par le générateur
+        final_requirements = list(iter_stock_requirements(raw_materials_by_order, lookups))
         
-        # Organiser les stocks par item
-        stock_by_item = defaultdict(lambda: {
-            'actual_qty': 0,
-            'projected_qty': 0,
-            'reserved_qty': 0,
-            'warehouses': [],
-            'warehouses_with_stock': [],
-            'total_warehouses': 0
+        result = {
+            'consolidated_items': consolidated_data.get('consolidated_items', []),
+            'raw_materials_requirements': final_requirements,
+            'stats': get_analysis_stats_detailed(consolidated_data, final_requirements)
+        }
+        
+        # Conserver l'analyse côté serveur: PDF, email et export ne renvoient que son identifiant
+        result['analysis_id'] = store_requirements_analysis(result)
+        
+        return result
+        
+    except Exception as e:
+        frappe.log_error(f"Erreur calculate_stock_requirements: {str(e)}")
+        frappe.throw(_("Erreur lors du calcul des stocks: {0}").format(str(e)))
+
+
+def store_requirements_analysis(result):
+    """
+    Enregistre l'analyse des besoins dans le stockage serveur (ordre d'affichage)
+    """
+    from custom_nedlog.analysis_export import order_requirements_for_display
+    from custom_nedlog.analysis_store import save_analysis
+    
+    try:
+        return save_analysis(
+            {
+                'consolidated_items': result['consolidated_items'],
+                'stats': result['stats']
+            },
+            order_requirements_for_display(result['raw_materials_requirements'])
+        )
+    except Exception as e:
+        # Le navigateur renverra alors le tableau complet comme auparavant
+        frappe.log_error(f"Erreur enregistrement analyse: {str(e)}")
+        return None
+
+
+def get_stock_requirement_lookups(item_codes):
+    """
+    Charge en une fois les stocks, fournisseurs et infos articles des matières premières
+    """
+    # Récupérer les stocks disponibles
+    stock_data = frappe.db.sql("""
+        SELECT 
+            item_code,
+            warehouse,
+            actual_qty,
+            projected_qty,
+            reserved_qty,
+            ordered_qty,
+            planned_qty
+        FROM `tabBin`
+        WHERE item_code IN %(item_codes)s
+        AND actual_qty != 0
+    """, {'item_codes': item_codes}, as_dict=True)
+    
+    # Organiser les stocks par item
+    stock_by_item = defaultdict(lambda: {
+        'actual_qty': 0,
+        'projected_qty': 0,
+        'reserved_qty': 0,
+        'warehouses': [],
+        'warehouses_with_stock': [],
+        'total_warehouses': 0
+    })
+    
+    for stock in stock_data:
+        item_code = stock['item_code']
+        stock_by_item[item_code]['actual_qty'] += flt(stock['actual_qty'])
+        stock_by_item[item_code]['projected_qty'] += flt(stock['projected_qty'])
+        stock_by_item[item_code]['reserved_qty'] += flt(stock['reserved_qty'])
+        
+        # Toujours ajouter le warehouse pour avoir la liste complète
+        stock_by_item[item_code]['warehouses'].append({
+            'warehouse': stock['warehouse'],
+            'actual_qty': stock['actual_qty'],
+            'projected_qty': stock['projected_qty'],
+            'reserved_qty': stock['reserved_qty']
         })
         
-        for stock in stock_data:
-            item_code = stock['item_code']
-            stock_by_item[item_code]['actual_qty'] += flt(stock['actual_qty'])
-            stock_by_item[item_code]['projected_qty'] += flt(stock['projected_qty'])
-            stock_by_item[item_code]['reserved_qty'] += flt(stock['reserved_qty'])
-            
-            # Toujours ajouter le warehouse pour avoir la liste complète
-            stock_by_item[item_code]['warehouses'].append({
+        # Ajouter seulement les warehouses avec stock positif
+        if flt(stock['actual_qty']) > 0:
+            stock_by_item[item_code]['warehouses_with_stock'].append({
                 'warehouse': stock['warehouse'],
                 'actual_qty': stock['actual_qty'],
                 'projected_qty': stock['projected_qty'],
                 'reserved_qty': stock['reserved_qty']
             })
-            
-            # Ajouter seulement les warehouses avec stock positif
-            if flt(stock['actual_qty']) > 0:
-                stock_by_item[item_code]['warehouses_with_stock'].append({
-                    'warehouse': stock['warehouse'],
-                    'actual_qty': stock['actual_qty'],
-                    'projected_qty': stock['projected_qty'],
-                    'reserved_qty': stock['reserved_qty']
-                })
-            
-            stock_by_item[item_code]['total_warehouses'] = len(stock_by_item[item_code]['warehouses'])
         
-        # Récupérer les informations fournisseurs
-        try:
-            supplier_data = frappe.db.sql("""
-                SELECT 
-                    parent as item_code,
-                    supplier
-                FROM `tabItem Supplier`
-                WHERE parent IN %(item_codes)s
-            """, {'item_codes': item_codes}, as_dict=True)
-        except Exception:
-            supplier_data = []
-        
-        # Récupérer les informations supplémentaires des items
-        try:
-            item_extra_data = frappe.db.sql("""
-                SELECT 
-                    name as item_code,
-                    item_group,
-                    brand,
-                    weight_per_unit,
-                    weight_uom
-                FROM `tabItem`
-                WHERE name IN %(item_codes)s
-            """, {'item_codes': item_codes}, as_dict=True)
-        except Exception:
-            item_extra_data = []
-        
-        # Récupérer les informations customer provided items
-        try:
-            client_data = frappe.get_all(
-                "Item",
-                filters={
-                    "name": ["in", item_codes],
-                    "is_customer_provided_item": 1,
-                    "customer": ["is", "set"]
-                },
-                fields=["name as item_code", "customer as client_code", "is_customer_provided_item"]
-            )
-        except Exception as e:
-            frappe.log_error(f"Erreur lors de la récupération des customer provided items: {str(e)}")
-            client_data = []
-        
-        supplier_by_item = {s['item_code']: s for s in supplier_data}
-        item_extra_by_item = {i['item_code']: i for i in item_extra_data}
-        client_by_item = {c['item_code']: c for c in client_data}
-        
-        # Enrichir les données client avec les noms
-        for item_code, client_info in client_by_item.items():
-            if client_info.get('client_code'):
-                try:
-                    customer_name = frappe.db.get_value("Customer", client_info['client_code'], "customer_name")
-                    client_info['client_name'] = customer_name or client_info['client_code']
-                except Exception:
-                    client_info['client_name'] = client_info['client_code']
-        
-        # Enrichir les données fournisseur avec les noms
-        for item_code, supplier_info in supplier_by_item.items():
-            if supplier_info.get('supplier'):
-                try:
-                    supplier_name = frappe.db.get_value("Supplier", supplier_info['supplier'], "supplier_name")
-                    supplier_info['supplier_name'] = supplier_name or supplier_info['supplier']
-                except Exception:
-                    supplier_info['supplier_name'] = supplier_info['supplier']
-        
-        # Préparer les résultats détaillés par order + totaux
-        detailed_requirements = []
-        totals_by_item = {}
-        
-        # Traiter chaque ligne de matière première
-        for material in raw_materials_by_order:
-            item_code = material['item_code']
-            required_qty = flt(material['required_qty'])
-            
-            supplier_info = supplier_by_item.get(item_code, {})
-            client_info = client_by_item.get(item_code, {})
-            stock_info = stock_by_item.get(item_code, {})
-            item_extra_info = item_extra_by_item.get(item_code, {})
-            
-            # Déterminer si c'est un customer provided item
-            is_customer_provided = client_info.get('is_customer_provided_item', False)
-            
-            # Pour l'affichage: si c'est un customer provided item, utiliser le client comme "fournisseur"
-            display_supplier_name = client_info.get('client_name') if is_customer_provided else supplier_info.get('supplier_name')
-            display_supplier_code = client_info.get('client_code') if is_customer_provided else supplier_info.get('supplier')
-            
-            # Ajouter la ligne détaillée
-            detail_row = {
-                'type': 'detail',  # Identifier comme ligne de détail
+        stock_by_item[item_code]['total_warehouses'] = len(stock_by_item[item_code]['warehouses'])
+    
+    # Récupérer les informations fournisseurs
+    try:
+        supplier_data = frappe.db.sql("""
+            SELECT 
+                parent as item_code,
+                supplier
+            FROM `tabItem Supplier`
+            WHERE parent IN %(item_codes)s
+        """, {'item_codes': item_codes}, as_dict=True)
+    except Exception:
+        supplier_data = []
+    
+    # Récupérer les informations supplémentaires des items
+    try:
+        item_extra_data = frappe.db.sql("""
+            SELECT 
+                name as item_code,
+                item_group,
+                brand,
+                weight_per_unit,
+                weight_uom
+            FROM `tabItem`
+            WHERE name IN %(item_codes)s
+        """, {'item_codes': item_codes}, as_dict=True)
+    except Exception:
+        item_extra_data = []
+    
+    # Récupérer les informations customer provided items
+    try:
+        client_data = frappe.get_all(
+            "Item",
+            filters={
+                "name": ["in", item_codes],
+                "is_customer_provided_item": 1,
+                "customer": ["is", "set"]
+            },
+            fields=["name as item_code", "customer as client_code", "is_customer_provided_item"]
+        )
+    except Exception as e:
+        frappe.log_error(f"Erreur lors de la récupération des customer provided items: {str(e)}")
+        client_data = []
+    
+    supplier_by_item = {s['item_code']: s for s in supplier_data}
+    item_extra_by_item = {i['item_code']: i for i in item_extra_data}
+    client_by_item = {c['item_code']: c for c in client_data}
+    
+    # Enrichir les données client avec les noms
+    for item_code, client_info in client_by_item.items():
+        if client_info.get('client_code'):
+            try:
+                customer_name = frappe.db.get_value("Customer", client_info['client_code'], "customer_name")
+                client_info['client_name'] = customer_name or client_info['client_code']
+            except Exception:
+                client_info['client_name'] = client_info['client_code']
+    
+    # Enrichir les données fournisseur avec les noms
+    for item_code, supplier_info in supplier_by_item.items():
+        if supplier_info.get('supplier'):
+            try:
+                supplier_name = frappe.db.get_value("Supplier", supplier_info['supplier'], "supplier_name")
+                supplier_info['supplier_name'] = supplier_name or supplier_info['supplier']
+            except Exception:
+                supplier_info['supplier_name'] = supplier_info['supplier']
+
+    return {
+        'stock_by_item': stock_by_item,
+        'supplier_by_item': supplier_by_item,
+        'item_extra_by_item': item_extra_by_item,
+        'client_by_item': client_by_item
+    }
+
+
+def iter_stock_requirements(raw_materials, lookups):
+    """
+    Générateur des lignes de besoins: une ligne 'detail' par matière et par order,
+    puis une ligne 'total' par article une fois toutes les lignes consommées.
+    Seuls les totaux (un par article) sont gardés en mémoire.
+    """
+    totals_by_item = {}
+    
+    # Traiter chaque ligne de matière première
+    for material in raw_materials:
+        item_code = material['item_code']
+        required_qty = flt(material['required_qty'])
+        
+        supplier_info = lookups['supplier_by_item'].get(item_code, {})
+        client_info = lookups['client_by_item'].get(item_code, {})
+        stock_info = lookups['stock_by_item'].get(item_code, {})
+        item_extra_info = lookups['item_extra_by_item'].get(item_code, {})
+        
+        # Déterminer si c'est un customer provided item
+        is_customer_provided = client_info.get('is_customer_provided_item', False)
+        
+        # Pour l'affichage: si c'est un customer provided item, utiliser le client comme "fournisseur"
+        display_supplier_name = client_info.get('client_name') if is_customer_provided else supplier_info.get('supplier_name')
+        display_supplier_code = client_info.get('client_code') if is_customer_provided else supplier_info.get('supplier')
+        
+        # Ajouter la ligne détaillée
+        detail_row = {
+            'type': 'detail',  # Identifier comme ligne de détail
+            'item_code': item_code,
+            'item_name': material['item_name'],
+            'stock_uom': material['stock_uom'],
+            'required_qty': required_qty,
+            'sales_order': material['sales_order'],
+            'customer_po_no': material['customer_po_no'],
+            'customer': material['customer'],
+            'default_supplier': display_supplier_code,
+            'supplier_name': display_supplier_name,
+            'is_customer_provided_item': is_customer_provided,
+            'customer_provided_client': client_info.get('client_code'),
+            'customer_provided_client_name': client_info.get('client_name'),
+            'actual_qty': stock_info.get('actual_qty', 0),
+            'projected_qty': stock_info.get('projected_qty', 0),
+            'warehouses': stock_info.get('warehouses', []),
+            # Informations supplémentaires des items
+            'item_group': item_extra_info.get('item_group', ''),
+            'brand': item_extra_info.get('brand', ''),
+            'weight_per_unit': item_extra_info.get('weight_per_unit', ''),
+            'weight_uom': item_extra_info.get('weight_uom', ''),
+            # Informations des warehouses pour les détails
+            'warehouses': [],  # Pas de warehouses pour les détails
+            'warehouses_with_stock': [],
+            'total_warehouses': 0
+        }
+        
+        yield detail_row
+        
+        # Accumuler pour les totaux
+        if item_code not in totals_by_item:
+            totals_by_item[item_code] = {
+                'type': 'total',  # Identifier comme ligne de total
                 'item_code': item_code,
                 'item_name': material['item_name'],
                 'stock_uom': material['stock_uom'],
-                'required_qty': required_qty,
-                'sales_order': material['sales_order'],
-                'customer_po_no': material['customer_po_no'],
-                'customer': material['customer'],
+                'total_required_qty': 0,
+                'available_qty': stock_info.get('projected_qty', 0),
+                'shortage_qty': 0,
                 'default_supplier': display_supplier_code,
                 'supplier_name': display_supplier_name,
                 'is_customer_provided_item': is_customer_provided,
                 'customer_provided_client': client_info.get('client_code'),
                 'customer_provided_client_name': client_info.get('client_name'),
                 'actual_qty': stock_info.get('actual_qty', 0),
-                'projected_qty': stock_info.get('projected_qty', 0),
                 'warehouses': stock_info.get('warehouses', []),
+                'warehouses_with_stock': stock_info.get('warehouses_with_stock', []),
+                'total_warehouses': stock_info.get('total_warehouses', 0),
+                'orders_count': 0,
                 # Informations supplémentaires des items
                 'item_group': item_extra_info.get('item_group', ''),
                 'brand': item_extra_info.get('brand', ''),
                 'weight_per_unit': item_extra_info.get('weight_per_unit', ''),
-                'weight_uom': item_extra_info.get('weight_uom', ''),
-                # Informations des warehouses pour les détails
-                'warehouses': [],  # Pas de warehouses pour les détails
-                'warehouses_with_stock': [],
-                'total_warehouses': 0
+                'weight_uom': item_extra_info.get('weight_uom', '')
             }
-            
-            detailed_requirements.append(detail_row)
-            
-            # Accumuler pour les totaux
-            if item_code not in totals_by_item:
-                totals_by_item[item_code] = {
-                    'type': 'total',  # Identifier comme ligne de total
-                    'item_code': item_code,
-                    'item_name': material['item_name'],
-                    'stock_uom': material['stock_uom'],
-                    'total_required_qty': 0,
-                    'available_qty': stock_info.get('projected_qty', 0),
-                    'shortage_qty': 0,
-                    'default_supplier': display_supplier_code,
-                    'supplier_name': display_supplier_name,
-                    'is_customer_provided_item': is_customer_provided,
-                    'customer_provided_client': client_info.get('client_code'),
-                    'customer_provided_client_name': client_info.get('client_name'),
-                    'actual_qty': stock_info.get('actual_qty', 0),
-                    'warehouses': stock_info.get('warehouses', []),
-                    'warehouses_with_stock': stock_info.get('warehouses_with_stock', []),
-                    'total_warehouses': stock_info.get('total_warehouses', 0),
-                    'orders_count': 0,
-                    # Informations supplémentaires des items
-                    'item_group': item_extra_info.get('item_group', ''),
-                    'brand': item_extra_info.get('brand', ''),
-                    'weight_per_unit': item_extra_info.get('weight_per_unit', ''),
-                    'weight_uom': item_extra_info.get('weight_uom', '')
-                }
-            
-            totals_by_item[item_code]['total_required_qty'] += required_qty
-            totals_by_item[item_code]['orders_count'] += 1
-        
-        # Calculer les shortages pour les totaux
-        for item_code, total_data in totals_by_item.items():
-            shortage = max(0, total_data['total_required_qty'] - total_data['available_qty'])
-            total_data['shortage_qty'] = shortage
-            total_data['has_shortage'] = shortage > 0
-        
-        # Combiner détails et totaux
-        final_requirements = detailed_requirements + list(totals_by_item.values())
         
-        return {
-            'consolidated_items': consolidated_data.get('consolidated_items', []),
-            'raw_materials_requirements': final_requirements,
-            'stats': get_analysis_stats_detailed(consolidated_data, final_requirements)
-        }
-        
-    except Exception as e:
-        frappe.log_error(f"Erreur calculate_stock_requirements: {str(e)}")
-        frappe.throw(_("Erreur lors du calcul des stocks: {0}").format(str(e)))
+        totals_by_item[item_code]['total_required_qty'] += required_qty
+        totals_by_item[item_code]['orders_count'] += 1
+    
+    # Calculer les shortages pour les totaux
+    for item_code, total_data in totals_by_item.items():
+        shortage = max(0, total_data['total_required_qty'] - total_data['available_qty'])
+        total_data['shortage_qty'] = shortage
+        total_data['has_shortage'] = shortage > 0
+        yield total_data
+
+
+# Jointure commune aux analyses calculées côté serveur à partir des Sales Orders
+RAW_MATERIALS_BY_ORDER_FROM = """
+    FROM `tabSales Order Item` soi
+    JOIN `tabSales Order` so ON so.name = soi.parent
+    JOIN `tabBOM` bom ON bom.name = COALESCE(NULLIF(soi.bom_no, ''), (
+        SELECT d.name FROM `tabBOM` d
+        WHERE d.item = soi.item_code
+            AND d.is_active = 1
+            AND d.is_default = 1
+            AND d.docstatus = 1
+        ORDER BY d.modified DESC, d.name DESC
+        LIMIT 1
+    ))
+    JOIN `tabBOM Item` bi ON bi.parent = bom.name AND bi.parenttype = 'BOM'
+    LEFT JOIN `tabItem` rm ON rm.name = bi.item_code
+    WHERE soi.parent IN %(sales_orders)s
+        AND soi.docstatus = 1
+        AND soi.qty - COALESCE(soi.delivered_qty, 0) > 0
+"""
+
+
+def iter_raw_materials_by_order(sales_order_names):
+    """
+    Générateur des matières premières par order (même contenu que
+    raw_materials_by_order de analyze_bom_requirements), lu en flux
+    avec un curseur non bufferisé. Aucune autre requête ne doit être
+    exécutée pendant la consommation du générateur.
+    """
+    query = """
+        SELECT
+            bi.item_code,
+            COALESCE(NULLIF(bi.item_name, ''), bi.item_code) as item_name,
+            COALESCE(NULLIF(bi.stock_uom, ''), rm.stock_uom, 'Nos') as stock_uom,
+            bi.qty / COALESCE(NULLIF(bom.quantity, 0), 1)
+                * (soi.qty - COALESCE(soi.delivered_qty, 0)) as required_qty,
+            so.name as sales_order,
+            so.customer,
+            so.po_no as customer_po_no,
+            soi.item_code as finished_good,
+            bom.name as bom_no
+    """ + RAW_MATERIALS_BY_ORDER_FROM + """
+        ORDER BY so.name, soi.idx, bi.idx
+    """
+    
+    with frappe.db.unbuffered_cursor():
+        for row in frappe.db.sql(query, {'sales_orders': sales_order_names}, as_dict=True, as_iterator=True):
+            yield row
+
+
+def iter_stock_requirements_for_orders(sales_order_names):
+    """
+    Analyse complète des besoins calculée côté serveur et produite ligne par ligne.
+    Les tables de correspondance sont chargées avant l'ouverture du flux.
+    """
+    item_codes = frappe.db.sql_list(
+        "SELECT DISTINCT bi.item_code" + RAW_MATERIALS_BY_ORDER_FROM,
+        {'sales_orders': sales_order_names}
+    )
+    
+    if not item_codes:
+        return
+    
+    lookups = get_stock_requirement_lookups(item_codes)
+    yield from iter_stock_requirements(iter_raw_materials_by_order(sales_order_names), lookups)
 
 
 def get_analysis_stats_detailed(consolidated_data, raw_materials_requirements):
@@ -1037,19 +1148,38 @@ def check_available_fields():
 
 # ================== FONCTIONS D'EXPORT ET EMAIL ==================
 
+def get_material_requirements_table(table_data, visible_columns, analysis_id=None):
+    """
+    Lignes du rapport: recalculées depuis l'analyse stockée si un identifiant
+    est fourni, sinon le tableau envoyé par le navigateur
+    """
+    if analysis_id:
+        from custom_nedlog.analysis_export import iter_requirement_table_rows
+        from custom_nedlog.analysis_store import iter_analysis_rows
+        
+        return list(iter_requirement_table_rows(iter_analysis_rows(analysis_id), visible_columns))
+    
+    if isinstance(table_data, str):
+        table_data = json.loads(table_data)
+    
+    return table_data or []
+
+
 @frappe.whitelist()
-def generate_material_requirements_pdf(table_data, visible_columns, meta_info):
+def generate_material_requirements_pdf(table_data=None, visible_columns=None, meta_info=None, analysis_id=None):
     """
     Génère un PDF du rapport des besoins en matières premières
     """
     try:
-        if isinstance(table_data, str):
-            table_data = json.loads(table_data)
         if isinstance(visible_columns, str):
             visible_columns = json.loads(visible_columns)
         if isinstance(meta_info, str):
             meta_info = json.loads(meta_info)
         
+        visible_columns = visible_columns or []
+        meta_info = meta_info or {}
+        table_data = get_material_requirements_table(table_data, visible_columns, analysis_id)
+        
         # Générer le HTML pour le PDF
         html_content = generate_pdf_html_content(table_data, visible_columns, meta_info)
         
@@ -1085,18 +1215,20 @@ def generate_material_requirements_pdf(table_data, visible_columns, meta_info):
 
 
 @frappe.whitelist()
-def send_material_requirements_email(recipients, subject, message, attach_pdf, table_data, visible_columns, meta_info):
+def send_material_requirements_email(recipients, subject, message, attach_pdf, table_data=None, visible_columns=None, meta_info=None, analysis_id=None):
     """
     Envoie le rapport par email
     """
     try:
-        if isinstance(table_data, str):
-            table_data = json.loads(table_data)
         if isinstance(visible_columns, str):
             visible_columns = json.loads(visible_columns)
         if isinstance(meta_info, str):
             meta_info = json.loads(meta_info)
         
+        visible_columns = visible_columns or []
+        meta_info = meta_info or {}
+        table_data = get_material_requirements_table(table_data, visible_columns, analysis_id)
+        
         # Préparer la liste des destinataires
         recipient_list = [email.strip() for email in recipients.split(',')]
         
@@ -143,6 +143,9 @@ function show_bom_analysis_dialog(sales_orders) {
 
 // Fonction pour créer l'interface native ERPNext ressemblant à la photo
 function create_native_bom_interface(dialog, data, sales_orders) {
+    // Conserver les commandes analysées pour l'export
+    window.bom_analysis_sales_orders = sales_orders;
+    
     // Préparer les données pour l'affichage en tableau natif
     let consolidated_materials = {};
     let all_orders_data = [];
@@ -428,44 +431,17 @@ function generate_material_requests() {
 
 // Fonction pour exporter vers Excel
 function export_analysis_to_excel() {
-    const table = document.getElementById('materials-table');
-    if (!table) return;
-    
-    // Préparer les données pour l'export
-    const data = [];
-    const headers = ['Code Article', 'Description', 'Qté Nécessaire', 'Stock Disponible', 'Unité', 'Différence', 'Statut'];
-    data.push(headers);
+    const sales_orders = window.bom_analysis_sales_orders || [];
+    if (sales_orders.length === 0) return;
     
-    const rows = table.querySelectorAll('tbody tr');
-    rows.forEach(row => {
-        const cells = row.querySelectorAll('td');
-        if (cells.length >= 7) {
-            const rowData = [
-                cells[0].querySelector('a') ? cells[0].querySelector('a').textContent.trim() : cells[0].textContent.trim(),
-                cells[1].textContent.trim(),
-                cells[2].textContent.trim(),
-                cells[3].textContent.trim(),
-                cells[4].textContent.trim(),
-                cells[5].textContent.trim(),
-                cells[6].textContent.trim()
-            ];
-            data.push(rowData);
-        }
-    });
+    // Le fichier est généré côté serveur ligne par ligne et téléchargé directement
+    const args = {
+        sales_orders: JSON.stringify(sales_orders),
+        file_format: 'xlsx',
+        filename: `BOM_Analysis_${frappe.datetime.now_date()}.xlsx`
+    };
     
-    // Appeler l'API d'export
-    frappe.call({
-        method: 'custom_nedlog.api.export_bom_analysis',
-        args: {
-            data: JSON.stringify(data),
-            filename: `BOM_Analysis_${frappe.datetime.now_date()}.xlsx`
-        },
-        callback: function(response) {
-            if (response.message) {
-                window.open(response.message.file_url);
-            }
-        }
-    });
+    window.open(`/api/method/custom_nedlog.api.export_bom_analysis?${$.param(args)}`);
 }
 
 
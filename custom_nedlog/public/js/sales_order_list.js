@@ -57,6 +57,7 @@ function analyze_production_requirements(sales_order_names) {
     window.printMaterialRequirementsReport = printMaterialRequirementsReport;
     window.generateMaterialRequirementsPDF = generateMaterialRequirementsPDF;
     window.emailMaterialRequirementsReport = emailMaterialRequirementsReport;
+    window.exportMaterialRequirementsExcel = exportMaterialRequirementsExcel;
     
     // Étape 1: Récupérer les Sales Orders avec leurs items
     console.log("etape1")
@@ -253,6 +254,9 @@ function create_grouped_material_requests(analysis_data) {
  * Affiche les résultats de l'analyse de production
  */
 function display_production_analysis_results(dialog, analysis_data) {
+    // Identifiant de l'analyse conservée côté serveur (PDF, email, export)
+    window.current_material_analysis_id = analysis_data.analysis_id || null;
+    
     // Debug automatique des données d'emplacements
     debug_warehouses_data(analysis_data);
     
@@ -432,6 +436,9 @@ function generate_analysis_html(analysis_data) {
                 <button class="btn btn-sm btn-info" onclick="emailMaterialRequirementsReport()">
                     <i class="fa fa-envelope"></i> Envoyer par Email
                 </button>
+                <button class="btn btn-sm btn-default" onclick="exportMaterialRequirementsExcel()">
+                    <i class="fa fa-file-excel-o"></i> Exporter Excel
+                </button>
             </div>
             
             <!-- Panel de Préférences -->
@@ -1134,19 +1141,17 @@ function generateMaterialRequirementsPDF() {
     
     // Préparer les données pour l'export PDF
     const visibleColumns = getVisibleColumns();
-    const tableData = extractTableDataForPDF(tableElement, visibleColumns);
     
     frappe.call({
         method: 'custom_nedlog.production_analysis.generate_material_requirements_pdf',
-        args: {
-            table_data: tableData,
+        args: Object.assign(getMaterialRequirementsSource(tableElement, visibleColumns), {
             visible_columns: visibleColumns,
             meta_info: {
                 generated_date: new Date().toLocaleDateString('fr-FR'),
                 generated_time: new Date().toLocaleTimeString('fr-FR'),
                 generated_by: frappe.session.user
             }
-        },
+        }),
         callback: function(response) {
             if (response.message && response.message.file_url) {
                 // Télécharger le PDF généré
@@ -1227,23 +1232,21 @@ function emailMaterialRequirementsReport() {
  */
 function sendMaterialRequirementsEmail(emailData, tableElement) {
     const visibleColumns = getVisibleColumns();
-    const tableData = extractTableDataForPDF(tableElement, visibleColumns);
     
     frappe.call({
         method: 'custom_nedlog.production_analysis.send_material_requirements_email',
-        args: {
+        args: Object.assign(getMaterialRequirementsSource(tableElement, visibleColumns), {
             recipients: emailData.recipients,
             subject: emailData.subject,
             message: emailData.message,
             attach_pdf: emailData.attach_pdf,
-            table_data: tableData,
             visible_columns: visibleColumns,
             meta_info: {
                 generated_date: new Date().toLocaleDateString('fr-FR'),
                 generated_time: new Date().toLocaleTimeString('fr-FR'),
                 generated_by: frappe.session.user
             }
-        },
+        }),
         callback: function(response) {
             if (response.message && response.message.success) {
                 frappe.msgprint({
@@ -1266,6 +1269,35 @@ function sendMaterialRequirementsEmail(emailData, tableElement) {
     });
 }
 
+/**
+ * Source des données du rapport: l'identifiant de l'analyse stockée côté serveur,
+ * ou à défaut le contenu du tableau affiché
+ */
+function getMaterialRequirementsSource(tableElement, visibleColumns) {
+    if (window.current_material_analysis_id) {
+        return { analysis_id: window.current_material_analysis_id };
+    }
+    return { table_data: extractTableDataForPDF(tableElement, visibleColumns) };
+}
+
+/**
+ * Exporter le rapport en Excel depuis l'analyse stockée côté serveur
+ */
+function exportMaterialRequirementsExcel() {
+    if (!window.current_material_analysis_id) {
+        frappe.msgprint('Aucune analyse à exporter');
+        return;
+    }
+    
+    const args = {
+        analysis_id: window.current_material_analysis_id,
+        visible_columns: JSON.stringify(getVisibleColumns()),
+        file_format: 'xlsx'
+    };
+    
+    window.open(`/api/method/custom_nedlog.api.export_bom_analysis?${$.param(args)}`);
+}
+
 /**
  * Extraire les données du tableau pour l'export
  */
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Tests pour le module analysis_export
+
+import csv
+import io
+import tempfile
+import tracemalloc
+import unittest
+
+from custom_nedlog.analysis_export import (
+    REQUIREMENTS_COLUMNS,
+    get_export_filename,
+    get_export_format,
+    iter_requirement_table_rows,
+    order_requirements_for_display,
+    write_csv,
+    write_xlsx
+)
+
+
+def generate_detail_rows(count):
+    """
+    Génère des lignes de détail sans les garder en mémoire
+    """
+    for i in range(count):
+        yield {
+            'type': 'detail',
+            'item_code': f'RM-{i % 5000:05d}',
+            'item_name': f'Matière première {i % 5000}',
+            'sales_order': f'SO-{i // 20:06d}',
+            'customer': 'Client Test',
+            'customer_po_no': f'PO-{i // 20}',
+            'required_qty': i * 0.5,
+            'stock_uom': 'Kg',
+            'supplier_name': 'Fournisseur Test'
+        }
+
+
+class TestAnalysisExport(unittest.TestCase):
+
+    def test_csv_export_memory_is_bounded(self):
+        """
+        200k lignes de détail doivent s'écrire avec une mémoire bornée
+        """
+        with tempfile.TemporaryFile() as f:
+            tracemalloc.start()
+            write_csv(generate_detail_rows(200000), REQUIREMENTS_COLUMNS, f)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.assertLess(peak, 2 * 1024 * 1024)
+
+            f.seek(0)
+            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8-sig', newline=''))
+            header = next(reader)
+            self.assertEqual(header, [label for field, label in REQUIREMENTS_COLUMNS])
+            self.assertEqual(sum(1 for _row in reader), 200000)
+
+    def test_xlsx_export_write_only(self):
+        """
+        L'export XLSX doit être relisible et contenir toutes les lignes
+        """
+        from openpyxl import load_workbook
+
+        with tempfile.TemporaryFile() as f:
+            write_xlsx(generate_detail_rows(1000), REQUIREMENTS_COLUMNS, f)
+            f.seek(0)
+            sheet = load_workbook(f, read_only=True).active
+            rows = list(sheet.iter_rows(values_only=True))
+
+        self.assertEqual(len(rows), 1001)
+        self.assertEqual(rows[1][1], 'RM-00000')
+
+    def test_export_format_and_filename(self):
+        """
+        Le format est déduit de l'extension et l'extension est normalisée
+        """
+        self.assertEqual(get_export_format(None, 'analyse.xlsx'), 'xlsx')
+        self.assertEqual(get_export_format('CSV'), 'csv')
+        self.assertEqual(get_export_filename('BOM', 'csv', 'analyse.xlsx'), 'analyse.csv')
+
+    def test_requirement_table_rows_follow_display_order(self):
+        """
+        Les lignes stockées reprennent l'ordre et les valeurs du tableau affiché
+        """
+        requirements = [
+            {'type': 'detail', 'item_code': 'RM-A', 'required_qty': 2, 'customer_po_no': 'PO-1'},
+            {'type': 'detail', 'item_code': 'RM-B', 'required_qty': 5, 'customer_po_no': 'PO-1'},
+            {'type': 'detail', 'item_code': 'RM-A', 'required_qty': 3, 'customer_po_no': 'PO-2'},
+            {'type': 'total', 'item_code': 'RM-A', 'total_required_qty': 5, 'available_qty': 1, 'orders_count': 2},
+            {'type': 'total', 'item_code': 'RM-B', 'total_required_qty': 5, 'available_qty': 9, 'orders_count': 1}
+        ]
+
+        ordered = list(order_requirements_for_display(requirements))
+        self.assertEqual(
+            [(r['type'], r['item_code']) for r in ordered],
+            [('detail', 'RM-A'), ('detail', 'RM-A'), ('total', 'RM-A'), ('detail', 'RM-B'), ('total', 'RM-B')]
+        )
+
+        table = list(iter_requirement_table_rows(ordered, ['item-code', 'shortage', 'order-number', 'status']))
+        self.assertEqual(table[2], {
+            'Item Code': 'RM-A',
+            'Manque': 4,
+            'Order Number': 'TOTAL (2 orders)',
+            'Statut': 'MANQUE',
+            '_type': 'total'
+        })
+        self.assertEqual(table[0]['Manque'], '-')
+        self.assertEqual(table[4]['Statut'], 'DISPONIBLE')
+
+
+if __name__ == '__main__':
+    unittest.main()
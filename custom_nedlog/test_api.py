@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# Tests pour le module api
+
+import unittest
+from unittest.mock import patch
+
+import frappe
+
+from custom_nedlog.api import build_item_bom_info, get_sales_order_bom_info, get_total_available
+
+
+class TestBomInfoIndexes(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Index en mémoire partagés par toutes les lignes de commande
+        """
+        self.default_boms = {'FG-1': 'BOM-FG-1-001'}
+        self.bom_items = {
+            'BOM-FG-1-001': [
+                frappe._dict(item_code='RM-1', item_name='Raw 1', qty=2, uom='Kg', rate=3),
+                frappe._dict(item_code='RM-2', item_name='Raw 2', qty=1, uom='Nos', rate=None)
+            ]
+        }
+        self.stock_by_item = {
+            'RM-1': [
+                frappe._dict(warehouse='Stores - TC', actual_qty=5, reserved_qty=0, projected_qty=5),
+                frappe._dict(warehouse='Finished - TC', actual_qty=None, reserved_qty=0, projected_qty=0)
+            ]
+        }
+
+    def test_total_available(self):
+        self.assertEqual(get_total_available(self.stock_by_item), {'RM-1': 5})
+
+    def test_item_with_bom(self):
+        item = frappe._dict(item_code='FG-1', item_name='Finished 1', qty=4, delivery_date=None)
+        info = build_item_bom_info(
+            item, self.default_boms, self.bom_items,
+            self.stock_by_item, get_total_available(self.stock_by_item)
+        )
+
+        self.assertTrue(info['has_bom'])
+        self.assertEqual(info['bom_name'], 'BOM-FG-1-001')
+        self.assertEqual([m['total_qty'] for m in info['raw_materials']], [8, 4])
+        self.assertEqual(info['raw_materials'][0]['amount'], 24)
+        self.assertEqual(info['raw_materials'][0]['total_available'], 5)
+        self.assertEqual(len(info['raw_materials'][0]['stock_info']), 2)
+        self.assertEqual(info['raw_materials'][1]['total_available'], 0)
+        self.assertEqual(info['raw_materials'][1]['stock_info'], [])
+
+    def test_item_without_bom(self):
+        item = frappe._dict(item_code='FG-2', item_name='Finished 2', qty=1, delivery_date=None)
+        info = build_item_bom_info(item, self.default_boms, self.bom_items, self.stock_by_item, {})
+
+        self.assertFalse(info['has_bom'])
+        self.assertEqual(info['raw_materials'], [])
+
+
+
+class TestSalesOrderBomInfoQueries(unittest.TestCase):
+
+    def load(self, lines):
+        """
+        Appeler get_sales_order_bom_info sur une commande de `lines` lignes,
+        chaque article ayant un BOM à 2 matières premières
+        """
+        items = [
+            frappe._dict(parent='SO-0001', item_code=f'FG-{i}', item_name=f'Finished {i}', qty=1, delivery_date=None)
+            for i in range(lines)
+        ]
+
+        def get_all(doctype, filters=None, fields=None, order_by=None):
+            if doctype == 'Sales Order Item':
+                return items
+            return [
+                frappe._dict(parent=bom, item_code=f'RM-{j}', item_name=f'Raw {j}', qty=1, uom='Nos', rate=1)
+                for bom in filters['parent'][1] for j in range(2)
+            ]
+
+        def get_list(doctype, filters=None, fields=None, order_by=None):
+            if doctype == 'BOM':
+                return [frappe._dict(name=f'BOM-{code}', item=code, quantity=1) for code in filters['item'][1]]
+            return [
+                frappe._dict(item_code=code, warehouse='Stores - TC', actual_qty=5, reserved_qty=0, projected_qty=5)
+                for code in filters['item_code'][1]
+            ]
+
+        with patch.object(frappe.db, 'get_value', return_value=frappe._dict(name='SO-0001', customer='Client A'), create=True) as get_value, \
+                patch.object(frappe, 'get_all', side_effect=get_all, create=True) as mocked_get_all, \
+                patch.object(frappe, 'get_list', side_effect=get_list, create=True) as mocked_get_list, \
+                patch.object(frappe.db, 'sql', create=True) as sql:
+            result = get_sales_order_bom_info('SO-0001')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(len(result['bom_info']), lines)
+        return [get_value.call_count, mocked_get_all.call_count, mocked_get_list.call_count, sql.call_count]
+
+    def test_query_count_independent_of_order_size(self):
+        """
+        Commande de 1 ou 50 lignes: même nombre fixe de requêtes
+        """
+        self.assertEqual(self.load(1), [1, 2, 2, 0])
+        self.assertEqual(self.load(50), [1, 2, 2, 0])
+
+if __name__ == '__main__':
+    unittest.main()
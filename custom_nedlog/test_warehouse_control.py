@@ -0,0 +1,624 @@
+# -*- coding: utf-8 -*-
+# Tests pour le module warehouse_control
+
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+import frappe
+import redis
+
+from custom_nedlog.warehouse_control import cache as warehouse_cache
+from custom_nedlog.warehouse_control import logging as warehouse_logging
+from custom_nedlog.warehouse_control import realtime
+from custom_nedlog.warehouse_control import reporting
+from custom_nedlog.warehouse_control import retention
+from custom_nedlog.warehouse_control import rollup
+from custom_nedlog.warehouse_control.counter import get_counter_delta
+from custom_nedlog.warehouse_control.index import get_membership
+from custom_nedlog.warehouse_control.reconciliation import get_inconsistent_warehouses
+from custom_nedlog.warehouse_control.replay import replay_posting
+from custom_nedlog.warehouse_control.reporting import filter_warehouse_customer_status_rows
+from custom_nedlog.warehouse_control.rollup import merge_activity
+from custom_nedlog.warehouse_control import validation
+from custom_nedlog.warehouse_control.validation import (
+    WarehouseMixingError,
+    claim_warehouse,
+    get_customer_from_transaction,
+    get_linked_customers,
+    get_warehouse_fingerprint,
+    handle_incoming_transaction,
+    handle_outgoing_transaction,
+    validate_warehouse_assignment
+)
+
+
+class FakeCache:
+    """
+    Cache Redis en mémoire : valeurs picklées via le wrapper, hashes bruts via make_key
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+        self.objects = {}
+        self.ttls = {}
+
+    def make_key(self, key):
+        return f'site|{key}'
+
+    def get_value(self, key):
+        return self.values.get(self.make_key(key))
+
+    def set_value(self, key, value, expires_in_sec=None):
+        self.values[self.make_key(key)] = value
+
+    def hincrby(self, name, field, amount=1):
+        fields = self.hashes.setdefault(name, {})
+        fields[field.encode()] = str(int(fields.get(field.encode(), b'0')) + amount).encode()
+        return int(fields[field.encode()])
+
+    def raw_hgetall(self, name):
+        return dict(self.hashes.get(name, {}))
+
+    def hmget(self, name, keys):
+        fields = self.hashes.get(name, {})
+        return [fields.get(key.encode()) for key in keys]
+
+    def hget(self, name, key):
+        return self.objects.get(self.make_key(name), {}).get(key)
+
+    def hset(self, name, key, value):
+        self.objects.setdefault(self.make_key(name), {})[key] = value
+
+    def hdel(self, name, key):
+        self.objects.get(self.make_key(name), {}).pop(key, None)
+
+    def ttl(self, name):
+        return self.ttls.get(name, -1)
+
+    def expire(self, name, seconds):
+        self.ttls[name] = seconds
+
+
+class TestControlledWarehousesCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FakeCache()
+        warehouse_cache._controlled_warehouses.clear()
+        frappe.local.site = 'test.site'
+
+    def test_set_reloaded_only_when_version_changes(self):
+        """
+        La liste des entrepôts contrôlés n'est relue qu'après un changement de version
+        """
+        with patch('frappe.cache', return_value=self.cache), \
+                patch('frappe.get_all', return_value=['WH-1', 'WH-2']) as get_all:
+            self.assertEqual(warehouse_cache.get_controlled_warehouses(), frozenset(['WH-1', 'WH-2']))
+            warehouse_cache.get_controlled_warehouses()
+            self.assertEqual(get_all.call_count, 1)
+
+            warehouse_cache.bump_controlled_warehouses_version()
+            warehouse_cache.get_controlled_warehouses()
+            self.assertEqual(get_all.call_count, 2)
+
+    def test_hook_stats_round_trip(self):
+        """
+        Les compteurs HINCRBY sont relus sous la même clé et décodés
+        """
+        with patch('frappe.cache', return_value=self.cache), \
+                patch.object(redis.Redis, 'hgetall', lambda cache, name: cache.raw_hgetall(name)):
+            warehouse_cache.increment_hook_stat('Purchase Receipt', 'processed')
+            warehouse_cache.increment_hook_stat('Purchase Receipt', 'processed')
+            warehouse_cache.increment_hook_stat('Purchase Receipt', 'skipped')
+            warehouse_cache.increment_hook_stat('Stock Entry', 'skipped')
+
+            self.assertEqual(warehouse_cache.get_hook_stats(), {
+                'Purchase Receipt': {'processed': 2, 'skipped': 1},
+                'Stock Entry': {'processed': 0, 'skipped': 1}
+            })
+
+
+class TestWarehouseStateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FakeCache()
+        frappe.local.warehouse_control_states = {}
+        frappe.local.warehouse_control_dirty = set()
+        self.concurrent_commits = 1
+
+    def read_warehouse(self, *args, **kwargs):
+        if self.concurrent_commits:
+            # Un autre worker commit une écriture pendant la lecture
+            self.concurrent_commits -= 1
+            frappe.local.warehouse_control_dirty = {'WH-1'}
+            warehouse_cache.clear_dirty_warehouse_states()
+            frappe.local.warehouse_control_dirty = set()
+        return [frappe._dict(name='WH-1', control_mode='Warning', assigned_customer=None)]
+
+    def get_state(self):
+        frappe.local.warehouse_control_states = {}
+        return warehouse_cache.get_warehouse_states(['WH-1'])['WH-1']
+
+    def test_fill_read_during_commit_not_stored(self):
+        """
+        Un état lu pendant un commit concurrent n'est pas stocké ; la lecture suivante remplit Redis
+        """
+        with patch('frappe.cache', return_value=self.cache), \
+                patch.object(frappe.db, 'sql', side_effect=self.read_warehouse) as sql:
+            self.get_state()
+            self.assertIsNone(self.cache.hget(warehouse_cache.STATE_CACHE_KEY, 'WH-1'))
+
+            self.get_state()
+            self.get_state()
+            self.assertEqual(sql.call_count, 2)
+            self.assertEqual(self.cache.ttl('site|warehouse_control_state'), warehouse_cache.STATE_CACHE_TTL)
+
+    def test_entry_of_previous_generation_ignored(self):
+        """
+        Une entrée stockée avant un commit concurrent n'est plus servie
+        """
+        self.concurrent_commits = 0
+        with patch('frappe.cache', return_value=self.cache), \
+                patch.object(frappe.db, 'sql', side_effect=self.read_warehouse) as sql:
+            self.get_state()
+            frappe.local.warehouse_control_dirty = {'WH-1'}
+            warehouse_cache.clear_dirty_warehouse_states()
+
+            self.get_state()
+            self.assertEqual(sql.call_count, 2)
+
+
+class TestWarehouseCounterDelta(unittest.TestCase):
+
+    def test_receipt_into_empty_item(self):
+        delta = get_counter_delta({'actual_qty': 10, 'voucher_type': 'Stock Entry'}, 0)
+        self.assertEqual(delta, {'total_qty': 10, 'item_count': 1})
+
+    def test_issue_emptying_item(self):
+        delta = get_counter_delta({'actual_qty': -4, 'voucher_type': 'Delivery Note'}, 4)
+        self.assertEqual(delta, {'total_qty': -4, 'item_count': -1})
+
+    def test_partial_issue_keeps_item_count(self):
+        delta = get_counter_delta({'actual_qty': -1, 'voucher_type': 'Delivery Note'}, 4)
+        self.assertEqual(delta, {'total_qty': -1, 'item_count': 0})
+
+    def test_stock_reconciliation_uses_target_qty(self):
+        delta = get_counter_delta(
+            {'actual_qty': 0, 'qty_after_transaction': 0, 'voucher_type': 'Stock Reconciliation'}, 7
+        )
+        self.assertEqual(delta, {'total_qty': -7, 'item_count': -1})
+
+    def test_backdated_stock_reconciliation_uses_qty_at_posting(self):
+        """
+        Une réconciliation antidatée compare la cible à la quantité à sa date, pas au Bin actuel
+        """
+        delta = get_counter_delta(
+            {'actual_qty': 0, 'qty_after_transaction': 5, 'voucher_type': 'Stock Reconciliation'}, 7, previous_qty=2
+        )
+        self.assertEqual(delta, {'total_qty': 3, 'item_count': 0})
+
+
+class TestStockEntryCustomerInference(unittest.TestCase):
+
+    def test_one_query_per_linked_doctype(self):
+        """
+        300 lignes liées à 2 Sales Orders et 1 Material Request: 2 requêtes au total
+        """
+        items = [frappe._dict(sales_order=f'SO-{i % 2}') for i in range(200)]
+        items += [frappe._dict(material_request='MR-1') for _i in range(100)]
+
+        def get_all(doctype, filters=None, fields=None):
+            customers = {'Sales Order': 'Client A', 'Material Request': 'Client B'}
+            return [frappe._dict(name=name, customer=customers[doctype]) for name in filters['name'][1]]
+
+        with patch.object(frappe, 'get_all', side_effect=get_all, create=True) as mocked:
+            linked_customers = get_linked_customers(items)
+
+        self.assertEqual(mocked.call_count, 2)
+        doc = {'doctype': 'Stock Entry'}
+        self.assertEqual(get_customer_from_transaction(doc, items[1], linked_customers), 'Client A')
+        self.assertEqual(get_customer_from_transaction(doc, items[-1], linked_customers), 'Client B')
+
+
+class TestStockEntryFingerprint(unittest.TestCase):
+
+    def make_entry(self, remarks='', s_warehouse='Stores - TC'):
+        return frappe._dict(
+            remarks=remarks,
+            items=[
+                frappe._dict(item_code='RM-1', s_warehouse=s_warehouse, t_warehouse=None, transfer_qty=5),
+                frappe._dict(item_code='RM-2', s_warehouse='Stores - TC', t_warehouse=None, transfer_qty=1)
+            ]
+        )
+
+    def test_remark_change_keeps_fingerprint(self):
+        self.assertEqual(
+            get_warehouse_fingerprint(self.make_entry()),
+            get_warehouse_fingerprint(self.make_entry(remarks='Modifié après validation'))
+        )
+
+    def test_warehouse_change_changes_fingerprint(self):
+        self.assertNotEqual(
+            get_warehouse_fingerprint(self.make_entry()),
+            get_warehouse_fingerprint(self.make_entry(s_warehouse='Finished - TC'))
+        )
+
+
+class TestActivityRollup(unittest.TestCase):
+
+    def test_merge_rolled_up_and_live_activity(self):
+        """
+        Les agrégats journaliers et l'activité du jour s'additionnent
+        """
+        rolled_up = {
+            'events': {'Warning': frappe._dict(event_type='Warning', count=3, last_event='2026-10-17 10:00:00')},
+            'movements': frappe._dict(movement_count=40, total_qty_moved=120.0)
+        }
+        live = {
+            'events': {
+                'Warning': frappe._dict(event_type='Warning', count=1, last_event='2026-10-19 08:30:00'),
+                'Release': frappe._dict(event_type='Release', count=1, last_event='2026-10-19 09:00:00')
+            },
+            'movements': frappe._dict(movement_count=2, total_qty_moved=5.5)
+        }
+
+        activity = merge_activity(rolled_up, live)
+
+        self.assertEqual(activity['events']['Warning'].count, 4)
+        self.assertEqual(activity['events']['Warning'].last_event, '2026-10-19 08:30:00')
+        self.assertEqual(activity['events']['Release'].count, 1)
+        self.assertEqual(activity['movements'].movement_count, 42)
+        self.assertEqual(activity['movements'].total_qty_moved, 125.5)
+
+    def test_period_before_first_rollup_day_read_live(self):
+        """
+        Une période commençant avant le premier jour agrégé est lue entièrement en direct
+        """
+        with patch.object(rollup, 'get_rollup_start_date', return_value=date(2026, 10, 12)), \
+                patch.object(rollup, 'get_last_rollup_date', return_value=date(2026, 10, 18)):
+            self.assertEqual(rollup.get_rollup_window(date(2026, 10, 14)), (date(2026, 10, 18), date(2026, 10, 19)))
+            self.assertEqual(rollup.get_rollup_window(date(2026, 9, 19)), (None, date(2026, 9, 19)))
+
+
+class TestLogBuffer(unittest.TestCase):
+
+    def test_failed_flush_aborts_commit(self):
+        """
+        Un échec d'insertion des événements est relevé, pour annuler la transaction
+        """
+        frappe.local.warehouse_control_log_buffer = [{field: None for field in warehouse_logging.LOG_FIELDS}]
+
+        with patch.object(frappe.db, 'bulk_insert', side_effect=Exception('Deadlock'), create=True):
+            with self.assertRaises(Exception):
+                warehouse_logging.flush_log_buffer()
+
+        self.assertEqual(warehouse_logging.get_log_buffer(), [])
+
+
+class TestLogArchive(unittest.TestCase):
+
+    def test_days_not_rolled_up_stay_live(self):
+        """
+        Un job de rollup en retard borne l'archivage aux jours déjà agrégés
+        """
+        with patch.object(retention, 'get_rollup_start_date', return_value=date(2025, 1, 1)), \
+                patch.object(retention, 'get_last_rollup_date', return_value=date(2025, 3, 10)), \
+                patch.object(frappe, 'conf', frappe._dict(), create=True), \
+                patch.object(frappe.db, 'sql_list', return_value=[], create=True) as sql_list:
+            self.assertEqual(retention.archive_warehouse_control_logs(), 0)
+
+        start, cutoff = sql_list.call_args.args[1]
+        self.assertEqual(start.date(), date(2025, 1, 1))
+        self.assertEqual(cutoff.date(), date(2025, 3, 11 - rollup.ROLLUP_RECOMPUTE_DAYS))
+
+
+class TestLedgerReplay(unittest.TestCase):
+
+    def test_assignment_warning_and_release(self):
+        """
+        Rejeu : affectation à l'entrée, avertissement pour un autre client, libération à zéro
+        """
+        state = {'total_qty': 0.0, 'assigned_customer': None}
+
+        self.assertEqual(replay_posting(state, 10, 'CUST-A'), [('Assignment', None, 'CUST-A', 0.0, 10)])
+        self.assertEqual(replay_posting(state, 5, 'CUST-A'), [])
+        self.assertEqual(replay_posting(state, 2, 'CUST-B'), [('Warning', 'CUST-A', 'CUST-B', 15, 15)])
+        self.assertEqual(state['assigned_customer'], 'CUST-A')
+        self.assertEqual(replay_posting(state, -16.9, None), [])
+        self.assertEqual(replay_posting(state, -0.1, None), [('Release', 'CUST-A', None, 0.1, 0.0)])
+        self.assertIsNone(state['assigned_customer'])
+
+
+class TestStrictControlMode(unittest.TestCase):
+
+    def test_strict_blocks_and_warning_warns(self):
+        """
+        Un autre client est bloqué en mode Strict et seulement signalé en mode Warning
+        """
+        doc = {'doctype': 'Purchase Receipt', 'name': 'PR-0001'}
+        info = {'total_qty': 10, 'assigned_customer': 'CUST-A', 'control_mode': 'Strict'}
+
+        self.assertEqual(validate_warehouse_assignment('WH-1', 'CUST-B', doc, warehouse_info=info)['action'], 'block')
+        self.assertEqual(validate_warehouse_assignment('WH-1', 'CUST-A', doc, warehouse_info=info)['action'], 'allow')
+
+        info['control_mode'] = 'Warning'
+        self.assertEqual(validate_warehouse_assignment('WH-1', 'CUST-B', doc, warehouse_info=info)['action'], 'warn')
+
+
+class FakeDoc:
+    """
+    Document ou ligne minimale : champs en attributs, lus aussi par get()
+    """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def get(self, key, default=None):
+        return self.__dict__.get(key, default)
+
+
+class TestIncomingSubmit(unittest.TestCase):
+
+    def submit(self, summary, seen, locked=None, items=None, posted=None, non_stock_items=()):
+        doc = FakeDoc(
+            doctype='Purchase Receipt', name='PR-0002', supplier='CUST-B',
+            items=items or [FakeDoc(item_code='ITEM-1', warehouse='WH-1', stock_qty=5)]
+        )
+        doc.flags = frappe._dict(warehouse_control_seen=seen)
+        # Écritures du Stock Ledger postées par le document
+        posted = [('WH-1', 5)] if posted is None else posted
+
+        with patch.object(validation, 'get_controlled_warehouses', return_value=frozenset(['WH-1'])), \
+                patch.object(frappe, 'get_all', return_value=list(non_stock_items), create=True), \
+                patch.object(frappe.db, 'sql', return_value=posted, create=True), \
+                patch.object(validation, 'increment_hook_stat'), \
+                patch.object(validation, 'get_warehouse_summaries', return_value={'WH-1': summary}), \
+                patch.object(validation, 'get_locked_warehouse_summary', return_value=locked), \
+                patch.object(validation, 'compare_and_set_assignment', return_value=True) as compare_and_set, \
+                patch.object(validation, 'log_assignment') as log_assignment, \
+                patch.object(validation, 'log_warning') as log_warning, \
+                patch.object(validation, 'flush_warehouse_status_updates'):
+            handle_incoming_transaction(doc, 'on_submit')
+
+        return compare_and_set, log_assignment, log_warning
+
+    def test_own_stock_not_counted(self):
+        """
+        Le stock déjà posté par le document ne rend pas un entrepôt vide bloquant
+        """
+        summary = {'total_qty': 5, 'assigned_customer': 'CUST-A', 'control_mode': 'Strict'}
+        compare_and_set, log_assignment, log_warning = self.submit(summary, {'WH-1': 'CUST-A'})
+
+        compare_and_set.assert_called_once_with('WH-1', 'CUST-B', 'CUST-A')
+        self.assertEqual(log_assignment.call_args.kwargs['qty_before'], 0)
+        self.assertEqual(log_assignment.call_args.kwargs['qty_after'], 5)
+
+    def test_block_only_if_assignment_changed(self):
+        """
+        Le blocage Strict n'est levé que si l'affectation a changé depuis before_submit
+        """
+        locked = {'total_qty': 8, 'assigned_customer': 'CUST-A', 'control_mode': 'Strict'}
+
+        with self.assertRaises(WarehouseMixingError):
+            self.submit(dict(locked), {'WH-1': None}, dict(locked))
+
+        log_warning = self.submit(dict(locked), {'WH-1': 'CUST-A'}, dict(locked))[2]
+        log_warning.assert_called_once()
+
+    def test_non_stock_row_not_counted(self):
+        """
+        Une ligne d'article hors stock ne poste rien : l'entrepôt du client A reste le sien
+        """
+        summary = {'total_qty': 5, 'assigned_customer': 'CUST-A', 'control_mode': 'Warning'}
+        items = [FakeDoc(item_code='SERVICE-1', warehouse='WH-1', qty=5)]
+        compare_and_set, log_assignment, log_warning = self.submit(
+            summary, {'WH-1': 'CUST-A'}, items=items, posted=[], non_stock_items=['SERVICE-1']
+        )
+
+        compare_and_set.assert_not_called()
+        log_assignment.assert_not_called()
+        log_warning.assert_not_called()
+        self.assertEqual(summary['total_qty'], 5)
+
+    def test_non_stock_row_beside_stock_row(self):
+        """
+        Seule la quantité des écritures de stock est retirée avant la décision
+        """
+        summary = {'total_qty': 10, 'assigned_customer': 'CUST-A', 'control_mode': 'Warning'}
+        items = [
+            FakeDoc(item_code='SERVICE-1', warehouse='WH-1', qty=5),
+            FakeDoc(item_code='ITEM-1', warehouse='WH-1', stock_qty=5)
+        ]
+        compare_and_set, log_assignment, log_warning = self.submit(
+            summary, {'WH-1': 'CUST-A'}, items=items, non_stock_items=['SERVICE-1']
+        )
+
+        compare_and_set.assert_not_called()
+        self.assertEqual(log_warning.call_args.kwargs['qty_before'], 5)
+
+
+class TestOutgoingSubmit(unittest.TestCase):
+
+    def test_release_logs_quantity_before_document(self):
+        """
+        La libération enregistre la quantité présente avant la sortie, comme le replay
+        """
+        doc = FakeDoc(
+            doctype='Delivery Note', name='DN-0001',
+            items=[FakeDoc(item_code='ITEM-1', warehouse='WH-1', stock_qty=7)]
+        )
+        doc.flags = frappe._dict()
+        summary = {'total_qty': 0, 'assigned_customer': 'CUST-A', 'control_mode': 'Warning'}
+
+        with patch.object(validation, 'get_controlled_warehouses', return_value=frozenset(['WH-1'])), \
+                patch.object(validation, 'increment_hook_stat'), \
+                patch.object(frappe, 'get_all', return_value=[], create=True), \
+                patch.object(frappe.db, 'sql', return_value=[('WH-1', -7)], create=True), \
+                patch.object(validation, 'get_warehouse_summaries', return_value={'WH-1': summary}), \
+                patch.object(validation, 'release_warehouse', return_value=True), \
+                patch.object(validation, 'log_release') as log_release, \
+                patch.object(validation, 'flush_warehouse_status_updates'):
+            handle_outgoing_transaction(doc, 'on_submit')
+
+        self.assertEqual(log_release.call_args.kwargs['qty_before'], 7)
+
+
+class TestAssignmentConflict(unittest.TestCase):
+
+    def setUp(self):
+        # Ligne Warehouse partagée par les transactions concurrentes
+        self.row = {'assigned_customer': None, 'total_qty': 0, 'control_mode': 'Warning'}
+
+    def compare_and_set(self, warehouse, customer, expected_customer):
+        if self.row['assigned_customer'] != expected_customer:
+            return False
+        self.row['assigned_customer'] = customer
+        return True
+
+    def claim(self, customer, stale_info):
+        doc = {'doctype': 'Purchase Receipt', 'name': f'PR-{customer}'}
+        result = validate_warehouse_assignment('WH-1', customer, doc, warehouse_info=stale_info)
+        self.assertEqual(result['action'], 'assign')
+        with patch.object(validation, 'compare_and_set_assignment', self.compare_and_set), \
+                patch.object(validation, 'get_locked_warehouse_summary', lambda warehouse: dict(self.row)):
+            return claim_warehouse('WH-1', customer, doc, result, stale_info)[0]['action']
+
+    def test_winner_is_never_taken_over(self):
+        """
+        Un entrepôt vide affecté par une transaction concurrente n'est pas réaffecté
+        """
+        stale_info = dict(self.row)
+        actions = [self.claim(customer, dict(stale_info)) for customer in ('CUST-A', 'CUST-B', 'CUST-C')]
+
+        self.assertEqual(actions, ['assign', 'warn', 'warn'])
+        self.assertEqual(self.row['assigned_customer'], 'CUST-A')
+
+    def test_strict_conflict_blocks_and_same_customer_allowed(self):
+        """
+        Après un conflit, un autre client est bloqué en mode Strict et le même client accepté
+        """
+        self.row['control_mode'] = 'Strict'
+        stale_info = dict(self.row)
+        self.claim('CUST-A', dict(stale_info))
+
+        self.assertEqual(self.claim('CUST-B', dict(stale_info)), 'block')
+        self.assertEqual(self.claim('CUST-A', dict(stale_info)), 'allow')
+        self.assertEqual(self.row['assigned_customer'], 'CUST-A')
+
+
+class TestPutawayIndex(unittest.TestCase):
+
+    def test_free_warehouse_is_available_unassigned_and_empty(self):
+        """
+        Seul un entrepôt disponible, non affecté et vide est libre
+        """
+        row = frappe._dict(company='NEDLOG', assigned_customer=None, warehouse_status='Available', total_qty=0)
+        self.assertEqual(get_membership(row), {'company': 'NEDLOG', 'customer': None, 'free': True})
+
+        row.total_qty = 3
+        self.assertFalse(get_membership(row)['free'])
+
+        row.update(total_qty=0, assigned_customer='CUST-A', warehouse_status='Reserved')
+        self.assertEqual(get_membership(row), {'company': 'NEDLOG', 'customer': 'CUST-A', 'free': False})
+
+
+class TestStateReconciliation(unittest.TestCase):
+
+    def test_action_follows_stock_and_assignment(self):
+        """
+        Sans stock : libérer ; stock sans client : affecter ; stock et client : réserver
+        """
+        rows = [
+            frappe._dict(warehouse='WH-1', total_qty=0, assigned_customer='CUST-A', warehouse_status='Reserved'),
+            frappe._dict(warehouse='WH-2', total_qty=0.0, assigned_customer=None, warehouse_status='Reserved'),
+            frappe._dict(warehouse='WH-3', total_qty=4, assigned_customer='', warehouse_status='Available'),
+            frappe._dict(warehouse='WH-4', total_qty=4, assigned_customer='CUST-A', warehouse_status='Available')
+        ]
+
+        with patch.object(frappe.db, 'sql', return_value=rows):
+            actions = {row.warehouse: row.action for row in get_inconsistent_warehouses('NEDLOG')}
+
+        self.assertEqual(actions, {'WH-1': 'release', 'WH-2': 'release', 'WH-3': 'assign', 'WH-4': 'reserve'})
+
+
+class TestRealtimePublisher(unittest.TestCase):
+
+    def test_change_queued_during_release_is_published(self):
+        """
+        Un changement arrivé pendant la libération du verrou est publié par le même job
+        """
+        drains = [{}, {'WH-1': ['Assignment']}, {}]
+        pending = [True, False]
+
+        with patch.object(realtime.time, 'sleep'), \
+                patch.object(realtime, 'drain_pending_changes', side_effect=lambda: drains.pop(0)), \
+                patch.object(realtime, 'build_changes', side_effect=lambda changes: sorted(changes)), \
+                patch.object(realtime, 'has_pending_changes', side_effect=lambda: pending.pop(0)), \
+                patch.object(realtime, 'acquire_publisher_flag', return_value=True), \
+                patch.object(realtime, 'release_publisher_flag') as release, \
+                patch.object(realtime, 'enqueue_snapshot_refresh'), \
+                patch('frappe.publish_realtime', create=True) as publish:
+            self.assertEqual(realtime.publish_warehouse_changes(), 1)
+
+        publish.assert_called_once_with(
+            realtime.REALTIME_EVENT, {'changes': ['WH-1']}, doctype='Warehouse', after_commit=False
+        )
+        self.assertEqual(release.call_count, 2)
+
+
+class TestReportSnapshot(unittest.TestCase):
+
+    def test_filters_applied_in_memory(self):
+        """
+        Les filtres du rapport s'appliquent aux lignes du snapshot sans requête
+        """
+        rows = [
+            {'warehouse': 'WH-1', 'assigned_customer': 'CUST-A', 'warehouse_status': 'Reserved', 'lft': 2},
+            {'warehouse': 'WH-2', 'assigned_customer': None, 'warehouse_status': 'Available', 'lft': 4},
+            {'warehouse': 'WH-3', 'assigned_customer': 'CUST-A', 'warehouse_status': 'Reserved', 'lft': 6}
+        ]
+
+        self.assertEqual(len(filter_warehouse_customer_status_rows(rows)), 3)
+        self.assertEqual(
+            [row['warehouse'] for row in filter_warehouse_customer_status_rows(rows, {'assigned_customer': 'CUST-A'})],
+            ['WH-1', 'WH-3']
+        )
+        self.assertEqual(
+            [row['warehouse'] for row in filter_warehouse_customer_status_rows(rows, {'warehouse_status': 'Available'})],
+            ['WH-2']
+        )
+
+
+
+class TestWarehouseGroupSummary(unittest.TestCase):
+
+    def summarize(self, groups, warehouses):
+        lists = {1: groups, 0: warehouses}
+
+        def get_list(doctype, filters=None, pluck=None, limit_page_length=None):
+            return lists[filters['is_group']]
+
+        with patch.object(frappe, 'has_permission', create=True), \
+                patch.object(frappe, 'get_list', side_effect=get_list, create=True), \
+                patch.object(reporting, 'get_rollup_window', return_value=(date(2026, 10, 18), date(2026, 10, 19))), \
+                patch.object(frappe.db, 'sql', return_value=[], create=True) as sql:
+            return reporting.get_warehouse_group_summary(days=30), sql
+
+    def test_only_permitted_warehouses_aggregated(self):
+        """
+        Seuls les groupes et entrepôts visibles par l'utilisateur sont agrégés
+        """
+        result, sql = self.summarize(['Stores - TC'], ['WH-1'])
+
+        values = sql.call_args.args[1]
+        self.assertEqual(values['groups'], ['Stores - TC'])
+        self.assertEqual(values['warehouses'], ['WH-1'])
+        self.assertEqual(values['rollup_to'], date(2026, 10, 18))
+
+        result, sql = self.summarize(['Stores - TC'], [])
+        self.assertEqual(result, [])
+        sql.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,429 @@
+import frappe
+import multiprocessing
+import statistics
+import time
+from typing import Dict, Any, List
+
+from .logging import log_warehouse_event, flush_log_buffer, LOG_DOCTYPE
+from .cache import STATE_CACHE_KEY, invalidate_warehouse_state
+from .counter import COUNTER_DOCTYPE
+from .calculation import get_warehouse_summaries
+from .status_update import (
+    STATUS_FIELDS,
+    update_warehouse_status,
+    queue_warehouse_status,
+    flush_warehouse_status_updates
+)
+from .validation import validate_warehouse_assignment, claim_warehouse, get_strict_violations
+
+BENCHMARK_TRANSACTION_TYPE = "Warehouse Control Benchmark"
+
+def _get_benchmark_warehouse() -> str:
+    warehouse = frappe.db.get_value("Warehouse", {"is_group": 0}, "name")
+    if not warehouse:
+        frappe.throw("A non-group Warehouse is required to run the benchmark")
+    return warehouse
+
+def _cleanup_benchmark_logs() -> None:
+    frappe.db.delete(LOG_DOCTYPE, {"transaction_type": BENCHMARK_TRANSACTION_TYPE})
+    frappe.db.commit()
+
+def _insert_log_per_event(warehouse: str, index: int) -> None:
+    """
+    Previous logging path: one document insert and one commit per event
+    """
+    frappe.get_doc({
+        "doctype": LOG_DOCTYPE,
+        "warehouse": warehouse,
+        "transaction_type": BENCHMARK_TRANSACTION_TYPE,
+        "transaction_name": f"BENCH-{index}",
+        "event_type": "Warning",
+        "user": frappe.session.user,
+        "timestamp": frappe.utils.now()
+    }).insert(ignore_permissions=True)
+    frappe.db.commit()
+
+def benchmark_log_writer(events: int = 1000) -> Dict[str, Any]:
+    """
+    Compare per-event insert+commit logging with the buffered bulk writer
+
+    Run with:
+        bench --site <site> execute custom_nedlog.warehouse_control.benchmark.benchmark_log_writer --kwargs "{'events': 1000}"
+
+    Args:
+        events: Number of events to log with each method
+
+    Returns:
+        Timings (seconds) and throughput (events per second) of both methods
+    """
+    events = int(events)
+    warehouse = _get_benchmark_warehouse()
+    _cleanup_benchmark_logs()
+
+    try:
+        start = time.perf_counter()
+        for index in range(events):
+            _insert_log_per_event(warehouse, index)
+        per_event = time.perf_counter() - start
+
+        _cleanup_benchmark_logs()
+
+        start = time.perf_counter()
+        for index in range(events):
+            log_warehouse_event(
+                warehouse=warehouse,
+                event_type="Warning",
+                transaction_type=BENCHMARK_TRANSACTION_TYPE,
+                transaction_name=f"BENCH-{index}"
+            )
+        frappe.db.commit()  # Flushes the buffer
+        buffered = time.perf_counter() - start
+
+        written = frappe.db.count(LOG_DOCTYPE, {"transaction_type": BENCHMARK_TRANSACTION_TYPE})
+
+    finally:
+        flush_log_buffer()
+        _cleanup_benchmark_logs()
+
+    return {
+        "events": events,
+        "per_event_seconds": round(per_event, 3),
+        "buffered_seconds": round(buffered, 3),
+        "per_event_throughput": round(events / per_event, 1) if per_event else None,
+        "buffered_throughput": round(events / buffered, 1) if buffered else None,
+        "buffered_rows_written": written,
+        "speedup": round(per_event / buffered, 1) if buffered else None
+    }
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent))]
+
+def _timing_stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2) if values else 0.0,
+        "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2) if values else 0.0
+    }
+
+def _status_update_worker(args) -> Dict[str, List[float]]:
+    """
+    Simulate `documents` submits, each updating the status of all `warehouses`
+
+    Lock hold time is measured from the first Warehouse write of a document
+    to the commit that releases its row locks.
+    """
+    site, sites_path, mode, warehouses, documents = args
+
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+
+    latencies = []
+    lock_holds = []
+
+    try:
+        for _document in range(documents):
+            start = time.perf_counter()
+
+            if mode == "immediate":
+                # Previous path: one set_value and one commit per warehouse
+                for warehouse in warehouses:
+                    write_start = time.perf_counter()
+                    update_warehouse_status(warehouse, status="Reserved", commit=True)
+                    lock_holds.append(time.perf_counter() - write_start)
+            else:
+                for warehouse in warehouses:
+                    queue_warehouse_status(warehouse, {"warehouse_status": "Reserved"})
+                write_start = time.perf_counter()
+                flush_warehouse_status_updates()
+                frappe.db.commit()
+                lock_holds.append(time.perf_counter() - write_start)
+
+            latencies.append(time.perf_counter() - start)
+    finally:
+        frappe.destroy()
+
+    return {"latencies": latencies, "lock_holds": lock_holds}
+
+def benchmark_status_updates(workers: int = 4, documents: int = 50, warehouses_per_document: int = 3) -> Dict[str, Any]:
+    """
+    Compare per-warehouse committed status updates with the deferred UPDATE ... CASE
+    flush, with several processes updating the same warehouses concurrently
+
+    Run with:
+        bench --site <site> execute custom_nedlog.warehouse_control.benchmark.benchmark_status_updates --kwargs "{'workers': 8}"
+
+    Args:
+        workers: Number of concurrent processes
+        documents: Simulated submits per process
+        warehouses_per_document: Warehouses updated by each submit (shared by all processes)
+
+    Returns:
+        Per-submit latency and lock hold time statistics of both modes
+    """
+    workers, documents = int(workers), int(documents)
+
+    warehouses = frappe.get_all(
+        "Warehouse",
+        filters={"is_group": 0},
+        fields=["name"] + STATUS_FIELDS,
+        limit=int(warehouses_per_document),
+        order_by="name"
+    )
+    if not warehouses:
+        frappe.throw("Non-group Warehouses are required to run the benchmark")
+
+    names = [row.name for row in warehouses]
+    site = frappe.local.site
+    sites_path = frappe.local.sites_path
+    results = {"workers": workers, "documents": documents, "warehouses": names}
+
+    # Spawned workers open their own database connections
+    context = multiprocessing.get_context("spawn")
+
+    try:
+        for mode in ("immediate", "deferred"):
+            start = time.perf_counter()
+            with context.Pool(workers) as pool:
+                runs = pool.map(
+                    _status_update_worker,
+                    [(site, sites_path, mode, names, documents)] * workers
+                )
+            elapsed = time.perf_counter() - start
+
+            latencies = [value for run in runs for value in run["latencies"]]
+            lock_holds = [value for run in runs for value in run["lock_holds"]]
+
+            results[mode] = {
+                "submits_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+                "latency": _timing_stats(latencies),
+                "lock_hold": _timing_stats(lock_holds)
+            }
+    finally:
+        # Restore the control fields touched by the benchmark
+        for row in warehouses:
+            frappe.db.set_value("Warehouse", row.name, {field: row[field] for field in STATUS_FIELDS})
+        frappe.db.commit()
+
+    return results
+
+def _assignment_worker(args) -> Dict[str, Any]:
+    """
+    Race the other workers to assign the stress-test warehouse, once per round
+
+    Follows the incoming handler: decide on the (possibly stale) summary,
+    compare-and-set, and decide again on the locked row after a conflict.
+    """
+    site, sites_path, warehouse, customer, rounds, barrier = args
+
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+
+    wins = []
+    latencies = []
+    doc = {"doctype": "Purchase Receipt", "name": f"STRESS-{customer}"}
+
+    try:
+        for round_no in range(rounds):
+            barrier.wait()
+            start = time.perf_counter()
+
+            # Each round stands for a new request
+            frappe.local.warehouse_control_states = {}
+
+            warehouse_info = get_warehouse_summaries([warehouse])[warehouse]
+            result = validate_warehouse_assignment(warehouse, customer, doc, warehouse_info=warehouse_info)
+            won = False
+
+            if result.get("action") == "assign":
+                result, warehouse_info = claim_warehouse(warehouse, customer, doc, result, warehouse_info)
+                won = result.get("action") == "assign"
+
+            frappe.db.commit()
+            latencies.append(time.perf_counter() - start)
+
+            if won:
+                wins.append(round_no)
+
+            # Wait for every worker, then let the first one reset the warehouse
+            if barrier.wait() == 0:
+                frappe.db.sql("""
+                    UPDATE `tabWarehouse`
+                    SET assigned_customer = NULL, warehouse_status = 'Available'
+                    WHERE name = %s
+                """, (warehouse,))
+                invalidate_warehouse_state([warehouse])
+                frappe.db.commit()
+            barrier.wait()
+    finally:
+        frappe.destroy()
+
+    return {"customer": customer, "wins": wins, "latencies": latencies}
+
+def stress_test_assignment(workers: int = 8, rounds: int = 50) -> Dict[str, Any]:
+    """
+    Several processes race to assign the same empty warehouse to different
+    customers; every round must have exactly one winner
+
+    Creates a temporary controlled warehouse, removed at the end. Run with:
+        bench --site <site> execute custom_nedlog.warehouse_control.benchmark.stress_test_assignment --kwargs "{'workers': 8, 'rounds': 50}"
+
+    Args:
+        workers: Number of concurrent processes
+        rounds: Number of races
+
+    Returns:
+        Correctness summary, assignment throughput and decision latency statistics
+    """
+    workers, rounds = int(workers), int(rounds)
+
+    company = frappe.defaults.get_user_default("Company") or frappe.db.get_value("Company", {}, "name")
+    if not company:
+        frappe.throw("A Company is required to run the stress test")
+
+    warehouse = frappe.get_doc({
+        "doctype": "Warehouse",
+        "warehouse_name": f"WC Stress {frappe.generate_hash(length=6)}",
+        "company": company,
+        "control_mode": "Warning"
+    }).insert(ignore_permissions=True).name
+    frappe.db.commit()
+
+    # Customers only need to be distinct values for the race
+    customers = [f"Stress Customer {index}" for index in range(workers)]
+    context = multiprocessing.get_context("spawn")
+
+    try:
+        with context.Manager() as manager:
+            barrier = manager.Barrier(workers)
+            start = time.perf_counter()
+            with context.Pool(workers) as pool:
+                runs = pool.map(
+                    _assignment_worker,
+                    [
+                        (frappe.local.site, frappe.local.sites_path, warehouse, customer, rounds, barrier)
+                        for customer in customers
+                    ]
+                )
+            elapsed = time.perf_counter() - start
+    finally:
+        frappe.delete_doc("Warehouse", warehouse, ignore_permissions=True, force=True)
+        frappe.db.commit()
+
+    winners_per_round = [0] * rounds
+    for run in runs:
+        for round_no in run["wins"]:
+            winners_per_round[round_no] += 1
+
+    latencies = [value for run in runs for value in run["latencies"]]
+
+    return {
+        "workers": workers,
+        "rounds": rounds,
+        "correct": all(count == 1 for count in winners_per_round),
+        "rounds_without_winner": winners_per_round.count(0),
+        "rounds_with_several_winners": sum(1 for count in winners_per_round if count > 1),
+        "wins_per_customer": {run["customer"]: len(run["wins"]) for run in runs},
+        "decisions_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "decision_latency": _timing_stats(latencies)
+    }
+
+def _time_strict_validation(doc, iterations: int, warehouses: List[str], cold: bool) -> List[float]:
+    timings = []
+    cache = frappe.cache()
+
+    for _iteration in range(iterations):
+        # Each iteration stands for a new request
+        frappe.local.warehouse_control_states = {}
+        if cold:
+            for warehouse in warehouses:
+                cache.hdel(STATE_CACHE_KEY, warehouse)
+
+        start = time.perf_counter()
+        get_strict_violations(doc)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+def benchmark_strict_validation(lines: int = 500, warehouses: int = 5, iterations: int = 50) -> Dict[str, Any]:
+    """
+    Measure the before_submit Strict check on a large in-memory Purchase Receipt
+
+    Creates temporary Strict warehouses assigned to a customer and holding
+    stock (counter rows), removed at the end. Run with:
+        bench --site <site> execute custom_nedlog.warehouse_control.benchmark.benchmark_strict_validation --kwargs "{'lines': 500}"
+
+    Args:
+        lines: Purchase Receipt rows, spread over the warehouses
+        warehouses: Number of Strict warehouses
+        iterations: Checks timed per scenario
+
+    Returns:
+        Check latency and per-line cost for an allowed and a blocked document,
+        with the warehouse state in Redis (warm) or read from the database (cold)
+    """
+    lines, iterations = int(lines), int(iterations)
+
+    company = frappe.defaults.get_user_default("Company") or frappe.db.get_value("Company", {}, "name")
+    if not company:
+        frappe.throw("A Company is required to run the benchmark")
+
+    suffix = frappe.generate_hash(length=6)
+    customer = f"Strict Bench Customer {suffix}"
+    names = []
+
+    try:
+        for index in range(int(warehouses)):
+            name = frappe.get_doc({
+                "doctype": "Warehouse",
+                "warehouse_name": f"WC Strict {suffix} {index}",
+                "company": company,
+                "control_mode": "Strict"
+            }).insert(ignore_permissions=True).name
+            names.append(name)
+
+            frappe.db.set_value("Warehouse", name, {"assigned_customer": customer, "warehouse_status": "Reserved"})
+            frappe.get_doc({
+                "doctype": COUNTER_DOCTYPE,
+                "warehouse": name,
+                "total_qty": 100,
+                "item_count": 1
+            }).insert(ignore_permissions=True)
+
+        invalidate_warehouse_state(names)
+        frappe.db.commit()
+
+        def make_receipt(supplier: str):
+            return frappe.get_doc({
+                "doctype": "Purchase Receipt",
+                "company": company,
+                "supplier": supplier,
+                "items": [
+                    {"item_code": "STRICT-BENCH", "qty": 1, "stock_qty": 1, "warehouse": names[index % len(names)]}
+                    for index in range(lines)
+                ]
+            })
+
+        results = {"lines": lines, "warehouses": len(names), "iterations": iterations}
+
+        for scenario, supplier in (("allowed", customer), ("blocked", f"Other {customer}")):
+            doc = make_receipt(supplier)
+
+            for cache_state in ("warm", "cold"):
+                timings = _time_strict_validation(doc, iterations, names, cold=cache_state == "cold")
+                median = statistics.median(timings)
+
+                results[f"{scenario}_{cache_state}"] = dict(
+                    _timing_stats(timings),
+                    per_line_us=round(median / lines * 1e6, 2)
+                )
+
+        return results
+
+    finally:
+        for name in names:
+            frappe.db.delete(COUNTER_DOCTYPE, {"name": name})
+            frappe.delete_doc("Warehouse", name, ignore_permissions=True, force=True)
+        frappe.db.commit()
@@ -0,0 +1,255 @@
+import frappe
+import redis
+from typing import Optional, Dict, Any, Iterable, List
+
+# Redis hash holding one control-state record per warehouse
+STATE_CACHE_KEY = "warehouse_control_state"
+
+STATE_FIELDS = ["control_mode", "assigned_customer", "warehouse_status", "last_assignment_date", "is_group"]
+
+# Redis hash of per-warehouse generations, bumped once a write commits or rolls
+# back; a cached state is only used while the generation it was read at is current
+STATE_GENERATION_KEY = "warehouse_control_state_generation"
+
+# Lifetime (seconds) of the state hash, set when it is created
+STATE_CACHE_TTL = 3600
+
+def _get_request_states() -> Dict[str, Optional[Dict[str, Any]]]:
+    if getattr(frappe.local, "warehouse_control_states", None) is None:
+        frappe.local.warehouse_control_states = {}
+    return frappe.local.warehouse_control_states
+
+def _get_dirty_warehouses() -> set:
+    """
+    Warehouses written by the current transaction: their state must not be
+    shared through Redis until the transaction ends
+    """
+    if getattr(frappe.local, "warehouse_control_dirty", None) is None:
+        frappe.local.warehouse_control_dirty = set()
+    return frappe.local.warehouse_control_dirty
+
+def get_state_generations(warehouses: List[str]) -> Dict[str, int]:
+    """
+    Current state generations of warehouses, in one HMGET
+    """
+    cache = frappe.cache()
+    # Raw read: the generations are plain integers written by HINCRBY
+    values = cache.hmget(cache.make_key(STATE_GENERATION_KEY), warehouses)
+    return {warehouse: int(value or 0) for warehouse, value in zip(warehouses, values)}
+
+def get_warehouse_states(warehouses: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Get the control state of several warehouses
+
+    Lookup order: current request, Redis, then one query for the remaining
+    warehouses (which are stored back in Redis unless written by the current
+    transaction).
+
+    Redis entries carry the generation read before the database: a state
+    read while a concurrent write committed is never stored, nor served if
+    the commit lands between the check and the store.
+
+    Args:
+        warehouses: Warehouse names
+
+    Returns:
+        Dictionary of warehouse name to its state (None for unknown warehouses)
+    """
+    request_states = _get_request_states()
+    dirty = _get_dirty_warehouses()
+    cache = frappe.cache()
+
+    states = {}
+    missing = []
+    lookup = []
+
+    for warehouse in {warehouse for warehouse in warehouses if warehouse}:
+        if warehouse in request_states:
+            states[warehouse] = request_states[warehouse]
+        else:
+            lookup.append(warehouse)
+
+    # Read before the database, so a write committed meanwhile invalidates the fill
+    generations = get_state_generations(lookup) if lookup else {}
+
+    for warehouse in lookup:
+        entry = None if warehouse in dirty else cache.hget(STATE_CACHE_KEY, warehouse)
+        if isinstance(entry, tuple) and entry[0] == generations[warehouse]:
+            states[warehouse] = request_states[warehouse] = entry[1]
+        else:
+            missing.append(warehouse)
+
+    if missing:
+        rows = frappe.db.sql(f"""
+            SELECT name, {', '.join(STATE_FIELDS)}
+            FROM `tabWarehouse`
+            WHERE name IN %(warehouses)s
+        """, {"warehouses": missing}, as_dict=1)
+        found = {row.pop("name"): row for row in rows}
+
+        for warehouse in missing:
+            states[warehouse] = request_states[warehouse] = found.get(warehouse)
+
+        fill = [warehouse for warehouse in missing if found.get(warehouse) is not None and warehouse not in dirty]
+        if fill:
+            store_warehouse_states({warehouse: found[warehouse] for warehouse in fill}, generations)
+
+    return states
+
+def store_warehouse_states(states: Dict[str, Dict[str, Any]], generations: Dict[str, int]) -> None:
+    """
+    Store states read from the database in Redis, skipping warehouses whose
+    generation moved since the read
+    """
+    cache = frappe.cache()
+    current = get_state_generations(list(states))
+
+    for warehouse, state in states.items():
+        if current[warehouse] == generations[warehouse]:
+            cache.hset(STATE_CACHE_KEY, warehouse, (generations[warehouse], state))
+
+    # The hash expires as a whole, so no entry outlives STATE_CACHE_TTL
+    key = cache.make_key(STATE_CACHE_KEY)
+    if cache.ttl(key) < 0:
+        cache.expire(key, STATE_CACHE_TTL)
+
+def get_warehouse_state(warehouse: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the control state of a warehouse (see get_warehouse_states)
+
+    Args:
+        warehouse: Warehouse name
+
+    Returns:
+        State dictionary or None if the warehouse does not exist
+    """
+    if not warehouse:
+        return None
+    return get_warehouse_states([warehouse]).get(warehouse)
+
+def clear_dirty_warehouse_states() -> None:
+    """
+    Drop the Redis state of warehouses written by the finished transaction,
+    and bump their generation so fills read before the commit are discarded
+    """
+    dirty = _get_dirty_warehouses()
+    cache = frappe.cache()
+    generation_key = cache.make_key(STATE_GENERATION_KEY)
+    for warehouse in dirty:
+        cache.hincrby(generation_key, warehouse, 1)
+        cache.hdel(STATE_CACHE_KEY, warehouse)
+    dirty.clear()
+
+def invalidate_warehouse_state(warehouses: Iterable[str]) -> None:
+    """
+    Invalidate the cached state of warehouses being written
+
+    The Redis entry is dropped now and again once the transaction commits or
+    rolls back, so other workers never keep a value read in between.
+
+    Args:
+        warehouses: Warehouse names
+    """
+    warehouses = [warehouse for warehouse in warehouses if warehouse]
+    if not warehouses:
+        return
+
+    request_states = _get_request_states()
+    dirty = _get_dirty_warehouses()
+
+    if not dirty:
+        frappe.db.after_commit.add(clear_dirty_warehouse_states)
+        frappe.db.after_rollback.add(clear_dirty_warehouse_states)
+
+    cache = frappe.cache()
+    for warehouse in warehouses:
+        request_states.pop(warehouse, None)
+        dirty.add(warehouse)
+        cache.hdel(STATE_CACHE_KEY, warehouse)
+
+    # Imported here: the index and realtime modules build on this one
+    from .index import mark_warehouse_index_dirty
+    from .realtime import mark_warehouse_changed
+    mark_warehouse_index_dirty(warehouses)
+    mark_warehouse_changed(warehouses)
+
+def on_warehouse_update(doc, method):
+    """
+    Warehouse on_update / on_trash hook
+    """
+    invalidate_warehouse_state([doc.name])
+
+    if method == "on_trash" or doc.has_value_changed("control_mode") or doc.has_value_changed("is_group"):
+        # Other processes must not reload the set before the change is committed
+        frappe.db.after_commit.add(bump_controlled_warehouses_version)
+
+# Redis key bumped whenever the set of controlled warehouses may have changed
+CONTROLLED_VERSION_KEY = "warehouse_control_controlled_version"
+
+# Redis hash of "<doctype>:<processed|skipped>" hook counters
+HOOK_STATS_KEY = "warehouse_control_hook_stats"
+
+CONTROLLED_MODES = ("Warning", "Strict")
+
+# Process-level copy of the controlled warehouses: site -> (version, warehouses)
+_controlled_warehouses: Dict[str, Any] = {}
+
+def get_controlled_warehouses() -> frozenset:
+    """
+    Names of the non-group warehouses with control enabled
+
+    Kept in process memory and reloaded only when the Redis version key
+    changes, so the check costs one cached Redis read per request.
+    """
+    cache = frappe.cache()
+    version = cache.get_value(CONTROLLED_VERSION_KEY)
+
+    if version is None:
+        version = frappe.generate_hash(length=10)
+        cache.set_value(CONTROLLED_VERSION_KEY, version)
+
+    cached = _controlled_warehouses.get(frappe.local.site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    warehouses = frozenset(frappe.get_all(
+        "Warehouse",
+        filters={"control_mode": ["in", CONTROLLED_MODES], "is_group": 0},
+        pluck="name"
+    ))
+    _controlled_warehouses[frappe.local.site] = (version, warehouses)
+
+    return warehouses
+
+def bump_controlled_warehouses_version() -> None:
+    """
+    Make every process reload its set of controlled warehouses
+    """
+    frappe.cache().set_value(CONTROLLED_VERSION_KEY, frappe.generate_hash(length=10))
+
+def increment_hook_stat(doctype: str, outcome: str) -> None:
+    """
+    Count a hook call for a doctype (outcome: processed or skipped)
+    """
+    cache = frappe.cache()
+    cache.hincrby(cache.make_key(HOOK_STATS_KEY), f"{doctype}:{outcome}", 1)
+
+def get_hook_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Processed and skipped document counts per doctype
+
+    Returns:
+        Dictionary of doctype to {"processed": n, "skipped": n}
+    """
+    cache = frappe.cache()
+    stats = {}
+
+    # Raw read: the counters are plain integers written by HINCRBY, which the
+    # wrapper's hgetall would prefix again and unpickle
+    counts = redis.Redis.hgetall(cache, cache.make_key(HOOK_STATS_KEY)) or {}
+
+    for field, count in counts.items():
+        doctype, outcome = frappe.safe_decode(field).rsplit(":", 1)
+        stats.setdefault(doctype, {"processed": 0, "skipped": 0})[outcome] = int(count)
+
+    return stats
@@ -1,9 +1,12 @@
 import frappe
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
+from .cache import get_warehouse_state, get_warehouse_states
+from .counter import get_counter, get_counters
 
 def get_total_qty(warehouse: str) -> float:
     """
-    Calculate total quantity in warehouse using Bin table (preferred) or SLE fallback
+    Calculate total quantity in warehouse using the stock counter (preferred),
+    the Bin table or SLE fallback; group warehouses sum their leaves
     
     Args:
         warehouse: Warehouse name
@@ -15,7 +18,16 @@ def get_total_qty(warehouse: str) -> float:
         return 0.0
         
     try:
-        # Primary method: Use Bin table for performance
+        state = get_warehouse_state(warehouse)
+        if state and state.get("is_group"):
+            return get_group_total_qty(warehouse)
+        
+        # Primary method: incrementally maintained counter (primary key read)
+        counter = get_counter(warehouse)
+        if counter:
+            return float(counter.total_qty or 0)
+        
+        # Secondary method: Use Bin table
         bins = frappe.get_all(
             "Bin", 
             filters={"warehouse": warehouse}, 
@@ -41,6 +53,44 @@ def get_total_qty(warehouse: str) -> float:
         frappe.log_error(f"Error calculating total qty for warehouse {warehouse}: {str(e)}", "Warehouse Control")
         return 0.0
 
+def get_group_total_qty(warehouse_group: str) -> float:
+    """
+    Total quantity of all leaf warehouses under a group warehouse
+    
+    One range join on the nested set (lft/rgt) and Bin, whatever the depth
+    and size of the group.
+    
+    Args:
+        warehouse_group: Group warehouse name
+        
+    Returns:
+        Total actual quantity under the group
+    """
+    result = frappe.db.sql("""
+        SELECT COALESCE(SUM(b.actual_qty), 0)
+        FROM `tabWarehouse` g
+        INNER JOIN `tabWarehouse` w ON w.lft > g.lft AND w.rgt < g.rgt
+        INNER JOIN `tabBin` b ON b.warehouse = w.name
+        WHERE g.name = %s
+    """, (warehouse_group,))
+    
+    return float(result[0][0]) if result else 0.0
+
+def build_warehouse_summary(warehouse: str, state: Dict[str, Any], total_qty: float, item_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build a warehouse summary from its cached control state and quantity
+    """
+    return {
+        "warehouse": warehouse,
+        "total_qty": total_qty,
+        "assigned_customer": state.get("assigned_customer"),
+        "warehouse_status": state.get("warehouse_status") or "Available",
+        "last_assignment_date": state.get("last_assignment_date"),
+        "control_mode": state.get("control_mode"),
+        "item_count": item_count,
+        "is_reserved": total_qty != 0
+    }
+
 def get_warehouse_summary(warehouse: str) -> Dict[str, Any]:
     """
     Get comprehensive warehouse information
@@ -52,18 +102,93 @@ def get_warehouse_summary(warehouse: str) -> Dict[str, Any]:
         Dictionary with warehouse details
     """
     try:
-        warehouse_doc = frappe.get_doc("Warehouse", warehouse)
-        total_qty = get_total_qty(warehouse)
-        
-        return {
-            "warehouse": warehouse,
-            "total_qty": total_qty,
-            "assigned_customer": getattr(warehouse_doc, "assigned_customer", None),
-            "warehouse_status": getattr(warehouse_doc, "warehouse_status", "Available"),
-            "last_assignment_date": getattr(warehouse_doc, "last_assignment_date", None),
-            "control_mode": getattr(warehouse_doc, "control_mode", "Warning"),
-            "is_reserved": total_qty != 0
-        }
+        state = get_warehouse_state(warehouse)
+        if state is None:
+            raise frappe.DoesNotExistError(f"Warehouse {warehouse} not found")
+        
+        return build_warehouse_summary(warehouse, state, get_total_qty(warehouse))
     except Exception as e:
         frappe.log_error(f"Error getting warehouse summary for {warehouse}: {str(e)}", "Warehouse Control")
         return {"warehouse": warehouse, "error": True}
+
+def get_locked_warehouse_summary(warehouse: str) -> Dict[str, Any]:
+    """
+    Re-read a warehouse with its row (and stock counter) locked until the
+    transaction ends, bypassing the caches
+    
+    Used to decide again after a concurrent transaction changed the warehouse.
+    
+    Args:
+        warehouse: Warehouse name
+        
+    Returns:
+        Dictionary with warehouse details
+    """
+    try:
+        rows = frappe.db.sql("""
+            SELECT 
+                w.assigned_customer,
+                w.warehouse_status,
+                w.last_assignment_date,
+                w.control_mode,
+                w.is_group,
+                c.total_qty,
+                c.item_count
+            FROM `tabWarehouse` w
+            LEFT JOIN `tabWarehouse Stock Counter` c ON c.name = w.name
+            WHERE w.name = %s
+            FOR UPDATE
+        """, (warehouse,), as_dict=1)
+        
+        if not rows:
+            raise frappe.DoesNotExistError(f"Warehouse {warehouse} not found")
+        
+        row = rows[0]
+        if row.total_qty is None:
+            return build_warehouse_summary(warehouse, row, get_total_qty(warehouse))
+        return build_warehouse_summary(warehouse, row, float(row.total_qty), row.item_count)
+    except Exception as e:
+        frappe.log_error(f"Error getting locked warehouse summary for {warehouse}: {str(e)}", "Warehouse Control")
+        return {"warehouse": warehouse, "error": True}
+
+def get_warehouse_summaries(warehouses: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Get warehouse information for several warehouses at once
+    
+    Control fields come from the state cache and quantities from one read of
+    the stock counters; warehouses without a counter yet fall back to get_total_qty.
+    
+    Args:
+        warehouses: Warehouse names
+        
+    Returns:
+        Dictionary of warehouse name to the same summary as get_warehouse_summary
+    """
+    warehouses = list({warehouse for warehouse in warehouses if warehouse})
+    if not warehouses:
+        return {}
+    
+    try:
+        states = get_warehouse_states(warehouses)
+        counters = get_counters([warehouse for warehouse in warehouses if states.get(warehouse)])
+    except Exception as e:
+        frappe.log_error(f"Error getting warehouse summaries: {str(e)}", "Warehouse Control")
+        return {warehouse: {"warehouse": warehouse, "error": True} for warehouse in warehouses}
+    
+    summaries = {}
+    for warehouse in warehouses:
+        state = states.get(warehouse)
+        if state is None:
+            # Unknown warehouses are reported like get_warehouse_summary does
+            summaries[warehouse] = {"warehouse": warehouse, "error": True}
+            continue
+        
+        counter = counters.get(warehouse)
+        if counter:
+            summaries[warehouse] = build_warehouse_summary(
+                warehouse, state, float(counter.total_qty or 0), counter.item_count
+            )
+        else:
+            summaries[warehouse] = build_warehouse_summary(warehouse, state, get_total_qty(warehouse))
+    
+    return summaries
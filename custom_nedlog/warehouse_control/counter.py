@@ -0,0 +1,308 @@
+import frappe
+from frappe.utils import flt, now
+from typing import Optional, Dict, Any, Iterable, List
+
+from .index import mark_warehouse_index_dirty
+from .realtime import mark_warehouse_changed
+
+COUNTER_DOCTYPE = "Warehouse Stock Counter"
+
+def get_previous_item_qty(sle: Dict[str, Any]) -> float:
+    """
+    Item quantity in the warehouse just before a posting (indexed lookup, only
+    needed for Stock Reconciliation entries that carry no actual_qty)
+    """
+    previous = frappe.db.sql("""
+        SELECT qty_after_transaction
+        FROM `tabStock Ledger Entry`
+        WHERE item_code = %(item_code)s
+        AND warehouse = %(warehouse)s
+        AND is_cancelled = 0
+        AND docstatus = 1
+        AND (
+            posting_datetime < %(posting_datetime)s
+            OR (posting_datetime = %(posting_datetime)s AND creation < %(creation)s)
+        )
+        ORDER BY posting_datetime DESC, creation DESC
+        LIMIT 1
+    """, sle)
+    return flt(previous[0][0]) if previous else 0.0
+
+def is_target_qty_posting(sle: Dict[str, Any]) -> bool:
+    """
+    Stock Reconciliation posts the target quantity instead of a movement
+    """
+    return (
+        sle.get("voucher_type") == "Stock Reconciliation"
+        and not flt(sle.get("actual_qty"))
+        and not sle.get("is_cancelled")
+    )
+
+def get_counter_delta(sle: Dict[str, Any], bin_qty: float, previous_qty: Optional[float] = None) -> Dict[str, float]:
+    """
+    Compute the counter change caused by one Stock Ledger Entry
+
+    Args:
+        sle: Stock Ledger Entry (actual_qty, qty_after_transaction, voucher_type)
+        bin_qty: Item quantity in the warehouse before this posting (Bin actual_qty)
+        previous_qty: Item quantity at the posting date and time, before this
+            entry (see get_previous_item_qty); differs from bin_qty for
+            backdated Stock Reconciliations
+
+    Returns:
+        Dictionary with total_qty and item_count deltas
+    """
+    qty_change = flt(sle.get("actual_qty"))
+
+    if is_target_qty_posting(sle):
+        qty_change = flt(sle.get("qty_after_transaction")) - flt(bin_qty if previous_qty is None else previous_qty)
+
+    qty_before = flt(bin_qty)
+    qty_after = qty_before + qty_change
+
+    return {
+        "total_qty": qty_change,
+        "item_count": int(bool(qty_after)) - int(bool(qty_before))
+    }
+
+def ensure_counter(warehouse: str) -> None:
+    """
+    Create the counter of a warehouse, seeded from its current Bin rows and
+    its latest stock ledger posting
+
+    Args:
+        warehouse: Warehouse name
+    """
+    if frappe.db.exists(COUNTER_DOCTYPE, warehouse):
+        return
+
+    timestamp = now()
+
+    # INSERT IGNORE: a concurrent posting may have created the counter meanwhile
+    frappe.db.sql("""
+        INSERT IGNORE INTO `tabWarehouse Stock Counter`
+            (name, warehouse, total_qty, item_count, last_movement_date,
+            creation, modified, owner, modified_by, docstatus)
+        SELECT
+            %(warehouse)s, %(warehouse)s,
+            COALESCE(SUM(actual_qty), 0),
+            COALESCE(SUM(actual_qty != 0), 0),
+            (
+                SELECT MAX(posting_date)
+                FROM `tabStock Ledger Entry`
+                WHERE warehouse = %(warehouse)s
+                AND is_cancelled = 0
+                AND docstatus = 1
+            ),
+            %(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0
+        FROM `tabBin`
+        WHERE warehouse = %(warehouse)s
+    """, {"warehouse": warehouse, "timestamp": timestamp, "user": frappe.session.user})
+
+def update_warehouse_counter(doc, method):
+    """
+    Stock Ledger Entry on_submit hook: apply the posting to the warehouse counter
+
+    Runs in the posting transaction, before ERPNext updates the Bin, so the Bin
+    still holds the quantity before this entry. Cancellations post reversing
+    entries and are applied the same way; they do not move the last movement
+    date back.
+    """
+    if not doc.warehouse:
+        return
+
+    try:
+        bin_qty = frappe.db.get_value(
+            "Bin", {"item_code": doc.item_code, "warehouse": doc.warehouse}, "actual_qty"
+        ) or 0
+
+        sle = doc.as_dict()
+        previous_qty = get_previous_item_qty(sle) if is_target_qty_posting(sle) else None
+
+        delta = get_counter_delta(sle, bin_qty, previous_qty)
+        movement_date = None if doc.is_cancelled else doc.posting_date
+        
+        if not delta["total_qty"] and not delta["item_count"] and not movement_date:
+            return
+
+        ensure_counter(doc.warehouse)
+
+        # Relative update: concurrent postings to the same warehouse serialize on the row lock
+        frappe.db.sql("""
+            UPDATE `tabWarehouse Stock Counter`
+            SET total_qty = total_qty + %(total_qty)s,
+                item_count = item_count + %(item_count)s,
+                last_movement_date = GREATEST(
+                    COALESCE(last_movement_date, %(movement_date)s),
+                    COALESCE(%(movement_date)s, last_movement_date)
+                ),
+                modified = %(modified)s
+            WHERE name = %(warehouse)s
+        """, {
+            "total_qty": delta["total_qty"],
+            "item_count": delta["item_count"],
+            "movement_date": movement_date,
+            "modified": now(),
+            "warehouse": doc.warehouse
+        })
+
+        if delta["total_qty"]:
+            # Stock entering or leaving may free the warehouse and changes what dashboards show
+            mark_warehouse_index_dirty([doc.warehouse])
+            mark_warehouse_changed([doc.warehouse])
+
+    except Exception as e:
+        frappe.log_error(f"Error updating stock counter for warehouse {doc.warehouse}: {str(e)}", "Warehouse Control")
+        enqueue_counter_reconciliation(doc.warehouse)
+
+def enqueue_counter_reconciliation(warehouse: str) -> None:
+    """
+    Reset a counter from Bin once the posting commits, after a failed update
+    """
+    try:
+        frappe.enqueue(
+            "custom_nedlog.warehouse_control.counter.reconcile_warehouse_counters",
+            queue="short",
+            job_id=f"warehouse_counter_reconciliation::{warehouse}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            warehouses=[warehouse],
+            fix=True
+        )
+    except Exception as e:
+        # The daily reconciliation still picks the drift up
+        frappe.log_error(f"Error queuing stock counter reconciliation for {warehouse}: {str(e)}", "Warehouse Control")
+
+def get_counter(warehouse: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the counter of a warehouse (primary key lookup)
+
+    Args:
+        warehouse: Warehouse name
+
+    Returns:
+        Dictionary with total_qty and item_count, or None if no counter exists yet
+    """
+    return frappe.db.get_value(
+        COUNTER_DOCTYPE, warehouse, ["total_qty", "item_count"], as_dict=True
+    )
+
+def get_counters(warehouses: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the counters of several warehouses in one query
+
+    Args:
+        warehouses: Warehouse names
+
+    Returns:
+        Dictionary of warehouse name to total_qty and item_count (warehouses
+        without a counter are left out)
+    """
+    warehouses = list(warehouses)
+    if not warehouses:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT name, total_qty, item_count
+        FROM `tabWarehouse Stock Counter`
+        WHERE name IN %(warehouses)s
+    """, {"warehouses": warehouses}, as_dict=1)
+
+    return {row.pop("name"): row for row in rows}
+
+def get_counter_drift(warehouses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Compare counters with the Bin totals they mirror
+
+    Args:
+        warehouses: Warehouses to check (all warehouses with bins or counters if None)
+
+    Returns:
+        List of warehouses whose counter is missing or differs from the Bin totals
+    """
+    conditions = ""
+    values = {}
+
+    if warehouses is not None:
+        warehouses = list(warehouses)
+        if not warehouses:
+            return []
+        conditions = "WHERE w.name IN %(warehouses)s"
+        values["warehouses"] = warehouses
+
+    return frappe.db.sql(f"""
+        SELECT
+            w.name as warehouse,
+            c.total_qty as counter_qty,
+            c.item_count as counter_item_count,
+            COALESCE(b.total_qty, 0) as bin_qty,
+            COALESCE(b.item_count, 0) as bin_item_count,
+            COALESCE(b.bin_count, 0) as bin_count
+        FROM `tabWarehouse` w
+        LEFT JOIN `tabWarehouse Stock Counter` c ON c.name = w.name
+        LEFT JOIN (
+            SELECT warehouse, SUM(actual_qty) as total_qty, SUM(actual_qty != 0) as item_count, COUNT(*) as bin_count
+            FROM `tabBin`
+            GROUP BY warehouse
+        ) b ON b.warehouse = w.name
+        {conditions}
+        HAVING
+            (counter_qty IS NULL AND bin_count > 0)
+            OR counter_qty != bin_qty
+            OR counter_item_count != bin_item_count
+        ORDER BY w.name
+    """, values, as_dict=1)
+
+def reconcile_warehouse_counters(warehouses: Optional[Iterable[str]] = None, fix: bool = False) -> List[Dict[str, Any]]:
+    """
+    Detect counter drift and optionally reset drifted counters from Bin
+
+    Args:
+        warehouses: Warehouses to check (all if None)
+        fix: Whether to overwrite drifted counters with the Bin totals
+
+    Returns:
+        List of drifted warehouses (before fixing)
+    """
+    drift = get_counter_drift(warehouses)
+
+    if fix and drift:
+        timestamp = now()
+
+        for row in drift:
+            ensure_counter(row.warehouse)
+            frappe.db.sql("""
+                UPDATE `tabWarehouse Stock Counter`
+                SET total_qty = %(total_qty)s,
+                    item_count = %(item_count)s,
+                    last_movement_date = (
+                        SELECT MAX(posting_date)
+                        FROM `tabStock Ledger Entry`
+                        WHERE warehouse = %(warehouse)s
+                        AND is_cancelled = 0
+                        AND docstatus = 1
+                    ),
+                    modified = %(modified)s
+                WHERE name = %(warehouse)s
+            """, {
+                "total_qty": row.bin_qty,
+                "item_count": row.bin_item_count,
+                "modified": timestamp,
+                "warehouse": row.warehouse
+            })
+
+        frappe.db.commit()
+
+    return drift
+
+def reconcile_all_warehouse_counters() -> None:
+    """
+    Daily scheduler job: reset drifted counters from Bin and record the drift
+    """
+    drift = reconcile_warehouse_counters(fix=True)
+
+    if drift:
+        frappe.log_error(
+            f"Reset {len(drift)} drifted stock counters: {', '.join(row.warehouse for row in drift[:50])}",
+            "Warehouse Control"
+        )
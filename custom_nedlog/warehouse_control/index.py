@@ -0,0 +1,235 @@
+import frappe
+from frappe.utils import cint, flt
+from typing import Optional, Dict, Any, Iterable, List
+
+from .cache import CONTROLLED_VERSION_KEY, get_controlled_warehouses
+
+# Redis sets of the free (controlled, Available, unassigned and empty) warehouses, per company
+FREE_INDEX_KEY = "warehouse_control_free"
+
+# Redis sets of the warehouses assigned to a customer, per company and customer
+CUSTOMER_INDEX_KEY = "warehouse_control_customer"
+
+# Redis hash of warehouse -> index membership ({"company", "customer", "free"}),
+# used to remove a warehouse from the sets it was in
+MEMBERSHIP_KEY = "warehouse_control_index_membership"
+
+# Controlled warehouses version the index was built for
+INDEX_VERSION_KEY = "warehouse_control_index_version"
+
+MAX_CANDIDATES = 50
+
+def get_free_key(company: str) -> str:
+    return f"{FREE_INDEX_KEY}::{company}"
+
+def get_customer_key(company: str, customer: str) -> str:
+    return f"{CUSTOMER_INDEX_KEY}::{company}::{customer}"
+
+def get_index_rows(warehouses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Committed control state and stock of controlled warehouses
+
+    Args:
+        warehouses: Warehouses to read (all controlled warehouses if None)
+    """
+    conditions = ""
+    values = {}
+
+    if warehouses is not None:
+        conditions = "AND w.name IN %(warehouses)s"
+        values["warehouses"] = warehouses
+
+    return frappe.db.sql(f"""
+        SELECT
+            w.name as warehouse,
+            w.company,
+            w.assigned_customer,
+            w.warehouse_status,
+            COALESCE(c.total_qty, 0) as total_qty
+        FROM `tabWarehouse` w
+        LEFT JOIN `tabWarehouse Stock Counter` c ON c.name = w.name
+        WHERE w.control_mode IN ('Warning', 'Strict')
+        AND w.is_group = 0
+        {conditions}
+    """, values, as_dict=1)
+
+def get_membership(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Index sets a warehouse belongs to, given its state
+    """
+    return {
+        "company": row.company,
+        "customer": row.assigned_customer or None,
+        "free": bool(
+            not row.assigned_customer
+            and (row.warehouse_status or "Available") == "Available"
+            and not flt(row.total_qty)
+        )
+    }
+
+def drop_membership(warehouse: str, membership: Optional[Dict[str, Any]]) -> None:
+    """
+    Remove a warehouse from the index sets it was in
+    """
+    if not membership:
+        return
+
+    cache = frappe.cache()
+    if membership["free"]:
+        cache.srem(get_free_key(membership["company"]), warehouse)
+    if membership["customer"]:
+        cache.srem(get_customer_key(membership["company"], membership["customer"]), warehouse)
+
+def add_membership(warehouse: str, membership: Dict[str, Any]) -> None:
+    """
+    Add a warehouse to its index sets
+    """
+    cache = frappe.cache()
+    if membership["free"]:
+        cache.sadd(get_free_key(membership["company"]), warehouse)
+    if membership["customer"]:
+        cache.sadd(get_customer_key(membership["company"], membership["customer"]), warehouse)
+    cache.hset(MEMBERSHIP_KEY, warehouse, membership)
+
+def rebuild_warehouse_index() -> int:
+    """
+    Rebuild the free-list and customer index from the Warehouse table
+
+    Returns:
+        Number of controlled warehouses indexed
+    """
+    cache = frappe.cache()
+    version = get_controlled_version()
+
+    for key in cache.hkeys(MEMBERSHIP_KEY) or []:
+        warehouse = frappe.safe_decode(key)
+        drop_membership(warehouse, cache.hget(MEMBERSHIP_KEY, warehouse))
+        cache.hdel(MEMBERSHIP_KEY, warehouse)
+
+    rows = get_index_rows()
+    for row in rows:
+        add_membership(row.warehouse, get_membership(row))
+
+    cache.set_value(INDEX_VERSION_KEY, version)
+
+    return len(rows)
+
+def get_controlled_version() -> str:
+    # get_controlled_warehouses creates the version key when missing
+    get_controlled_warehouses()
+    return frappe.cache().get_value(CONTROLLED_VERSION_KEY)
+
+def is_index_current() -> bool:
+    return frappe.cache().get_value(INDEX_VERSION_KEY) == get_controlled_version()
+
+def ensure_warehouse_index() -> None:
+    """
+    Rebuild the index when missing or built for another set of controlled warehouses
+    """
+    if not is_index_current():
+        rebuild_warehouse_index()
+
+def sync_warehouse_index(warehouses: Iterable[str]) -> None:
+    """
+    Move warehouses to the index sets matching their committed state
+
+    One primary key query for the warehouses; warehouses no longer controlled
+    (or deleted) are dropped from the index.
+
+    Args:
+        warehouses: Warehouse names
+    """
+    warehouses = list(warehouses)
+    if not warehouses or not is_index_current():
+        # A stale index is rebuilt as a whole on its next read
+        return
+
+    cache = frappe.cache()
+    rows = {row.warehouse: row for row in get_index_rows(warehouses)}
+
+    for warehouse in warehouses:
+        previous = cache.hget(MEMBERSHIP_KEY, warehouse)
+        row = rows.get(warehouse)
+        membership = get_membership(row) if row else None
+
+        if membership == previous:
+            continue
+
+        drop_membership(warehouse, previous)
+        if membership:
+            add_membership(warehouse, membership)
+        else:
+            cache.hdel(MEMBERSHIP_KEY, warehouse)
+
+def _get_pending_warehouses() -> set:
+    if getattr(frappe.local, "warehouse_index_pending", None) is None:
+        frappe.local.warehouse_index_pending = set()
+    return frappe.local.warehouse_index_pending
+
+def sync_pending_warehouses() -> None:
+    pending = _get_pending_warehouses()
+    warehouses = list(pending)
+    pending.clear()
+
+    try:
+        sync_warehouse_index(warehouses)
+    except Exception as e:
+        # The index is advisory: a failed sync must not break the committed transaction
+        frappe.cache().delete_value(INDEX_VERSION_KEY)
+        frappe.log_error(f"Error syncing warehouse index: {str(e)}", "Warehouse Control")
+
+def clear_pending_warehouses() -> None:
+    _get_pending_warehouses().clear()
+
+def mark_warehouse_index_dirty(warehouses: Iterable[str]) -> None:
+    """
+    Re-index warehouses once the current transaction commits
+
+    Args:
+        warehouses: Warehouse names whose state or stock is being written
+    """
+    pending = _get_pending_warehouses()
+
+    if not pending:
+        frappe.db.after_commit.add(sync_pending_warehouses)
+        frappe.db.after_rollback.add(clear_pending_warehouses)
+
+    pending.update(warehouse for warehouse in warehouses if warehouse)
+
+@frappe.whitelist()
+def get_putaway_candidates(company: str = None, customer: str = None, limit: int = 10) -> Dict[str, Any]:
+    """
+    Candidate warehouses for receiving stock, read from the Redis index
+
+    Args:
+        company: Company of the warehouses (user default company if not given)
+        customer: Also return the warehouses already assigned to this customer
+        limit: Maximum number of free warehouses returned (max MAX_CANDIDATES)
+
+    Returns:
+        Dictionary with the customer's warehouses and a sample of free warehouses
+    """
+    frappe.has_permission("Warehouse", "read", throw=True)
+
+    company = company or frappe.defaults.get_user_default("Company")
+    if not company:
+        frappe.throw("Company is required")
+
+    limit = min(max(cint(limit), 1), MAX_CANDIDATES)
+
+    ensure_warehouse_index()
+    cache = frappe.cache()
+
+    # Random members spread concurrent receipts over the free warehouses
+    free = cache.srandmember(get_free_key(company), limit) or []
+
+    assigned = []
+    if customer:
+        assigned = cache.smembers(get_customer_key(company, customer)) or []
+
+    return {
+        "company": company,
+        "customer": customer,
+        "assigned": sorted(frappe.safe_decode(warehouse) for warehouse in assigned),
+        "free": sorted(frappe.safe_decode(warehouse) for warehouse in free)
+    }
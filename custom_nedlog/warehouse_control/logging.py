@@ -1,5 +1,76 @@
 import frappe
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from .realtime import mark_warehouse_changed
+
+LOG_DOCTYPE = "Warehouse Control Log"
+
+LOG_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by", "docstatus",
+    "warehouse", "previous_customer", "new_customer", "transaction_type", "transaction_name",
+    "event_type", "total_qty_before", "total_qty_after", "user", "timestamp"
+]
+
+def get_log_buffer() -> List[Dict[str, Any]]:
+    """
+    Pending log rows of the current transaction
+    
+    The buffer is flushed right before the transaction commits and dropped
+    on rollback, so logs are written atomically with the document that caused them.
+    """
+    if getattr(frappe.local, "warehouse_control_log_buffer", None) is None:
+        frappe.local.warehouse_control_log_buffer = []
+    return frappe.local.warehouse_control_log_buffer
+
+def clear_log_buffer() -> None:
+    """
+    Drop pending log rows (transaction rolled back)
+    """
+    frappe.local.warehouse_control_log_buffer = []
+
+def flush_log_buffer() -> int:
+    """
+    Write all pending log rows with one multi-row insert
+    
+    A failed insert is raised: run before commit, it aborts the commit so
+    the transaction rolls back with the state changes the events describe
+    (and a replay chunk with its checkpoint) instead of committing without them.
+    
+    Returns:
+        Number of rows written
+    """
+    rows = get_log_buffer()
+    if not rows:
+        return 0
+    
+    clear_log_buffer()
+    
+    try:
+        frappe.db.bulk_insert(
+            LOG_DOCTYPE,
+            fields=LOG_FIELDS,
+            values=[[row[field] for field in LOG_FIELDS] for row in rows]
+        )
+    except Exception as e:
+        # Not an Error Log: it would be rolled back with the transaction
+        frappe.logger().error(f"Failed to flush {len(rows)} warehouse events: {str(e)}")
+        raise
+    
+    return len(rows)
+
+def buffer_log_row(row: Dict[str, Any]) -> None:
+    """
+    Add a log row to the buffer, registering the commit/rollback callbacks
+    on the first row of the transaction
+    """
+    buffer = get_log_buffer()
+    
+    if not buffer:
+        frappe.db.before_commit.add(flush_log_buffer)
+        frappe.db.after_rollback.add(clear_log_buffer)
+    
+    buffer.append(row)
+    mark_warehouse_changed([row["warehouse"]], event_type=row["event_type"])
 
 def log_warehouse_event(
     warehouse: str,
@@ -11,11 +82,15 @@ def log_warehouse_event(
     qty_before: float = 0.0,
     qty_after: float = 0.0,
     user: Optional[str] = None,
-    additional_data: Optional[Dict[str, Any]] = None
+    additional_data: Optional[Dict[str, Any]] = None,
+    timestamp: Optional[Any] = None
 ) -> bool:
     """
     Log warehouse control event
     
+    The event is buffered and written with the other events of the
+    transaction when it commits (see flush_log_buffer).
+    
     Args:
         warehouse: Warehouse name
         event_type: Assignment/Warning/Release
@@ -27,6 +102,7 @@ def log_warehouse_event(
         qty_after: Quantity after transaction
         user: User performing action
         additional_data: Extra data to log
+        timestamp: When the event happened (now by default)
         
     Returns:
         Success status
@@ -35,8 +111,15 @@ def log_warehouse_event(
         if not user:
             user = frappe.session.user
             
-        log_doc = frappe.get_doc({
-            "doctype": "Warehouse Control Log",
+        created = frappe.utils.now()
+        
+        buffer_log_row({
+            "name": frappe.generate_hash(length=10),
+            "creation": created,
+            "modified": created,
+            "owner": user,
+            "modified_by": user,
+            "docstatus": 0,
             "warehouse": warehouse,
             "previous_customer": prev_customer,
             "new_customer": new_customer,
@@ -46,12 +129,9 @@ def log_warehouse_event(
             "total_qty_before": float(qty_before),
             "total_qty_after": float(qty_after),
             "user": user,
-            "timestamp": frappe.utils.now()
+            "timestamp": timestamp or created
         })
         
-        log_doc.insert(ignore_permissions=True)
-        frappe.db.commit()  # Ensure log is saved immediately
-        
         return True
         
     except Exception as e:
@@ -0,0 +1,209 @@
+import frappe
+import time
+from typing import Optional, Dict, Any, Iterable, List
+
+from .reporting import enqueue_snapshot_refresh
+
+# Realtime event received by the dashboards
+REALTIME_EVENT = "warehouse_control_update"
+
+# Redis set of the warehouses changed since the last publish
+PENDING_WAREHOUSES_KEY = "warehouse_control_realtime_pending"
+
+# Redis set of the "<warehouse>::<event_type>" events logged since the last publish
+PENDING_EVENTS_KEY = "warehouse_control_realtime_events"
+
+# Changes committed within this window are sent as one message
+COALESCE_WINDOW_SECONDS = 1
+
+# Coalescing rounds of one publisher job before it gives the worker back
+MAX_PUBLISH_ROUNDS = 30
+
+# Redis flag held while a publisher job is queued or running
+PUBLISHER_FLAG_KEY = "warehouse_control_realtime_publisher"
+
+# Lifetime (seconds) of the flag, so a crashed publisher does not block the next one
+PUBLISHER_FLAG_TTL = 300
+
+def _get_changed_warehouses() -> Dict[str, set]:
+    """
+    Warehouses changed by the current transaction, with their logged event types
+    """
+    if getattr(frappe.local, "warehouse_control_changed", None) is None:
+        frappe.local.warehouse_control_changed = {}
+    return frappe.local.warehouse_control_changed
+
+def clear_changed_warehouses() -> None:
+    frappe.local.warehouse_control_changed = {}
+
+def mark_warehouse_changed(warehouses: Iterable[str], event_type: Optional[str] = None) -> None:
+    """
+    Announce warehouses to the dashboards once the current transaction commits
+
+    Args:
+        warehouses: Warehouse names whose state is written or an event logged
+        event_type: Logged event (Assignment/Warning/Release), if any
+    """
+    changed = _get_changed_warehouses()
+
+    if not changed:
+        frappe.db.after_commit.add(queue_committed_changes)
+        frappe.db.after_rollback.add(clear_changed_warehouses)
+
+    for warehouse in warehouses:
+        if not warehouse:
+            continue
+        events = changed.setdefault(warehouse, set())
+        if event_type:
+            events.add(event_type)
+
+def queue_committed_changes() -> None:
+    """
+    Hand the committed changes over to the publisher job
+
+    Changes of all processes meet in Redis; a publisher job is only
+    enqueued by the process that takes the publisher flag, so a burst of
+    submits starts a single job.
+    """
+    changed = _get_changed_warehouses()
+    clear_changed_warehouses()
+    if not changed:
+        return
+
+    try:
+        cache = frappe.cache()
+        cache.sadd(PENDING_WAREHOUSES_KEY, *changed)
+
+        events = [f"{warehouse}::{event_type}" for warehouse, event_types in changed.items() for event_type in event_types]
+        if events:
+            cache.sadd(PENDING_EVENTS_KEY, *events)
+
+        if acquire_publisher_flag():
+            enqueue_publisher()
+    except Exception as e:
+        # Dashboards only miss a push: never fail the committed transaction
+        frappe.log_error(f"Error queuing warehouse realtime changes: {str(e)}", "Warehouse Control")
+
+def acquire_publisher_flag() -> bool:
+    cache = frappe.cache()
+    return bool(cache.set(cache.make_key(PUBLISHER_FLAG_KEY), 1, nx=True, ex=PUBLISHER_FLAG_TTL))
+
+def release_publisher_flag() -> None:
+    frappe.cache().delete_value(PUBLISHER_FLAG_KEY)
+
+def has_pending_changes() -> bool:
+    # Every pending event comes with its warehouse
+    return bool(frappe.cache().srandmember(PENDING_WAREHOUSES_KEY))
+
+def enqueue_publisher() -> None:
+    frappe.enqueue(
+        "custom_nedlog.warehouse_control.realtime.publish_warehouse_changes",
+        queue="short"
+    )
+
+def _drain_set(key: str) -> List[str]:
+    # Only the members read are removed: members added meanwhile wait for the next round
+    cache = frappe.cache()
+    members = list(cache.smembers(key) or [])
+    if members:
+        cache.srem(key, *members)
+    return [frappe.safe_decode(member) for member in members]
+
+def drain_pending_changes() -> Dict[str, List[str]]:
+    """
+    Take the pending warehouses and events out of Redis
+
+    Returns:
+        Warehouse name to the event types logged since the last publish
+    """
+    changes = {warehouse: [] for warehouse in _drain_set(PENDING_WAREHOUSES_KEY)}
+
+    for event in _drain_set(PENDING_EVENTS_KEY):
+        warehouse, event_type = event.rsplit("::", 1)
+        changes.setdefault(warehouse, []).append(event_type)
+
+    return changes
+
+def build_changes(changes: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """
+    Compact change records: the committed control fields and stock of each
+    warehouse, with the event types logged since the last message
+
+    Args:
+        changes: Warehouse name to logged event types
+
+    Returns:
+        One record per warehouse (deleted warehouses have "deleted": 1)
+    """
+    if not changes:
+        return []
+
+    rows = frappe.db.sql("""
+        SELECT
+            w.name as warehouse,
+            w.assigned_customer,
+            w.warehouse_status,
+            w.last_assignment_date,
+            COALESCE(c.total_qty, 0) as total_quantity,
+            c.last_movement_date
+        FROM `tabWarehouse` w
+        LEFT JOIN `tabWarehouse Stock Counter` c ON c.name = w.name
+        WHERE w.name IN %(warehouses)s
+    """, {"warehouses": list(changes)}, as_dict=1)
+    found = {row.warehouse: row for row in rows}
+
+    records = []
+    for warehouse, events in sorted(changes.items()):
+        record = found.get(warehouse) or {"warehouse": warehouse, "deleted": 1}
+        if events:
+            record["events"] = sorted(events)
+        records.append(record)
+
+    return records
+
+def publish_warehouse_changes() -> int:
+    """
+    Background job: publish the pending changes, one message per coalescing window
+
+    Each warehouse appears once per message, whatever the number of submits
+    that touched it during the window. Messages go to the users subscribed
+    to the Warehouse doctype room, so only users who can read warehouses
+    receive them. The job holds the publisher flag while it runs. Once
+    nothing is pending it releases the flag and looks again, so a change
+    queued just before the release is published rather than left behind.
+    The report snapshot is refreshed once the burst is published.
+
+    Returns:
+        Number of warehouse records published
+    """
+    published = 0
+
+    try:
+        for _round in range(MAX_PUBLISH_ROUNDS):
+            time.sleep(COALESCE_WINDOW_SECONDS)
+
+            records = build_changes(drain_pending_changes())
+            if records:
+                frappe.publish_realtime(REALTIME_EVENT, {"changes": records}, doctype="Warehouse", after_commit=False)
+                published += len(records)
+                continue
+
+            release_publisher_flag()
+
+            # Changes queued before the release found the flag taken and started no job
+            if not has_pending_changes() or not acquire_publisher_flag():
+                break
+        else:
+            # Still busy: a fresh job takes over the flag instead of holding this worker
+            cache = frappe.cache()
+            cache.expire(cache.make_key(PUBLISHER_FLAG_KEY), PUBLISHER_FLAG_TTL)
+            enqueue_publisher()
+    except Exception:
+        # The next committed change starts a new publisher
+        release_publisher_flag()
+        raise
+
+    if published:
+        enqueue_snapshot_refresh()
+
+    return published
@@ -0,0 +1,203 @@
+import frappe
+from frappe.utils import flt
+from typing import Dict, Any, List, Set
+
+from .cache import invalidate_warehouse_state
+from .index import INDEX_VERSION_KEY
+from .logging import log_assignment, log_release
+
+RECONCILIATION_TRANSACTION_TYPE = "Warehouse Reconciliation"
+
+def get_reconciliation_action(row: Dict[str, Any]) -> str:
+    """
+    Action bringing the control fields of a warehouse in line with its stock
+
+    Args:
+        row: Warehouse with its total_qty and assigned_customer
+
+    Returns:
+        release (no stock), assign (stock but no customer) or reserve
+    """
+    if not flt(row.get("total_qty")):
+        return "release"
+    if not row.get("assigned_customer"):
+        return "assign"
+    return "reserve"
+
+def get_inconsistent_warehouses(company: str) -> List[Dict[str, Any]]:
+    """
+    Find the warehouses of a company whose control fields disagree with their stock
+
+    Stock comes from the Warehouse Stock Counter table; the customer of a
+    warehouse with stock but no assignment is taken from its latest
+    Assignment event.
+
+    Args:
+        company: Company name
+
+    Returns:
+        List of warehouses with their current fields, quantity and the action to apply
+        (release, assign or reserve)
+    """
+    rows = frappe.db.sql("""
+        SELECT
+            w.name as warehouse,
+            w.assigned_customer,
+            w.warehouse_status,
+            COALESCE(c.total_qty, 0) as total_qty,
+            last_assignment.new_customer as last_assigned_customer
+        FROM `tabWarehouse` w
+        LEFT JOIN `tabWarehouse Stock Counter` c ON c.name = w.name
+        LEFT JOIN (
+            SELECT l.warehouse, MAX(l.new_customer) as new_customer
+            FROM `tabWarehouse Control Log` l
+            INNER JOIN (
+                SELECT warehouse, MAX(timestamp) as timestamp
+                FROM `tabWarehouse Control Log`
+                WHERE event_type = 'Assignment'
+                AND warehouse IN (SELECT name FROM `tabWarehouse` WHERE company = %(company)s)
+                GROUP BY warehouse
+            ) latest ON latest.warehouse = l.warehouse AND latest.timestamp = l.timestamp
+            WHERE l.event_type = 'Assignment'
+            GROUP BY l.warehouse
+        ) last_assignment ON last_assignment.warehouse = w.name
+        WHERE w.company = %(company)s
+        AND w.is_group = 0
+        AND w.control_mode IN ('Warning', 'Strict')
+        AND (
+            (COALESCE(c.total_qty, 0) = 0
+                AND (IFNULL(w.assigned_customer, '') != '' OR w.warehouse_status = 'Reserved'))
+            OR (COALESCE(c.total_qty, 0) != 0
+                AND (IFNULL(w.assigned_customer, '') = '' OR IFNULL(w.warehouse_status, '') != 'Reserved'))
+        )
+        ORDER BY w.name
+    """, {"company": company}, as_dict=1)
+
+    for row in rows:
+        row.action = get_reconciliation_action(row)
+
+    return rows
+
+def get_updated_warehouses(warehouses: List[str], timestamp: str) -> Set[str]:
+    """
+    Warehouses a guarded UPDATE actually wrote, recognized by its modified timestamp
+    """
+    return set(frappe.db.sql_list("""
+        SELECT name FROM `tabWarehouse`
+        WHERE name IN %(warehouses)s
+        AND modified = %(modified)s
+    """, {"warehouses": warehouses, "modified": timestamp}))
+
+def reconcile_company_warehouse_states(company: str) -> Dict[str, int]:
+    """
+    Fix the inconsistent warehouses of one company
+
+    Each action is applied with one set-based UPDATE guarded on the values
+    that were read, and the corresponding events are bulk inserted on commit.
+    Warehouses skipped by a guard (changed since the read) are neither logged
+    nor counted.
+
+    Args:
+        company: Company name
+
+    Returns:
+        Number of warehouses released, assigned, reserved and left unresolved
+    """
+    rows = get_inconsistent_warehouses(company)
+    timestamp = frappe.utils.now()
+    result = {"released": 0, "assigned": 0, "reserved": 0, "unresolved": 0}
+
+    to_release = [row for row in rows if row.action == "release"]
+    to_assign = [row for row in rows if row.action == "assign" and row.last_assigned_customer]
+    to_reserve = [row for row in rows if row.action == "reserve"]
+
+    if to_release:
+        frappe.db.sql("""
+            UPDATE `tabWarehouse`
+            SET assigned_customer = NULL, warehouse_status = 'Available', modified = %(modified)s
+            WHERE name IN %(warehouses)s
+            AND NOT EXISTS (
+                SELECT 1 FROM `tabWarehouse Stock Counter` c
+                WHERE c.name = `tabWarehouse`.name AND c.total_qty != 0
+            )
+        """, {"warehouses": [row.warehouse for row in to_release], "modified": timestamp})
+
+        updated = get_updated_warehouses([row.warehouse for row in to_release], timestamp)
+        to_release = [row for row in to_release if row.warehouse in updated]
+
+        for row in to_release:
+            if row.assigned_customer:
+                log_release(
+                    warehouse=row.warehouse,
+                    released_customer=row.assigned_customer,
+                    transaction_type=RECONCILIATION_TRANSACTION_TYPE,
+                    transaction_name=company,
+                    qty_before=row.total_qty
+                )
+        result["released"] = len(to_release)
+
+    if to_assign:
+        cases = " ".join("WHEN %s THEN %s" for _row in to_assign)
+        values = [value for row in to_assign for value in (row.warehouse, row.last_assigned_customer)]
+
+        frappe.db.sql(f"""
+            UPDATE `tabWarehouse`
+            SET assigned_customer = CASE name {cases} END,
+                warehouse_status = 'Reserved',
+                last_assignment_date = %s,
+                modified = %s
+            WHERE name IN %s
+            AND IFNULL(assigned_customer, '') = ''
+        """, (*values, timestamp, timestamp, [row.warehouse for row in to_assign]))
+
+        updated = get_updated_warehouses([row.warehouse for row in to_assign], timestamp)
+        to_assign = [row for row in to_assign if row.warehouse in updated]
+
+        for row in to_assign:
+            log_assignment(
+                warehouse=row.warehouse,
+                customer=row.last_assigned_customer,
+                transaction_type=RECONCILIATION_TRANSACTION_TYPE,
+                transaction_name=company,
+                qty_before=row.total_qty,
+                qty_after=row.total_qty
+            )
+        result["assigned"] = len(to_assign)
+
+    if to_reserve:
+        frappe.db.sql("""
+            UPDATE `tabWarehouse`
+            SET warehouse_status = 'Reserved', modified = %(modified)s
+            WHERE name IN %(warehouses)s
+            AND IFNULL(assigned_customer, '') != ''
+        """, {"warehouses": [row.warehouse for row in to_reserve], "modified": timestamp})
+
+        updated = get_updated_warehouses([row.warehouse for row in to_reserve], timestamp)
+        to_reserve = [row for row in to_reserve if row.warehouse in updated]
+        result["reserved"] = len(to_reserve)
+
+    # Including the warehouses without a known customer and those skipped by a guard
+    result["unresolved"] = len(rows) - len(to_release) - len(to_assign) - len(to_reserve)
+
+    invalidate_warehouse_state(row.warehouse for row in to_release + to_assign + to_reserve)
+    frappe.db.commit()  # Flushes the buffered log events
+
+    return result
+
+def reconcile_warehouse_states() -> None:
+    """
+    Daily scheduler job: reconcile warehouse states, one background job per company
+
+    Also drops the put-away index version, so the index is rebuilt from the
+    database on its next read.
+    """
+    frappe.cache().delete_value(INDEX_VERSION_KEY)
+
+    for company in frappe.get_all("Company", pluck="name"):
+        frappe.enqueue(
+            "custom_nedlog.warehouse_control.reconciliation.reconcile_company_warehouse_states",
+            queue="long",
+            job_id=f"warehouse_state_reconciliation::{company}",
+            deduplicate=True,
+            company=company
+        )
@@ -0,0 +1,275 @@
+import frappe
+import json
+from frappe.utils import flt
+from typing import Optional, Dict, Any, List, Tuple
+
+from .cache import get_controlled_warehouses, invalidate_warehouse_state
+from .counter import get_previous_item_qty
+from .logging import log_warehouse_event, LOG_DOCTYPE
+from .retention import ARCHIVE_DOCTYPE
+from .rollup import get_rollup_start_date, backfill_warehouse_activity_rollups
+from .status_update import queue_warehouse_status, flush_warehouse_status_updates
+from .validation import get_linked_customers, LINKED_CUSTOMER_SOURCES, QTY_PRECISION
+
+# Global holding the replay position and the per-warehouse running totals
+REPLAY_CHECKPOINT_KEY = "warehouse_control_replay_checkpoint"
+
+DEFAULT_REPLAY_CHUNK_SIZE = 10000
+
+def replay_posting(state: Dict[str, Any], qty_change: float, customer: Optional[str]) -> List[Tuple]:
+    """
+    Apply one stock posting to a warehouse state with the validation.py rules
+
+    Incoming stock assigns an empty or unassigned warehouse to the customer and
+    warns when another customer is assigned; the warehouse is released when
+    outgoing stock empties it.
+
+    Args:
+        state: Warehouse state ({"total_qty", "assigned_customer"}), updated in place
+        qty_change: Quantity posted to the warehouse
+        customer: Customer of the posting (incoming only)
+
+    Returns:
+        List of (event_type, previous_customer, new_customer, qty_before, qty_after) events
+    """
+    qty_before = state["total_qty"]
+    qty_after = flt(qty_before + qty_change, QTY_PRECISION)
+    state["total_qty"] = qty_after
+    assigned_customer = state["assigned_customer"]
+
+    if qty_change > 0 and customer:
+        if qty_before == 0 or not assigned_customer:
+            state["assigned_customer"] = customer
+            return [("Assignment", assigned_customer, customer, qty_before, qty_after)]
+        if assigned_customer != customer:
+            return [("Warning", assigned_customer, customer, qty_before, qty_before)]
+
+    elif qty_change < 0 and qty_after == 0 and assigned_customer:
+        state["assigned_customer"] = None
+        return [("Release", assigned_customer, None, qty_before, 0.0)]
+
+    return []
+
+def get_replay_checkpoint() -> Optional[Dict[str, Any]]:
+    value = frappe.db.get_global(REPLAY_CHECKPOINT_KEY)
+    return json.loads(value) if value else None
+
+def save_replay_checkpoint(checkpoint: Optional[Dict[str, Any]]) -> None:
+    frappe.db.set_global(REPLAY_CHECKPOINT_KEY, json.dumps(checkpoint, default=str) if checkpoint else None)
+
+def iter_ledger_chunk(warehouses: List[str], position: Optional[List[str]], chunk_size: int):
+    """
+    Stream the next chunk of Stock Ledger Entries in posting order through a
+    server-side cursor, starting after the (posting_datetime, creation, name) position
+    """
+    conditions = ""
+    values = {"warehouses": warehouses}
+
+    if position:
+        conditions = """
+            AND (
+                posting_datetime > %(posting_datetime)s
+                OR (posting_datetime = %(posting_datetime)s AND creation > %(creation)s)
+                OR (posting_datetime = %(posting_datetime)s AND creation = %(creation)s AND name > %(name)s)
+            )
+        """
+        values.update(zip(("posting_datetime", "creation", "name"), position))
+
+    query = f"""
+        SELECT
+            name, posting_datetime, creation, item_code, warehouse,
+            actual_qty, qty_after_transaction, voucher_type, voucher_no, voucher_detail_no, owner
+        FROM `tabStock Ledger Entry`
+        WHERE is_cancelled = 0
+        AND docstatus = 1
+        AND warehouse IN %(warehouses)s
+        {conditions}
+        ORDER BY posting_datetime, creation, name
+        LIMIT {int(chunk_size)}
+    """
+
+    with frappe.db.unbuffered_cursor():
+        for row in frappe.db.sql(query, values, as_dict=True, as_iterator=True):
+            yield row
+
+def get_posting_qty_change(sle: Dict[str, Any]) -> float:
+    if sle.voucher_type == "Stock Reconciliation" and not flt(sle.actual_qty):
+        return flt(sle.qty_after_transaction) - get_previous_item_qty(sle)
+    return flt(sle.actual_qty)
+
+def get_chunk_customers(rows: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Customers of the incoming postings of a chunk, with one query per voucher type
+
+    Follows get_customer_from_transaction: supplier of Purchase Receipts, the
+    customer field of the voucher, then the documents linked from Stock Entry rows.
+
+    Returns:
+        Dictionary of (voucher_type, voucher_no) or ("Stock Entry Detail", row name) to customer
+    """
+    vouchers = {}
+    for row in rows:
+        vouchers.setdefault(row.voucher_type, set()).add(row.voucher_no)
+
+    customers = {}
+
+    for voucher_type, voucher_nos in vouchers.items():
+        if voucher_type == "Purchase Receipt":
+            field = "supplier"
+        elif frappe.get_meta(voucher_type).has_field("customer"):
+            field = "customer"
+        else:
+            field = None
+
+        if field:
+            for voucher in frappe.get_all(
+                voucher_type, filters={"name": ["in", list(voucher_nos)]}, fields=["name", field]
+            ):
+                customers[(voucher_type, voucher.name)] = voucher[field]
+
+    detail_names = [
+        row.voucher_detail_no for row in rows
+        if row.voucher_type == "Stock Entry" and row.voucher_detail_no
+        and not customers.get(("Stock Entry", row.voucher_no))
+    ]
+
+    if detail_names:
+        meta = frappe.get_meta("Stock Entry Detail")
+        link_fields = [fieldname for fieldname, doctype in LINKED_CUSTOMER_SOURCES if meta.has_field(fieldname)]
+
+        if link_fields:
+            details = frappe.get_all(
+                "Stock Entry Detail",
+                filters={"name": ["in", detail_names]},
+                fields=["name"] + link_fields
+            )
+            linked_customers = get_linked_customers(details)
+
+            for detail in details:
+                for fieldname, doctype in LINKED_CUSTOMER_SOURCES:
+                    if detail.get(fieldname):
+                        customers[("Stock Entry Detail", detail.name)] = linked_customers.get((doctype, detail[fieldname]))
+                        break
+
+    return customers
+
+def get_posting_customer(sle: Dict[str, Any], customers: Dict[Tuple[str, str], Optional[str]]) -> Optional[str]:
+    return customers.get((sle.voucher_type, sle.voucher_no)) or customers.get(("Stock Entry Detail", sle.voucher_detail_no))
+
+def replay_warehouse_history(chunk_size: int = DEFAULT_REPLAY_CHUNK_SIZE, restart: bool = False, progress=None) -> Dict[str, Any]:
+    """
+    Rebuild warehouse assignments and their log from the stock ledger
+
+    The ledger of the controlled warehouses is streamed in posting order, one
+    chunk of `chunk_size` rows at a time. After each chunk, the changed
+    warehouse states are written with one UPDATE ... CASE, the events with one
+    bulk insert, and the position and running totals are saved as a checkpoint
+    in the same commit, so an interrupted replay resumes where it stopped.
+    Memory is bounded by the chunk size and the number of warehouses.
+
+    A replay started without a checkpoint first deletes the logged events of
+    the controlled warehouses, live and archived, so they are not duplicated;
+    the activity rollups are recomputed once the replay completes.
+
+    Args:
+        chunk_size: Ledger rows per chunk
+        restart: Ignore the checkpoint and replay from the first posting
+        progress: Optional callable receiving the checkpoint after each chunk
+
+    Returns:
+        The final checkpoint (rows replayed, events logged)
+    """
+    warehouses = sorted(get_controlled_warehouses())
+    if not warehouses:
+        return {"rows": 0, "events": 0}
+
+    checkpoint = None if restart else get_replay_checkpoint()
+
+    if checkpoint:
+        totals = checkpoint["totals"]
+        assigned = dict(frappe.db.sql("""
+            SELECT name, assigned_customer FROM `tabWarehouse` WHERE name IN %(warehouses)s
+        """, {"warehouses": warehouses}))
+    else:
+        checkpoint = {"position": None, "totals": {}, "rows": 0, "events": 0}
+        totals = checkpoint["totals"]
+        assigned = {}
+
+        # Start from a clean state: every controlled warehouse is empty and available,
+        # with no logged event
+        frappe.db.sql("""
+            UPDATE `tabWarehouse`
+            SET assigned_customer = NULL, warehouse_status = 'Available', last_assignment_date = NULL
+            WHERE name IN %(warehouses)s
+        """, {"warehouses": warehouses})
+        frappe.db.delete(LOG_DOCTYPE, {"warehouse": ["in", warehouses]})
+        frappe.db.delete(ARCHIVE_DOCTYPE, {"warehouse": ["in", warehouses]})
+        invalidate_warehouse_state(warehouses)
+        save_replay_checkpoint(checkpoint)
+        frappe.db.commit()
+
+    while True:
+        rows = list(iter_ledger_chunk(warehouses, checkpoint["position"], chunk_size))
+        if not rows:
+            break
+
+        customers = get_chunk_customers([row for row in rows if flt(row.actual_qty) >= 0])
+        changed = {}
+
+        for row in rows:
+            state = {
+                "total_qty": totals.get(row.warehouse, 0.0),
+                "assigned_customer": assigned.get(row.warehouse)
+            }
+            events = replay_posting(state, get_posting_qty_change(row), get_posting_customer(row, customers))
+            totals[row.warehouse] = state["total_qty"]
+
+            for event_type, previous_customer, new_customer, qty_before, qty_after in events:
+                log_warehouse_event(
+                    warehouse=row.warehouse,
+                    event_type=event_type,
+                    transaction_type=row.voucher_type,
+                    transaction_name=row.voucher_no,
+                    prev_customer=previous_customer,
+                    new_customer=new_customer,
+                    qty_before=qty_before,
+                    qty_after=qty_after,
+                    user=row.owner,
+                    timestamp=row.posting_datetime
+                )
+                checkpoint["events"] += 1
+
+                if event_type == "Assignment":
+                    changed[row.warehouse] = {
+                        "assigned_customer": new_customer,
+                        "warehouse_status": "Reserved",
+                        "last_assignment_date": row.posting_datetime
+                    }
+                elif event_type == "Release":
+                    changed[row.warehouse] = {"assigned_customer": None, "warehouse_status": "Available"}
+
+            assigned[row.warehouse] = state["assigned_customer"]
+
+        for warehouse, values in changed.items():
+            queue_warehouse_status(warehouse, values)
+        flush_warehouse_status_updates()
+
+        last = rows[-1]
+        checkpoint["position"] = [str(last.posting_datetime), str(last.creation), last.name]
+        checkpoint["rows"] += len(rows)
+        save_replay_checkpoint(checkpoint)
+
+        # Flushes the buffered events; state, log and checkpoint commit together
+        frappe.db.commit()
+
+        if progress:
+            progress(checkpoint)
+
+    save_replay_checkpoint(None)
+    frappe.db.commit()
+
+    if get_rollup_start_date():
+        # Event counts of the rolled up days came from the deleted log
+        backfill_warehouse_activity_rollups()
+
+    return checkpoint
@@ -0,0 +1,81 @@
+// Copyright (c) 2026, achref louati and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Warehouse Customer Status"] = {
+	filters: [
+		{
+			fieldname: "warehouse",
+			label: __("Warehouse"),
+			fieldtype: "Link",
+			options: "Warehouse",
+		},
+		{
+			fieldname: "warehouse_group",
+			label: __("Warehouse Group"),
+			fieldtype: "Link",
+			options: "Warehouse",
+			get_query: () => ({ filters: { is_group: 1 } }),
+		},
+		{
+			fieldname: "assigned_customer",
+			label: __("Assigned Customer"),
+			fieldtype: "Link",
+			options: "Customer",
+		},
+		{
+			fieldname: "warehouse_status",
+			label: __("Warehouse Status"),
+			fieldtype: "Select",
+			options: "\nAvailable\nReserved",
+		},
+		{
+			fieldname: "live",
+			label: __("Live"),
+			fieldtype: "Check",
+			description: __("Query current data instead of the background snapshot"),
+		},
+	],
+
+	onload(report) {
+		// Apply pushed changes to the loaded rows instead of re-running the report
+		if (this.realtime_handler) {
+			frappe.realtime.off("warehouse_control_update", this.realtime_handler);
+		}
+		this.realtime_handler = (message) => apply_warehouse_changes(report, message.changes || []);
+		// Changes are published to the Warehouse doctype room only
+		frappe.realtime.doctype_subscribe("Warehouse");
+		frappe.realtime.on("warehouse_control_update", this.realtime_handler);
+	},
+};
+
+const WAREHOUSE_CHANGE_FIELDS = [
+	"assigned_customer",
+	"warehouse_status",
+	"last_assignment_date",
+	"total_quantity",
+	"last_movement_date",
+];
+
+function apply_warehouse_changes(report, changes) {
+	if (report.report_name !== "Warehouse Customer Status" || !report.data || !report.datatable) {
+		return;
+	}
+
+	const rows_by_warehouse = {};
+	report.data.forEach((row) => (rows_by_warehouse[row.warehouse] = row));
+
+	let updated = false;
+	changes.forEach((change) => {
+		const row = rows_by_warehouse[change.warehouse];
+		if (!row || change.deleted) {
+			return;
+		}
+		WAREHOUSE_CHANGE_FIELDS.forEach((field) => (row[field] = change[field]));
+		updated = true;
+	});
+
+	// Rows now outside the status/customer filters stay until the next refresh
+	if (updated) {
+		report.datatable.refresh(report.data);
+	}
+}
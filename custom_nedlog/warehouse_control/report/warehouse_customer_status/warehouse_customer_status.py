@@ -1,16 +1,26 @@
 import frappe
-from custom_nedlog.warehouse_control.reporting import get_warehouse_customer_status_data
+from frappe.utils import pretty_date
+from custom_nedlog.warehouse_control.reporting import (
+	get_warehouse_customer_status_data,
+	get_warehouse_customer_status_snapshot,
+	filter_warehouse_customer_status_rows
+)
 
 def execute(filters=None):
 	"""
 	Execute Warehouse Customer Status Report
 	
+	Rows come from the background snapshot, filtered in memory; the Live
+	filter runs the query instead.
+	
 	Args:
 		filters: Report filters
 		
 	Returns:
-		Tuple of (columns, data)
+		Tuple of (columns, data, message)
 	"""
+	filters = filters or {}
+	
 	columns = [
 		{
 			"label": "Warehouse",
@@ -52,6 +62,14 @@ def execute(filters=None):
 		}
 	]
 	
-	data = get_warehouse_customer_status_data(filters)
+	if filters.get("live"):
+		return columns, get_warehouse_customer_status_data(filters)
+	
+	snapshot = get_warehouse_customer_status_snapshot()
+	data = filter_warehouse_customer_status_rows(snapshot["rows"], filters)
+	message = (
+		f"Snapshot of {frappe.utils.format_datetime(snapshot['generated_at'])} "
+		f"({pretty_date(snapshot['generated_at'])}). Check <strong>Live</strong> to query current data."
+	)
 	
-	return columns, data
\ No newline at end of file
+	return columns, data, message
\ No newline at end of file
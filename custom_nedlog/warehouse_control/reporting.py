@@ -1,10 +1,16 @@
 import frappe
+from frappe.utils import cint, getdate
 from typing import List, Dict, Any
 
+from .rollup import get_rollup_window, get_live_activity, get_rolled_up_activity, merge_activity
+
 def get_warehouse_customer_status_data(filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
     """
     Get data for Warehouse Customer Status Report
     
+    Quantities and last movement dates come from the Warehouse Stock Counter
+    table maintained from stock postings, joined on its primary key.
+    
     Args:
         filters: Report filters
         
@@ -19,6 +25,16 @@ def get_warehouse_customer_status_data(filters: Dict[str, Any] = None) -> List[D
             conditions.append("w.name = %s")
             values.append(filters["warehouse"])
             
+        if filters.get("warehouse_group"):
+            # Leaves of the group: nested set range, no recursion over children
+            conditions.append("""
+                EXISTS (
+                    SELECT 1 FROM `tabWarehouse` g
+                    WHERE g.name = %s AND w.lft > g.lft AND w.rgt < g.rgt
+                )
+            """)
+            values.append(filters["warehouse_group"])
+            
         if filters.get("assigned_customer"):
             conditions.append("w.assigned_customer = %s")
             values.append(filters["assigned_customer"])
@@ -34,36 +50,95 @@ def get_warehouse_customer_status_data(filters: Dict[str, Any] = None) -> List[D
             w.name as warehouse,
             w.assigned_customer,
             w.warehouse_status,
-            COALESCE(SUM(b.actual_qty), 0) as total_quantity,
+            COALESCE(c.total_qty, 0) as total_quantity,
             w.last_assignment_date,
-            (
-                SELECT MAX(sle.posting_date) 
-                FROM `tabStock Ledger Entry` sle 
-                WHERE sle.warehouse = w.name 
-                AND sle.is_cancelled = 0 
-                AND sle.docstatus = 1
-            ) as last_movement_date,
+            c.last_movement_date,
             w.control_mode,
-            w.company
+            w.company,
+            w.lft
         FROM 
             `tabWarehouse` w
         LEFT JOIN 
-            `tabBin` b ON b.warehouse = w.name
+            `tabWarehouse Stock Counter` c ON c.name = w.name
         WHERE 
             {where_clause}
             AND w.is_group = 0
-        GROUP BY 
-            w.name
         ORDER BY 
             w.name
     """
     
     return frappe.db.sql(query, values, as_dict=1)
 
+# Redis key of the precomputed Warehouse Customer Status rows
+REPORT_SNAPSHOT_KEY = "warehouse_customer_status_snapshot"
+
+def refresh_warehouse_customer_status_snapshot() -> Dict[str, Any]:
+    """
+    Scheduler / background job: precompute the unfiltered Warehouse Customer
+    Status rows and store them in Redis
+    
+    Returns:
+        The snapshot (generated_at and rows)
+    """
+    snapshot = {
+        "generated_at": frappe.utils.now(),
+        "rows": get_warehouse_customer_status_data()
+    }
+    frappe.cache().set_value(REPORT_SNAPSHOT_KEY, snapshot)
+    
+    return snapshot
+
+def enqueue_snapshot_refresh() -> None:
+    """
+    Refresh the snapshot in the background (one pending job at a time)
+    """
+    frappe.enqueue(
+        "custom_nedlog.warehouse_control.reporting.refresh_warehouse_customer_status_snapshot",
+        queue="short",
+        job_id="warehouse_customer_status_snapshot",
+        deduplicate=True
+    )
+
+def get_warehouse_customer_status_snapshot() -> Dict[str, Any]:
+    """
+    Read the snapshot, computing it now if none exists yet
+    """
+    return frappe.cache().get_value(REPORT_SNAPSHOT_KEY) or refresh_warehouse_customer_status_snapshot()
+
+def filter_warehouse_customer_status_rows(rows: List[Dict[str, Any]], filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Apply the report filters to snapshot rows in memory
+    
+    Args:
+        rows: Snapshot rows (all leaf warehouses)
+        filters: Report filters
+        
+    Returns:
+        Matching rows
+    """
+    filters = filters or {}
+    group_bounds = None
+    
+    if filters.get("warehouse_group"):
+        group_bounds = frappe.db.get_value("Warehouse", filters["warehouse_group"], ["lft", "rgt"]) or (0, 0)
+    
+    return [
+        row for row in rows
+        if (not filters.get("warehouse") or row["warehouse"] == filters["warehouse"])
+        and (not filters.get("assigned_customer") or row["assigned_customer"] == filters["assigned_customer"])
+        and (not filters.get("warehouse_status") or row["warehouse_status"] == filters["warehouse_status"])
+        and (not group_bounds or group_bounds[0] < row["lft"] < group_bounds[1])
+    ]
+
 def get_warehouse_activity_summary(warehouse: str, days: int = 30) -> Dict[str, Any]:
     """
     Get warehouse activity summary for dashboard
     
+    Days already aggregated by the daily rollup job are summed from the
+    Warehouse Activity Rollup table; only the remaining days (usually today)
+    are read from the control log and stock ledger. Periods starting before
+    the first rolled up day are read from the raw tables only.
+    
     Args:
         warehouse: Warehouse name
         days: Number of days to analyze
@@ -71,40 +146,277 @@ def get_warehouse_activity_summary(warehouse: str, days: int = 30) -> Dict[str,
     Returns:
         Activity summary
     """
-    from_date = frappe.utils.add_days(frappe.utils.nowdate(), -days)
+    from_date = getdate(frappe.utils.add_days(frappe.utils.nowdate(), -days))
+    rollup_to, live_from = get_rollup_window(from_date)
     
-    # Get control log events
-    events = frappe.db.sql("""
-        SELECT 
-            event_type,
-            COUNT(*) as count,
-            MAX(timestamp) as last_event
-        FROM 
-            `tabWarehouse Control Log`
-        WHERE 
-            warehouse = %s
-            AND DATE(timestamp) >= %s
-        GROUP BY 
-            event_type
-    """, (warehouse, from_date), as_dict=1)
+    if rollup_to:
+        activity = merge_activity(
+            get_rolled_up_activity(warehouse, from_date, rollup_to),
+            get_live_activity(warehouse, live_from)
+        )
+    else:
+        activity = get_live_activity(warehouse, from_date)
+    
+    return {
+        "warehouse": warehouse,
+        "period_days": days,
+        "events": activity["events"],
+        "movements": activity["movements"]
+    }
+
+# Sort orders of get_warehouses_activity_summary (name is the tie-breaker)
+ACTIVITY_SORT_ORDERS = {
+    "most_active": "movement_count DESC, qty_moved DESC",
+    "longest_idle": "last_movement_date IS NOT NULL, last_movement_date ASC",
+    "most_warnings": "warning_count DESC, last_warning DESC"
+}
+
+MAX_ACTIVITY_PAGE_LENGTH = 500
+
+@frappe.whitelist()
+def get_warehouses_activity_summary(
+    days: int = 30,
+    company: str = None,
+    assigned_customer: str = None,
+    warehouse_status: str = None,
+    sort_by: str = "most_active",
+    start: int = 0,
+    page_length: int = 50
+) -> Dict[str, Any]:
+    """
+    Get the activity summary of all (or a filtered set of) warehouses in one call
+    
+    Same figures as get_warehouse_activity_summary, computed with grouped
+    queries over the rollup table and the days not rolled up yet. The
+    permitted warehouse list is bound once, in a CTE the subqueries share.
     
-    # Get stock movements
-    movements = frappe.db.sql("""
+    Args:
+        days: Number of days to analyze
+        company: Only warehouses of this company
+        assigned_customer: Only warehouses assigned to this customer
+        warehouse_status: Only warehouses with this status (Available/Reserved)
+        sort_by: most_active, longest_idle or most_warnings
+        start: Offset of the first warehouse returned
+        page_length: Number of warehouses returned (max MAX_ACTIVITY_PAGE_LENGTH)
+        
+    Returns:
+        Dictionary with the page of warehouses and the total number of matching warehouses
+    """
+    if sort_by not in ACTIVITY_SORT_ORDERS:
+        frappe.throw(f"Invalid sort order: {sort_by}")
+    
+    days = cint(days)
+    start = max(cint(start), 0)
+    page_length = min(max(cint(page_length), 1), MAX_ACTIVITY_PAGE_LENGTH)
+    
+    filters = {"is_group": 0}
+    if company:
+        filters["company"] = company
+    if assigned_customer:
+        filters["assigned_customer"] = assigned_customer
+    if warehouse_status:
+        filters["warehouse_status"] = warehouse_status
+    
+    # Permission-aware list of the warehouses the user may see
+    warehouses = frappe.get_list("Warehouse", filters=filters, pluck="name", limit_page_length=0)
+    
+    result = {
+        "period_days": days,
+        "sort_by": sort_by,
+        "start": start,
+        "page_length": page_length,
+        "total": len(warehouses),
+        "warehouses": []
+    }
+    if not warehouses:
+        return result
+    
+    from_date = getdate(frappe.utils.add_days(frappe.utils.nowdate(), -days))
+    rollup_to, live_from = get_rollup_window(from_date)
+    
+    values = {
+        "warehouses": warehouses,
+        "from_date": from_date,
+        "rollup_to": rollup_to,
+        "live_from": live_from,
+        "live_from_datetime": frappe.utils.get_datetime(live_from),
+        "today": frappe.utils.nowdate(),
+        "start": start,
+        "page_length": page_length
+    }
+    
+    result["warehouses"] = frappe.db.sql(f"""
+        WITH selected AS (
+            SELECT name FROM `tabWarehouse` WHERE name IN %(warehouses)s
+        )
         SELECT 
-            COUNT(*) as movement_count,
-            SUM(ABS(actual_qty)) as total_qty_moved
+            w.name as warehouse,
+            w.company,
+            w.assigned_customer,
+            w.warehouse_status,
+            COALESCE(c.total_qty, 0) as total_quantity,
+            c.last_movement_date,
+            DATEDIFF(%(today)s, c.last_movement_date) as idle_days,
+            COALESCE(r.movement_count, 0) + COALESCE(m.movement_count, 0) as movement_count,
+            COALESCE(r.qty_moved, 0) + COALESCE(m.qty_moved, 0) as qty_moved,
+            COALESCE(r.assignment_count, 0) + COALESCE(l.assignment_count, 0) as assignment_count,
+            COALESCE(r.warning_count, 0) + COALESCE(l.warning_count, 0) as warning_count,
+            COALESCE(r.release_count, 0) + COALESCE(l.release_count, 0) as release_count,
+            GREATEST(COALESCE(r.last_warning, l.last_warning), COALESCE(l.last_warning, r.last_warning)) as last_warning
         FROM 
-            `tabStock Ledger Entry`
-        WHERE 
-            warehouse = %s
-            AND posting_date >= %s
+            selected
+        JOIN 
+            `tabWarehouse` w ON w.name = selected.name
+        LEFT JOIN 
+            `tabWarehouse Stock Counter` c ON c.name = w.name
+        LEFT JOIN (
+            SELECT 
+                warehouse,
+                SUM(movement_count) as movement_count,
+                SUM(qty_moved) as qty_moved,
+                SUM(assignment_count) as assignment_count,
+                SUM(warning_count) as warning_count,
+                SUM(release_count) as release_count,
+                MAX(last_warning) as last_warning
+            FROM `tabWarehouse Activity Rollup`
+            WHERE warehouse IN (SELECT name FROM selected)
+            AND rollup_date BETWEEN %(from_date)s AND %(rollup_to)s
+            GROUP BY warehouse
+        ) r ON r.warehouse = w.name
+        LEFT JOIN (
+            SELECT 
+                warehouse,
+                COUNT(*) as movement_count,
+                SUM(ABS(actual_qty)) as qty_moved
+            FROM `tabStock Ledger Entry`
+            WHERE warehouse IN (SELECT name FROM selected)
+            AND posting_date >= %(live_from)s
             AND is_cancelled = 0
             AND docstatus = 1
-    """, (warehouse, from_date), as_dict=1)
+            GROUP BY warehouse
+        ) m ON m.warehouse = w.name
+        LEFT JOIN (
+            SELECT 
+                warehouse,
+                SUM(event_type = 'Assignment') as assignment_count,
+                SUM(event_type = 'Warning') as warning_count,
+                SUM(event_type = 'Release') as release_count,
+                MAX(IF(event_type = 'Warning', timestamp, NULL)) as last_warning
+            FROM `tabWarehouse Control Log`
+            WHERE warehouse IN (SELECT name FROM selected)
+            AND timestamp >= %(live_from_datetime)s
+            GROUP BY warehouse
+        ) l ON l.warehouse = w.name
+        ORDER BY 
+            {ACTIVITY_SORT_ORDERS[sort_by]}, w.name
+        LIMIT %(page_length)s OFFSET %(start)s
+    """, values, as_dict=1)
     
-    return {
-        "warehouse": warehouse,
-        "period_days": days,
-        "events": {event["event_type"]: event for event in events},
-        "movements": movements[0] if movements else {"movement_count": 0, "total_qty_moved": 0}
-    }
\ No newline at end of file
+    return result
+
+@frappe.whitelist()
+def get_warehouse_group_summary(warehouse_group: str = None, company: str = None, days: int = 30) -> List[Dict[str, Any]]:
+    """
+    Quantity and control summary of every group warehouse
+    
+    All groups are aggregated in one statement: each group is joined to its
+    leaf warehouses through the nested set (w.lft > g.lft AND w.rgt < g.rgt),
+    the leaves to their Bin totals and to their warnings of the period.
+    A leaf counts in every group above it. Only the groups and leaves the
+    user may see are aggregated, and warnings of rolled up days are read
+    from the rollup table, as in get_warehouses_activity_summary.
+    
+    Args:
+        warehouse_group: Only this group and the groups below it
+        company: Only groups of this company
+        days: Period of the warning counts
+        
+    Returns:
+        One row per group, in tree order, with the leaf count, controlled,
+        reserved and free leaves, total quantity, assigned customers and
+        the number of mixing warnings
+    """
+    frappe.has_permission("Warehouse", "read", throw=True)
+    
+    group_filters = {"is_group": 1}
+    
+    if warehouse_group:
+        bounds = frappe.db.get_value("Warehouse", warehouse_group, ["lft", "rgt"], as_dict=True)
+        if not bounds:
+            frappe.throw(f"Warehouse {warehouse_group} not found")
+        group_filters["lft"] = [">=", bounds.lft]
+        group_filters["rgt"] = ["<=", bounds.rgt]
+    
+    if company:
+        group_filters["company"] = company
+    
+    # Permission-aware lists of the groups and leaves the user may see
+    groups = frappe.get_list("Warehouse", filters=group_filters, pluck="name", limit_page_length=0)
+    warehouses = frappe.get_list("Warehouse", filters={"is_group": 0}, pluck="name", limit_page_length=0)
+    if not groups or not warehouses:
+        return []
+    
+    from_date = getdate(frappe.utils.add_days(frappe.utils.nowdate(), -cint(days)))
+    rollup_to, live_from = get_rollup_window(from_date)
+    
+    values = {
+        "groups": groups,
+        "warehouses": warehouses,
+        "from_date": from_date,
+        "rollup_to": rollup_to,
+        "live_from_datetime": frappe.utils.get_datetime(live_from)
+    }
+    
+    return frappe.db.sql("""
+        WITH selected_groups AS (
+            SELECT name FROM `tabWarehouse` WHERE name IN %(groups)s
+        ),
+        selected AS (
+            SELECT name FROM `tabWarehouse` WHERE name IN %(warehouses)s
+        )
+        SELECT 
+            g.name as warehouse_group,
+            g.parent_warehouse,
+            g.company,
+            COUNT(w.name) as warehouse_count,
+            SUM(w.control_mode IN ('Warning', 'Strict')) as controlled_count,
+            SUM(w.warehouse_status = 'Reserved') as reserved_count,
+            SUM(IFNULL(w.assigned_customer, '') = '' AND COALESCE(b.total_qty, 0) = 0) as free_count,
+            COALESCE(SUM(b.total_qty), 0) as total_qty,
+            COUNT(DISTINCT w.assigned_customer) as customer_count,
+            GROUP_CONCAT(DISTINCT w.assigned_customer ORDER BY w.assigned_customer SEPARATOR ', ') as assigned_customers,
+            COALESCE(SUM(l.warning_count), 0) as warning_count
+        FROM 
+            selected_groups
+        JOIN 
+            `tabWarehouse` g ON g.name = selected_groups.name
+        INNER JOIN 
+            `tabWarehouse` w ON w.lft > g.lft AND w.rgt < g.rgt AND w.is_group = 0
+            AND w.name IN (SELECT name FROM selected)
+        LEFT JOIN (
+            SELECT warehouse, SUM(actual_qty) as total_qty
+            FROM `tabBin`
+            WHERE warehouse IN (SELECT name FROM selected)
+            GROUP BY warehouse
+        ) b ON b.warehouse = w.name
+        LEFT JOIN (
+            SELECT warehouse, SUM(warning_count) as warning_count
+            FROM (
+                SELECT warehouse, warning_count
+                FROM `tabWarehouse Activity Rollup`
+                WHERE warehouse IN (SELECT name FROM selected)
+                AND rollup_date BETWEEN %(from_date)s AND %(rollup_to)s
+                UNION ALL
+                SELECT warehouse, 1
+                FROM `tabWarehouse Control Log`
+                WHERE event_type = 'Warning'
+                AND warehouse IN (SELECT name FROM selected)
+                AND timestamp >= %(live_from_datetime)s
+            ) warnings
+            GROUP BY warehouse
+        ) l ON l.warehouse = w.name
+        GROUP BY 
+            g.name, g.parent_warehouse, g.company, g.lft
+        ORDER BY 
+            g.lft
+    """, values, as_dict=1)
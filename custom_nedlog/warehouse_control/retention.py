@@ -0,0 +1,146 @@
+import frappe
+from frappe.utils import add_days, cint, get_datetime, nowdate
+from typing import Optional, Dict, Any, List
+
+from .logging import LOG_DOCTYPE
+from .rollup import ROLLUP_RECOMPUTE_DAYS, get_last_rollup_date, get_rollup_start_date
+
+ARCHIVE_DOCTYPE = "Warehouse Control Log Archive"
+
+# Default age (days) after which log rows are archived, see site_config
+# warehouse_control_log_retention_days
+DEFAULT_RETENTION_DAYS = 180
+
+# The daily rollup job re-reads recent days from the live log
+MIN_RETENTION_DAYS = ROLLUP_RECOMPUTE_DAYS + 1
+
+ARCHIVE_BATCH_SIZE = 5000
+
+# Columns shared by the live and archive tables
+HISTORY_FIELDS = [
+    "name", "warehouse", "previous_customer", "new_customer", "transaction_type", "transaction_name",
+    "event_type", "total_qty_before", "total_qty_after", "user", "timestamp"
+]
+
+def get_retention_days() -> int:
+    """
+    Retention of the live log, configurable via site_config
+    """
+    days = cint(frappe.conf.get("warehouse_control_log_retention_days")) or DEFAULT_RETENTION_DAYS
+    return max(days, MIN_RETENTION_DAYS)
+
+def get_archive_cutoff():
+    """
+    Log rows older than this datetime live in the archive table
+    """
+    return get_datetime(add_days(nowdate(), -get_retention_days()))
+
+def archive_warehouse_control_logs() -> int:
+    """
+    Daily scheduler job: move log rows older than the retention into the
+    compressed archive table, in batches of ARCHIVE_BATCH_SIZE
+
+    Only days covered by the rollup table leave the live log: the activity
+    summaries read the days before its first day from the live log, and the
+    rollup job recomputes its last ROLLUP_RECOMPUTE_DAYS days from it, so
+    archiving also stops there when the rollup job is behind.
+
+    Returns:
+        Number of rows archived
+    """
+    rollup_start = get_rollup_start_date()
+    last_rollup_date = get_last_rollup_date()
+    if not rollup_start or not last_rollup_date:
+        return 0
+
+    cutoff = min(
+        get_archive_cutoff(),
+        get_datetime(add_days(last_rollup_date, 1 - ROLLUP_RECOMPUTE_DAYS))
+    )
+    start = get_datetime(rollup_start)
+    columns = ", ".join(f"`{field}`" for field in HISTORY_FIELDS)
+    archived = 0
+
+    while True:
+        names = frappe.db.sql_list(f"""
+            SELECT name
+            FROM `tab{LOG_DOCTYPE}`
+            WHERE timestamp >= %s
+            AND timestamp < %s
+            ORDER BY timestamp
+            LIMIT {ARCHIVE_BATCH_SIZE}
+        """, (start, cutoff))
+
+        if not names:
+            break
+
+        frappe.db.sql(f"""
+            INSERT IGNORE INTO `tab{ARCHIVE_DOCTYPE}`
+                ({columns}, archive_month, creation, modified, owner, modified_by, docstatus)
+            SELECT
+                {columns}, DATE_FORMAT(timestamp, '%%Y-%%m'), creation, modified, owner, modified_by, 0
+            FROM `tab{LOG_DOCTYPE}`
+            WHERE name IN %(names)s
+        """, {"names": names})
+
+        frappe.db.delete(LOG_DOCTYPE, {"name": ["in", names]})
+        frappe.db.commit()
+
+        archived += len(names)
+
+    return archived
+
+def get_warehouse_control_history(
+    warehouse: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = 500
+) -> List[Dict[str, Any]]:
+    """
+    Warehouse control events across the live log and its archive
+
+    The archive is only read when the period starts before the archive cutoff.
+
+    Args:
+        warehouse: Only events of this warehouse
+        from_date: Start date (inclusive)
+        to_date: End date (inclusive)
+        event_type: Assignment/Warning/Release
+        limit: Maximum number of events, newest first
+
+    Returns:
+        List of events
+    """
+    conditions = []
+    values = {"limit": cint(limit)}
+
+    if warehouse:
+        conditions.append("warehouse = %(warehouse)s")
+        values["warehouse"] = warehouse
+
+    if from_date:
+        conditions.append("timestamp >= %(from_datetime)s")
+        values["from_datetime"] = get_datetime(from_date)
+
+    if to_date:
+        conditions.append("timestamp < %(to_datetime)s")
+        values["to_datetime"] = get_datetime(add_days(to_date, 1))
+
+    if event_type:
+        conditions.append("event_type = %(event_type)s")
+        values["event_type"] = event_type
+
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    columns = ", ".join(f"`{field}`" for field in HISTORY_FIELDS)
+
+    query = f"SELECT {columns} FROM `tab{LOG_DOCTYPE}` WHERE {where_clause}"
+
+    if not from_date or get_datetime(from_date) < get_archive_cutoff():
+        query += f" UNION ALL SELECT {columns} FROM `tab{ARCHIVE_DOCTYPE}` WHERE {where_clause}"
+
+    return frappe.db.sql(f"""
+        {query}
+        ORDER BY timestamp DESC
+        LIMIT %(limit)s
+    """, values, as_dict=1)
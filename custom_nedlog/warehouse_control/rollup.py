@@ -0,0 +1,266 @@
+import frappe
+from frappe.utils import add_days, getdate, get_datetime, nowdate, now
+from typing import Optional, Dict, Any, Tuple
+
+ROLLUP_DOCTYPE = "Warehouse Activity Rollup"
+
+# Global holding the last day covered by the rollup table
+ROLLUP_DATE_KEY = "warehouse_activity_rollup_date"
+
+# Global holding the first day covered by the rollup table
+ROLLUP_START_KEY = "warehouse_activity_rollup_start"
+
+# Days recomputed on each run, to pick up backdated stock postings
+ROLLUP_RECOMPUTE_DAYS = 7
+
+EVENT_COLUMNS = {
+    "Assignment": ("assignment_count", "last_assignment"),
+    "Warning": ("warning_count", "last_warning"),
+    "Release": ("release_count", "last_release")
+}
+
+def get_last_rollup_date():
+    """
+    Last day already aggregated in the rollup table (None if never run)
+    """
+    value = frappe.db.get_global(ROLLUP_DATE_KEY)
+    return getdate(value) if value else None
+
+def get_rollup_start_date():
+    """
+    First day aggregated in the rollup table (None if never run)
+    """
+    value = frappe.db.get_global(ROLLUP_START_KEY)
+    return getdate(value) if value else None
+
+def get_rollup_window(from_date) -> Tuple[Optional[Any], Any]:
+    """
+    Split a period starting at from_date between the rollup table and the raw tables
+
+    The rollup table is only used when it covers from_date; days before its
+    first day were never aggregated, so such periods are read live.
+
+    Args:
+        from_date: First day of the period
+
+    Returns:
+        Last day read from the rollup table (None if not used) and first day read live
+    """
+    from_date = getdate(from_date)
+    rollup_start = get_rollup_start_date()
+    last_rollup_date = get_last_rollup_date()
+
+    if rollup_start and last_rollup_date and rollup_start <= from_date <= last_rollup_date:
+        return last_rollup_date, getdate(add_days(last_rollup_date, 1))
+
+    return None, from_date
+
+def rollup_day(day) -> None:
+    """
+    (Re)compute the rollup rows of one day for every warehouse
+
+    Args:
+        day: Date to aggregate
+    """
+    day = getdate(day)
+    values = {
+        "day": day,
+        "start": get_datetime(day),
+        "end": get_datetime(add_days(day, 1)),
+        "timestamp": now(),
+        "user": frappe.session.user
+    }
+
+    frappe.db.delete(ROLLUP_DOCTYPE, {"rollup_date": day})
+
+    # Stock movements: posting_date range on the ledger
+    frappe.db.sql(f"""
+        INSERT INTO `tab{ROLLUP_DOCTYPE}`
+            (name, warehouse, rollup_date, movement_count, qty_moved,
+            creation, modified, owner, modified_by, docstatus)
+        SELECT
+            CONCAT(warehouse, '::', %(day)s), warehouse, %(day)s,
+            COUNT(*), SUM(ABS(actual_qty)),
+            %(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0
+        FROM `tabStock Ledger Entry`
+        WHERE posting_date = %(day)s
+        AND is_cancelled = 0
+        AND docstatus = 1
+        GROUP BY warehouse
+    """, values)
+
+    # Control events: timestamp range (index friendly, unlike DATE(timestamp))
+    for event_type, (count_column, last_column) in EVENT_COLUMNS.items():
+        frappe.db.sql(f"""
+            INSERT INTO `tab{ROLLUP_DOCTYPE}`
+                (name, warehouse, rollup_date, {count_column}, {last_column},
+                creation, modified, owner, modified_by, docstatus)
+            SELECT
+                CONCAT(warehouse, '::', %(day)s), warehouse, %(day)s,
+                COUNT(*), MAX(timestamp),
+                %(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0
+            FROM `tabWarehouse Control Log`
+            WHERE timestamp >= %(start)s
+            AND timestamp < %(end)s
+            AND event_type = %(event_type)s
+            GROUP BY warehouse
+            ON DUPLICATE KEY UPDATE
+                {count_column} = VALUES({count_column}),
+                {last_column} = VALUES({last_column})
+        """, dict(values, event_type=event_type))
+
+def rollup_warehouse_activity(days: Optional[int] = None) -> None:
+    """
+    Daily scheduler job: aggregate warehouse activity up to yesterday
+
+    Recomputes the last ROLLUP_RECOMPUTE_DAYS days (or `days` when given,
+    e.g. for an initial backfill) and any day missed since the last run.
+    The first day ever aggregated is kept as the start of the coverage.
+
+    Args:
+        days: Number of days to recompute
+    """
+    yesterday = getdate(add_days(nowdate(), -1))
+    start = getdate(add_days(yesterday, -(int(days or ROLLUP_RECOMPUTE_DAYS) - 1)))
+
+    last_rollup_date = get_last_rollup_date()
+    if last_rollup_date and last_rollup_date < start:
+        start = getdate(add_days(last_rollup_date, 1))
+
+    day = start
+    while day <= yesterday:
+        rollup_day(day)
+        frappe.db.commit()
+        day = getdate(add_days(day, 1))
+
+    rollup_start = get_rollup_start_date()
+    if not rollup_start or start < rollup_start:
+        frappe.db.set_global(ROLLUP_START_KEY, str(start))
+
+    frappe.db.set_global(ROLLUP_DATE_KEY, str(yesterday))
+    frappe.db.commit()
+
+def backfill_warehouse_activity_rollups() -> None:
+    """
+    Aggregate the whole stock ledger and control log history, so the rollup
+    table covers every day before the live log is archived
+    """
+    first_posting, first_event = frappe.db.sql("""
+        SELECT
+            (SELECT MIN(posting_date) FROM `tabStock Ledger Entry` WHERE is_cancelled = 0 AND docstatus = 1),
+            (SELECT MIN(timestamp) FROM `tabWarehouse Control Log`)
+    """)[0]
+
+    first_day = min(filter(None, [
+        getdate(first_posting) if first_posting else None,
+        getdate(first_event) if first_event else None
+    ]), default=None)
+
+    yesterday = getdate(add_days(nowdate(), -1))
+    if not first_day or first_day > yesterday:
+        first_day = yesterday
+
+    rollup_warehouse_activity(days=(yesterday - first_day).days + 1)
+
+def get_live_activity(warehouse: str, from_date) -> Dict[str, Any]:
+    """
+    Activity of a warehouse since from_date, read from the raw tables
+
+    Only used for the days not covered by the rollup table yet (usually today).
+    """
+    events = frappe.db.sql("""
+        SELECT
+            event_type,
+            COUNT(*) as count,
+            MAX(timestamp) as last_event
+        FROM
+            `tabWarehouse Control Log`
+        WHERE
+            warehouse = %s
+            AND timestamp >= %s
+        GROUP BY
+            event_type
+    """, (warehouse, get_datetime(from_date)), as_dict=1)
+
+    movements = frappe.db.sql("""
+        SELECT
+            COUNT(*) as movement_count,
+            COALESCE(SUM(ABS(actual_qty)), 0) as total_qty_moved
+        FROM
+            `tabStock Ledger Entry`
+        WHERE
+            warehouse = %s
+            AND posting_date >= %s
+            AND is_cancelled = 0
+            AND docstatus = 1
+    """, (warehouse, from_date), as_dict=1)
+
+    return {
+        "events": {event.event_type: event for event in events},
+        "movements": movements[0]
+    }
+
+def get_rolled_up_activity(warehouse: str, from_date, to_date) -> Dict[str, Any]:
+    """
+    Activity of a warehouse between two days, summed from the rollup table
+    """
+    rows = frappe.db.sql(f"""
+        SELECT
+            SUM(assignment_count) as assignment_count,
+            SUM(warning_count) as warning_count,
+            SUM(release_count) as release_count,
+            MAX(last_assignment) as last_assignment,
+            MAX(last_warning) as last_warning,
+            MAX(last_release) as last_release,
+            COALESCE(SUM(movement_count), 0) as movement_count,
+            COALESCE(SUM(qty_moved), 0) as total_qty_moved
+        FROM
+            `tab{ROLLUP_DOCTYPE}`
+        WHERE
+            warehouse = %s
+            AND rollup_date BETWEEN %s AND %s
+    """, (warehouse, from_date, to_date), as_dict=1)
+
+    row = rows[0]
+    events = {}
+
+    for event_type, (count_column, last_column) in EVENT_COLUMNS.items():
+        if row[count_column]:
+            events[event_type] = frappe._dict(
+                event_type=event_type,
+                count=int(row[count_column]),
+                last_event=row[last_column]
+            )
+
+    return {
+        "events": events,
+        "movements": frappe._dict(
+            movement_count=int(row.movement_count),
+            total_qty_moved=row.total_qty_moved
+        )
+    }
+
+def merge_activity(rolled_up: Dict[str, Any], live: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add the live (intraday) activity to the rolled-up activity
+    """
+    events = dict(rolled_up["events"])
+
+    for event_type, event in live["events"].items():
+        if event_type in events:
+            previous = events[event_type]
+            events[event_type] = frappe._dict(
+                event_type=event_type,
+                count=previous.count + event.count,
+                last_event=max(filter(None, [previous.last_event, event.last_event]), default=None)
+            )
+        else:
+            events[event_type] = event
+
+    return {
+        "events": events,
+        "movements": frappe._dict(
+            movement_count=rolled_up["movements"].movement_count + (live["movements"].movement_count or 0),
+            total_qty_moved=(rolled_up["movements"].total_qty_moved or 0) + (live["movements"].total_qty_moved or 0)
+        )
+    }
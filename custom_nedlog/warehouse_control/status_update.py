@@ -1,23 +1,36 @@
 import frappe
-from typing import Optional
+from typing import Optional, Dict, Any
 from datetime import datetime
 
+from .cache import invalidate_warehouse_state
+
+# Warehouse fields written by the deferred status updates
+STATUS_FIELDS = ["assigned_customer", "warehouse_status", "last_assignment_date"]
+
+# Queue key holding the assigned customer a deferred update expects to find
+EXPECTED_CUSTOMER_KEY = "_expected_customer"
+
+# Default of queue_warehouse_status: apply the update whatever the assignment
+_UNGUARDED = object()
+
 def update_warehouse_status(
     warehouse: str, 
     customer: Optional[str] = None, 
     status: Optional[str] = None, 
     assignment_date: Optional[datetime] = None,
-    commit: bool = True
+    commit: bool = True,
+    clear_customer: bool = False
 ) -> bool:
     """
     Update warehouse control fields
     
     Args:
         warehouse: Warehouse name
-        customer: Customer to assign (None to clear)
+        customer: Customer to assign (None leaves it unchanged)
         status: Warehouse status (Available/Reserved)
         assignment_date: Assignment timestamp
         commit: Whether to commit changes immediately
+        clear_customer: Clear the assigned customer (customer is ignored)
         
     Returns:
         Success status
@@ -30,7 +43,9 @@ def update_warehouse_status(
         # Prepare update dict
         update_dict = {}
         
-        if customer is not None:
+        if clear_customer:
+            update_dict["assigned_customer"] = None
+        elif customer is not None:
             update_dict["assigned_customer"] = customer
             
         if status is not None:
@@ -47,6 +62,7 @@ def update_warehouse_status(
             
         # Perform batch update for efficiency
         frappe.db.set_value("Warehouse", warehouse, update_dict)
+        invalidate_warehouse_state([warehouse])
         
         if commit:
             frappe.db.commit()
@@ -57,17 +73,164 @@ def update_warehouse_status(
         frappe.log_error(f"Error updating warehouse {warehouse}: {str(e)}", "Warehouse Control")
         return False
 
-def assign_warehouse_to_customer(warehouse: str, customer: str) -> bool:
+def get_status_queue() -> Dict[str, Dict[str, Any]]:
+    """
+    Deferred warehouse status updates of the current transaction (warehouse -> values)
+    """
+    if getattr(frappe.local, "warehouse_status_queue", None) is None:
+        frappe.local.warehouse_status_queue = {}
+    return frappe.local.warehouse_status_queue
+
+def clear_status_queue() -> None:
+    """
+    Drop deferred status updates (transaction rolled back)
+    """
+    frappe.local.warehouse_status_queue = {}
+
+def queue_warehouse_status(warehouse: str, values: Dict[str, Any], expected_customer: Any = _UNGUARDED) -> bool:
+    """
+    Defer a warehouse status update to flush_warehouse_status_updates
+    
+    Later updates of the same warehouse override earlier ones field by field.
+    The queue is flushed at the latest right before the host transaction commits.
+    
+    Args:
+        warehouse: Warehouse name
+        values: Fields to set (see STATUS_FIELDS); None clears a field
+        expected_customer: Only apply the update if the warehouse is still
+            assigned to this customer (None for unassigned) when flushed
+        
+    Returns:
+        Success status
+    """
+    if values.get("warehouse_status") not in (None, "Available", "Reserved"):
+        frappe.log_error(f"Invalid warehouse status: {values['warehouse_status']}", "Warehouse Control")
+        return False
+    
+    queue = get_status_queue()
+    
+    if not queue:
+        frappe.db.before_commit.add(flush_warehouse_status_updates)
+        frappe.db.after_rollback.add(clear_status_queue)
+    
+    queue.setdefault(warehouse, {}).update(values)
+    
+    if expected_customer is not _UNGUARDED:
+        queue[warehouse][EXPECTED_CUSTOMER_KEY] = expected_customer
+    
+    return True
+
+def flush_warehouse_status_updates() -> int:
+    """
+    Write all deferred status updates with a single UPDATE ... CASE statement
+    
+    Runs inside the host transaction: nothing is committed here.
+    
+    Returns:
+        Number of warehouses updated
+    """
+    queue = get_status_queue()
+    if not queue:
+        return 0
+    
+    clear_status_queue()
+    
+    warehouses = list(queue)
+    assignments = []
+    values = {"warehouses": warehouses, "modified": frappe.utils.now()}
+    
+    for field in STATUS_FIELDS:
+        cases = []
+        for index, warehouse in enumerate(warehouses):
+            if field in queue[warehouse]:
+                cases.append(f"WHEN %(w{index})s THEN %({field}_{index})s")
+                values[f"w{index}"] = warehouse
+                values[f"{field}_{index}"] = queue[warehouse][field]
+        
+        if cases:
+            assignments.append(f"`{field}` = CASE name {' '.join(cases)} ELSE `{field}` END")
+    
+    if not assignments:
+        return 0
+    
+    # Compare-and-set: guarded warehouses are skipped if their assignment changed meanwhile
+    guards = []
+    for index, warehouse in enumerate(warehouses):
+        if EXPECTED_CUSTOMER_KEY in queue[warehouse]:
+            guards.append(f"WHEN %(w{index})s THEN IFNULL(assigned_customer, '') = %(expected_{index})s")
+            values[f"w{index}"] = warehouse
+            values[f"expected_{index}"] = queue[warehouse][EXPECTED_CUSTOMER_KEY] or ""
+    
+    guard_condition = f"AND CASE name {' '.join(guards)} ELSE 1 END" if guards else ""
+    
+    try:
+        frappe.db.sql(f"""
+            UPDATE `tabWarehouse`
+            SET {', '.join(assignments)}, modified = %(modified)s
+            WHERE name IN %(warehouses)s
+            {guard_condition}
+        """, values)
+    except Exception as e:
+        frappe.log_error(f"Error flushing warehouse status updates: {str(e)}", "Warehouse Control")
+        raise
+    
+    invalidate_warehouse_state(warehouses)
+    
+    return len(warehouses)
+
+def compare_and_set_assignment(warehouse: str, customer: str, expected_customer: Optional[str]) -> bool:
+    """
+    Atomically assign a warehouse if its assignment is still the one the decision was based on
+    
+    The locking read sees the latest committed row and keeps its row lock
+    until the host transaction ends, so concurrent submits into the same
+    warehouse cannot both assign it. The assignment is written right away
+    rather than queued for flush_warehouse_status_updates.
+    
+    Args:
+        warehouse: Warehouse name
+        customer: Customer to assign
+        expected_customer: Assigned customer seen when deciding (None if unassigned)
+        
+    Returns:
+        True if the warehouse was assigned, False if another transaction changed it first
+    """
+    row = frappe.db.get_value(
+        "Warehouse", warehouse, ["name", "assigned_customer"], as_dict=True, for_update=True
+    )
+    
+    if not row or (row.assigned_customer or None) != (expected_customer or None):
+        invalidate_warehouse_state([warehouse])
+        return False
+    
+    frappe.db.set_value("Warehouse", warehouse, {
+        "assigned_customer": customer,
+        "warehouse_status": "Reserved",
+        "last_assignment_date": frappe.utils.now()
+    })
+    invalidate_warehouse_state([warehouse])
+    
+    return True
+
+def assign_warehouse_to_customer(warehouse: str, customer: str, defer: bool = False) -> bool:
     """
     Assign warehouse to customer with full status update
     
     Args:
         warehouse: Warehouse name
         customer: Customer name
+        defer: Queue the update for the host transaction instead of committing it now
         
     Returns:
         Success status
     """
+    if defer:
+        return queue_warehouse_status(warehouse, {
+            "assigned_customer": customer,
+            "warehouse_status": "Reserved",
+            "last_assignment_date": frappe.utils.now()
+        })
+    
     return update_warehouse_status(
         warehouse=warehouse,
         customer=customer,
@@ -75,19 +238,28 @@ def assign_warehouse_to_customer(warehouse: str, customer: str) -> bool:
         assignment_date=frappe.utils.now()
     )
 
-def release_warehouse(warehouse: str) -> bool:
+def release_warehouse(warehouse: str, defer: bool = False, expected_customer: Optional[str] = None) -> bool:
     """
     Release warehouse (make available)
     
     Args:
         warehouse: Warehouse name
+        defer: Queue the update for the host transaction instead of committing it now
+        expected_customer: With defer, only release if still assigned to this customer
         
     Returns:
         Success status
     """
+    if defer:
+        values = {"assigned_customer": None, "warehouse_status": "Available"}
+        
+        if expected_customer:
+            return queue_warehouse_status(warehouse, values, expected_customer=expected_customer)
+        return queue_warehouse_status(warehouse, values)
+    
+    # Same end state as the deferred path: unassigned and available
     return update_warehouse_status(
         warehouse=warehouse,
-        customer=None,
         status="Available",
-        assignment_date=None
+        clear_customer=True
     )
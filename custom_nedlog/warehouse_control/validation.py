@@ -1,16 +1,78 @@
 import frappe
+import hashlib
+from frappe.utils import flt
 from typing import Optional, Dict, Any, List, Tuple
-from .calculation import get_total_qty, get_warehouse_summary
-from .status_update import assign_warehouse_to_customer, release_warehouse
+from .cache import get_warehouse_state, get_warehouse_states, get_controlled_warehouses, increment_hook_stat
+from .calculation import get_total_qty, get_warehouse_summary, get_warehouse_summaries, get_locked_warehouse_summary
+from .status_update import (
+    assign_warehouse_to_customer,
+    compare_and_set_assignment,
+    release_warehouse,
+    flush_warehouse_status_updates
+)
 from .logging import log_assignment, log_warning, log_release
 
-def get_customer_from_transaction(doc: Dict[str, Any], item: Optional[Dict[str, Any]] = None) -> Optional[str]:
+class WarehouseMixingError(frappe.ValidationError):
+    pass
+
+# Stock Entry row links used to infer the customer, in order of precedence
+LINKED_CUSTOMER_SOURCES = [
+    ("sales_order", "Sales Order"),
+    ("delivery_note", "Delivery Note"),
+    ("material_request", "Material Request")
+]
+
+def get_linked_customers(items: List[Any]) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Resolve the customer of every document linked from Stock Entry rows
+    
+    Args:
+        items: Stock Entry item rows
+        
+    Returns:
+        Dictionary of (doctype, name) to customer, with one IN query per linked doctype
+    """
+    names_by_doctype = {}
+    
+    for item in items:
+        for fieldname, doctype in LINKED_CUSTOMER_SOURCES:
+            if item.get(fieldname):
+                names_by_doctype.setdefault(doctype, set()).add(item.get(fieldname))
+                break  # Only the first link is used for a row
+    
+    linked_customers = {}
+    
+    for doctype, names in names_by_doctype.items():
+        rows = frappe.get_all(
+            doctype,
+            filters={"name": ["in", list(names)]},
+            fields=["name", "customer"]
+        )
+        for row in rows:
+            linked_customers[(doctype, row.name)] = row.customer
+    
+    return linked_customers
+
+def get_document_linked_customers(doc) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Linked customers of a Stock Entry, memoized on the document for all hooks
+    """
+    if doc.flags.warehouse_control_linked_customers is None:
+        doc.flags.warehouse_control_linked_customers = get_linked_customers(doc.get("items", []))
+    return doc.flags.warehouse_control_linked_customers
+
+def get_customer_from_transaction(
+    doc: Dict[str, Any],
+    item: Optional[Dict[str, Any]] = None,
+    linked_customers: Optional[Dict[Tuple[str, str], Optional[str]]] = None
+) -> Optional[str]:
     """
     Extract customer from various transaction types
     
     Args:
         doc: Transaction document
         item: Item row (for Stock Entry)
+        linked_customers: Preloaded customers of linked documents (see get_linked_customers)
         
     Returns:
         Customer name or None
@@ -27,17 +89,12 @@ def get_customer_from_transaction(doc: Dict[str, Any], item: Optional[Dict[str,
     
     # Stock Entry: Infer from linked documents
     if doctype == "Stock Entry" and item:
-        # Try Sales Order
-        if item.get("sales_order"):
-            return frappe.db.get_value("Sales Order", item["sales_order"], "customer")
-        
-        # Try Delivery Note
-        if item.get("delivery_note"):
-            return frappe.db.get_value("Delivery Note", item["delivery_note"], "customer")
-        
-        # Try Material Request
-        if item.get("material_request"):
-            return frappe.db.get_value("Material Request", item["material_request"], "customer")
+        # Try Sales Order, then Delivery Note, then Material Request
+        for fieldname, link_doctype in LINKED_CUSTOMER_SOURCES:
+            if item.get(fieldname):
+                if linked_customers is not None:
+                    return linked_customers.get((link_doctype, item[fieldname]))
+                return frappe.db.get_value(link_doctype, item[fieldname], "customer")
     
     return None
 
@@ -76,21 +133,174 @@ def show_warning_message(warehouse: str, assigned_customer: str, attempting_cust
         alert=True
     )
 
+def is_control_mode_enabled(control_mode: Optional[str]) -> bool:
+    """
+    Check if a warehouse control mode enables control
+    """
+    return control_mode in ["Warning", "Strict"]
+
+def is_strict_mode(control_mode: Optional[str]) -> bool:
+    """
+    Check if a warehouse control mode blocks customer mixing
+    """
+    return control_mode == "Strict"
+
 def is_control_enabled(warehouse: str) -> bool:
     """
     Check if warehouse control is enabled for this warehouse
     """
     try:
-        control_mode = frappe.db.get_value("Warehouse", warehouse, "control_mode")
-        return control_mode in ["Warning", "Strict"]  # Future: Strict mode
+        state = get_warehouse_state(warehouse)
+        return is_control_mode_enabled(state.get("control_mode") if state else None)
     except:
         return True  # Default to enabled
 
+def get_document_non_stock_items(doc) -> frozenset:
+    """
+    Items of a document that post no stock (is_stock_item = 0), memoized on
+    the document for all hooks
+    """
+    if doc.flags.warehouse_control_non_stock_items is None:
+        item_codes = list({item.get("item_code") for item in doc.get("items", []) if item.get("item_code")})
+        doc.flags.warehouse_control_non_stock_items = frozenset(frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes], "is_stock_item": 0},
+            pluck="name"
+        )) if item_codes else frozenset()
+    return doc.flags.warehouse_control_non_stock_items
+
+def get_document_controlled_warehouses(doc, transaction_type: str) -> Optional[frozenset]:
+    """
+    Controlled warehouses touched by a document
+    
+    Args:
+        doc: Transaction document
+        transaction_type: 'incoming' or 'outgoing'
+        
+    Returns:
+        Set of controlled warehouses used by the rows (empty if the document can
+        be skipped), or None if the controlled set could not be loaded
+    """
+    try:
+        controlled = get_controlled_warehouses()
+    except Exception as e:
+        frappe.log_error(f"Error loading controlled warehouses: {str(e)}", "Warehouse Control")
+        return None
+    
+    if not controlled:
+        return frozenset()
+    
+    field = "t_warehouse" if transaction_type == "incoming" else "s_warehouse"
+    
+    return frozenset(
+        warehouse for warehouse in
+        {item.get(field) or item.get("warehouse") for item in doc.get("items", [])}
+        if warehouse in controlled
+    )
+
+def group_items_by_warehouse(
+    doc,
+    transaction_type: str,
+    warehouses: Optional[frozenset] = None
+) -> Dict[Tuple[str, Optional[str]], List[Any]]:
+    """
+    Group document rows by (warehouse, customer), keeping first-seen order
+    
+    Args:
+        doc: Transaction document
+        transaction_type: 'incoming' or 'outgoing'
+        warehouses: Only group rows of these warehouses (all if None)
+        
+    Returns:
+        Dictionary of (warehouse, customer) to item rows. Customer is only
+        resolved for incoming transactions and is None for outgoing ones.
+        Rows of non-stock items are left out: they move no stock.
+    """
+    groups = {}
+    linked_customers = None
+    non_stock_items = get_document_non_stock_items(doc)
+    
+    if transaction_type == "incoming" and doc.doctype == "Stock Entry":
+        linked_customers = get_document_linked_customers(doc)
+    
+    for item in doc.get("items", []):
+        warehouse = get_warehouse_from_item(item.__dict__, transaction_type)
+        if not warehouse or (warehouses is not None and warehouse not in warehouses):
+            continue
+        
+        if item.get("item_code") in non_stock_items:
+            continue
+        
+        customer = None
+        if transaction_type == "incoming":
+            customer = get_customer_from_transaction(doc.__dict__, item.__dict__, linked_customers)
+            if not customer:
+                continue
+        
+        groups.setdefault((warehouse, customer), []).append(item)
+    
+    return groups
+
+# Incoming transactions whose submit does not post stock
+NON_STOCK_DOCTYPES = ["Material Request"]
+
+# Quantities are compared after rounding, so float sums and differences stay exact
+QTY_PRECISION = 6
+
+def get_items_stock_qty(items: List[Any]) -> float:
+    """
+    Quantity of item rows in stock UOM (transfer_qty for Stock Entry rows)
+    """
+    return sum(flt(item.get("transfer_qty") or item.get("stock_qty") or item.get("qty")) for item in items)
+
+def get_document_posted_qty(doc) -> Dict[str, float]:
+    """
+    Stock the submit of a document posted into each warehouse
+    
+    Read from the document's own Stock Ledger Entries, so rows that post
+    nothing (non-stock items, NON_STOCK_DOCTYPES) are never counted.
+    
+    Args:
+        doc: Submitted transaction document
+        
+    Returns:
+        Dictionary of warehouse to net posted quantity (negative when stock left it)
+    """
+    if doc.doctype in NON_STOCK_DOCTYPES:
+        return {}
+    
+    rows = frappe.db.sql("""
+        SELECT warehouse, SUM(actual_qty)
+        FROM `tabStock Ledger Entry`
+        WHERE voucher_type = %s AND voucher_no = %s AND is_cancelled = 0
+        GROUP BY warehouse
+    """, (doc.doctype, doc.name))
+    
+    return {warehouse: flt(qty, QTY_PRECISION) for warehouse, qty in rows}
+
+def raise_strict_violations(violations: List[Dict[str, Any]]) -> None:
+    """
+    Block the submission of a document mixing customers in Strict warehouses
+    """
+    lines = "".join(
+        f"<li>Warehouse <strong>{violation['warehouse']}</strong> is assigned to "
+        f"<strong>{violation['assigned_customer']}</strong>, cannot receive stock for "
+        f"<strong>{violation['customer']}</strong></li>"
+        for violation in violations
+    )
+    
+    frappe.throw(
+        f"Strict warehouse control forbids mixing customers:<ul>{lines}</ul>",
+        title="Warehouse Customer Mixing",
+        exc=WarehouseMixingError
+    )
+
 def validate_warehouse_assignment(
     warehouse: str, 
     customer: str, 
     transaction_doc: Dict[str, Any], 
-    is_incoming: bool = True
+    is_incoming: bool = True,
+    warehouse_info: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Core warehouse validation logic
@@ -100,6 +310,7 @@ def validate_warehouse_assignment(
         customer: Customer attempting to use warehouse
         transaction_doc: Transaction document
         is_incoming: True for incoming transactions
+        warehouse_info: Preloaded warehouse summary (see get_warehouse_summaries)
         
     Returns:
         Validation result dictionary
@@ -107,11 +318,17 @@ def validate_warehouse_assignment(
     if not warehouse or not customer:
         return {"action": "skip", "reason": "Missing warehouse or customer"}
     
-    if not is_control_enabled(warehouse):
+    if warehouse_info is not None and not warehouse_info.get("error"):
+        control_enabled = is_control_mode_enabled(warehouse_info.get("control_mode"))
+    else:
+        control_enabled = is_control_enabled(warehouse)
+    
+    if not control_enabled:
         return {"action": "allow", "reason": "Control disabled"}
     
     try:
-        warehouse_info = get_warehouse_summary(warehouse)
+        if warehouse_info is None:
+            warehouse_info = get_warehouse_summary(warehouse)
         
         if warehouse_info.get("error"):
             return {"action": "skip", "reason": "Warehouse info error"}
@@ -148,6 +365,12 @@ def validate_warehouse_assignment(
                     "action": "assign",
                     "reason": "Warehouse has stock but no assigned customer - auto-assigning"
                 })
+            elif is_strict_mode(warehouse_info.get("control_mode")):
+                # Different customer in a Strict warehouse - block
+                result.update({
+                    "action": "block",
+                    "reason": f"Warehouse assigned to {assigned_customer}, attempting {customer} (Strict)"
+                })
             else:
                 # Different customer - show warning
                 result.update({
@@ -167,44 +390,261 @@ def validate_warehouse_assignment(
         frappe.log_error(f"Validation error for warehouse {warehouse}: {str(e)}", "Warehouse Control")
         return {"action": "skip", "reason": f"Validation error: {str(e)}"}
 
+def decide_after_assignment_conflict(
+    warehouse: str,
+    customer: str,
+    transaction_doc: Dict[str, Any],
+    warehouse_info: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Decide again on the locked row after a lost compare-and-set
+    
+    The concurrent transaction that won may not have posted its stock yet, so
+    the locked row can show an assigned customer with a zero quantity. Such a
+    warehouse is never taken over: mixing customers warns (or blocks in Strict
+    mode), and the same customer is allowed.
+    
+    Args:
+        warehouse: Warehouse name
+        customer: Customer attempting to use warehouse
+        transaction_doc: Transaction document
+        warehouse_info: Locked warehouse summary (see get_locked_warehouse_summary)
+        
+    Returns:
+        Validation result dictionary
+    """
+    result = validate_warehouse_assignment(
+        warehouse=warehouse,
+        customer=customer,
+        transaction_doc=transaction_doc,
+        is_incoming=True,
+        warehouse_info=warehouse_info
+    )
+    assigned_customer = warehouse_info.get("assigned_customer")
+    
+    if result.get("action") != "assign" or not assigned_customer:
+        return result
+    
+    if assigned_customer == customer:
+        result.update({"action": "allow", "reason": "Same customer"})
+    elif is_strict_mode(warehouse_info.get("control_mode")):
+        result.update({
+            "action": "block",
+            "reason": f"Warehouse just assigned to {assigned_customer}, attempting {customer} (Strict)"
+        })
+    else:
+        result.update({
+            "action": "warn",
+            "reason": f"Warehouse just assigned to {assigned_customer}, attempting {customer}"
+        })
+    
+    return result
+
+def claim_warehouse(
+    warehouse: str,
+    customer: str,
+    transaction_doc: Dict[str, Any],
+    validation_result: Dict[str, Any],
+    warehouse_info: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Carry out an "assign" decision with a compare-and-set
+    
+    After a conflict, the decision is taken again on the locked row (see
+    decide_after_assignment_conflict); the only remaining assignment is of a
+    warehouse released meanwhile, which cannot fail while the row is locked.
+    
+    Args:
+        warehouse: Warehouse name
+        customer: Customer to assign
+        transaction_doc: Transaction document
+        validation_result: The "assign" decision
+        warehouse_info: Warehouse summary the decision was based on
+        
+    Returns:
+        Final validation result ("assign" if the warehouse was assigned) and
+        the warehouse summary it was based on
+    """
+    if compare_and_set_assignment(warehouse, customer, warehouse_info["assigned_customer"]):
+        return validation_result, warehouse_info
+    
+    warehouse_info = get_locked_warehouse_summary(warehouse)
+    validation_result = decide_after_assignment_conflict(warehouse, customer, transaction_doc, warehouse_info)
+    
+    if validation_result.get("action") == "assign" and not compare_and_set_assignment(
+        warehouse, customer, warehouse_info["assigned_customer"]
+    ):
+        validation_result["action"] = "skip"  # Cannot happen while the row is locked
+    
+    return validation_result, warehouse_info
+
+def get_strict_violations(doc) -> List[Dict[str, Any]]:
+    """
+    Rows of a document that would mix customers in Strict warehouses
+    
+    Runs before the stock is posted: the decision uses the cached warehouse
+    states and the stock counters, and the rows of the document itself are
+    applied in order, so two customers entering the same empty warehouse are
+    caught as well. Fails open when the controlled set cannot be loaded, like
+    the submit handlers.
+    
+    Args:
+        doc: Incoming transaction document
+        
+    Returns:
+        List of blocking validation results
+    """
+    warehouses = get_document_controlled_warehouses(doc, "incoming")
+    if not warehouses:
+        return []
+    
+    states = get_warehouse_states(warehouses)
+    strict = frozenset(
+        warehouse for warehouse in warehouses
+        if states.get(warehouse) and is_strict_mode(states[warehouse].get("control_mode"))
+    )
+    if not strict:
+        return []
+    
+    groups = group_items_by_warehouse(doc, "incoming", strict)
+    summaries = get_warehouse_summaries(warehouse for warehouse, customer in groups)
+    violations = []
+    
+    # Assignments the check relied on, compared again on submit
+    doc.flags.warehouse_control_seen = {
+        warehouse: info.get("assigned_customer")
+        for warehouse, info in summaries.items() if not info.get("error")
+    }
+    
+    for (warehouse, customer), items in groups.items():
+        warehouse_info = summaries[warehouse]
+        
+        validation_result = validate_warehouse_assignment(
+            warehouse=warehouse,
+            customer=customer,
+            transaction_doc=doc.__dict__,
+            is_incoming=True,
+            warehouse_info=warehouse_info
+        )
+        action = validation_result.get("action")
+        
+        if action == "block":
+            violations.append(validation_result)
+        elif action in ("assign", "allow") and not warehouse_info.get("error"):
+            # Later rows of the document see its own stock
+            warehouse_info["assigned_customer"] = customer
+            warehouse_info["total_qty"] = flt(warehouse_info["total_qty"] + get_items_stock_qty(items), QTY_PRECISION)
+    
+    return violations
+
+def enforce_strict_control(doc, method):
+    """
+    before_submit hook of incoming transactions: block customer mixing in
+    Strict warehouses before any stock moves
+    """
+    violations = get_strict_violations(doc)
+    if violations:
+        raise_strict_violations(violations)
+
+def exclude_pending_qty(warehouse_info: Dict[str, Any], qty: float) -> None:
+    """
+    Take stock posted by the document but not yet decided on out of a summary
+    """
+    if not warehouse_info.get("error"):
+        warehouse_info["total_qty"] = flt(warehouse_info["total_qty"] - qty, QTY_PRECISION)
+
 def handle_incoming_transaction(doc, method):
     """
     Handle incoming transactions (Purchase Receipt, Stock Entry Material Receipt)
+    
+    Rows are grouped by (warehouse, customer) and the state of every touched
+    warehouse is loaded in one query, so the decision and the writes happen
+    once per warehouse instead of once per row.
+    
+    The stock of the document is already posted: decisions use the quantity
+    before it, and its rows are added back group by group, as in
+    get_strict_violations. A Strict block only stands if the assignment
+    changed since before_submit checked it.
     """
+    # Fast path: documents touching no controlled warehouse exit before any row work
+    warehouses = get_document_controlled_warehouses(doc, "incoming")
+    if warehouses is not None and not warehouses:
+        increment_hook_stat(doc.doctype, "skipped")
+        return
+    
+    increment_hook_stat(doc.doctype, "processed")
     frappe.logger().info(f"Warehouse Control: Processing incoming {doc.doctype} - {doc.name}")
     
     try:
-        for item in doc.get("items", []):
-            warehouse = get_warehouse_from_item(item.__dict__, "incoming")
-            if not warehouse:
-                continue
-            
-            customer = get_customer_from_transaction(doc.__dict__, item.__dict__)
-            if not customer:
-                continue
+        groups = group_items_by_warehouse(doc, "incoming", warehouses)
+        if not groups:
+            return
+        
+        summaries = get_warehouse_summaries(warehouse for warehouse, customer in groups)
+        posted_qty = get_document_posted_qty(doc)
+        pending_qty = {warehouse: posted_qty.get(warehouse, 0.0) for warehouse in summaries}
+        
+        for warehouse, qty in pending_qty.items():
+            exclude_pending_qty(summaries[warehouse], qty)
+        
+        for (warehouse, customer), items in groups.items():
+            warehouse_info = summaries[warehouse]
             
             # Validate warehouse assignment
             validation_result = validate_warehouse_assignment(
                 warehouse=warehouse,
                 customer=customer,
                 transaction_doc=doc.__dict__,
-                is_incoming=True
+                is_incoming=True,
+                warehouse_info=warehouse_info
             )
             
             action = validation_result.get("action")
             
             if action == "assign":
-                # Assign warehouse to customer
-                if assign_warehouse_to_customer(warehouse, customer):
-                    log_assignment(
-                        warehouse=warehouse,
-                        customer=customer,
-                        transaction_type=doc.doctype,
-                        transaction_name=doc.name,
-                        qty_before=validation_result["total_qty_before"],
-                        qty_after=get_total_qty(warehouse)  # Recalculate after transaction
-                    )
-                    frappe.logger().info(f"Warehouse {warehouse} assigned to {customer}")
+                # Written at once with a compare-and-set, not through the batched flush
+                claimed_result, claimed_info = claim_warehouse(
+                    warehouse, customer, doc.__dict__, validation_result, warehouse_info
+                )
+                if claimed_info is not warehouse_info:
+                    # Decided again on the locked row, which holds the whole document's stock
+                    exclude_pending_qty(claimed_info, pending_qty.get(warehouse, 0.0))
+                validation_result, warehouse_info = claimed_result, claimed_info
+                summaries[warehouse] = warehouse_info
+                action = validation_result.get("action")
+            
+            if action == "block":
+                seen = doc.flags.warehouse_control_seen or {}
+                locked_info = get_locked_warehouse_summary(warehouse)
+                
+                if warehouse not in seen or locked_info.get("error") or locked_info["assigned_customer"] != seen[warehouse]:
+                    # Strict warehouse assigned by a concurrent submit since before_submit
+                    raise_strict_violations([validation_result])
+                
+                # Same assignment before_submit allowed: not a new mixing
+                action = "warn"
+            
+            group_qty = 0.0 if doc.doctype in NON_STOCK_DOCTYPES else get_items_stock_qty(items)
+            if not warehouse_info.get("error"):
+                # Later groups for this warehouse see the stock of this one
+                warehouse_info["total_qty"] = flt(warehouse_info["total_qty"] + group_qty, QTY_PRECISION)
+                pending_qty[warehouse] = pending_qty.get(warehouse, 0.0) - group_qty
+            
+            if action == "assign":
+                # Warehouse assigned to customer (compare-and-set above)
+                # Later groups for this warehouse see the new assignment
+                warehouse_info["assigned_customer"] = customer
+                warehouse_info["warehouse_status"] = "Reserved"
+                
+                log_assignment(
+                    warehouse=warehouse,
+                    customer=customer,
+                    transaction_type=doc.doctype,
+                    transaction_name=doc.name,
+                    qty_before=validation_result["total_qty_before"],
+                    qty_after=warehouse_info["total_qty"]
+                )
+                frappe.logger().info(f"Warehouse {warehouse} assigned to {customer}")
                     
             elif action == "warn":
                 # Show warning and log
@@ -221,10 +661,16 @@ def handle_incoming_transaction(doc, method):
                     transaction_name=doc.name,
                     qty_before=validation_result["total_qty_before"]
                 )
-                frappe.logger().info(f"Warehouse mixing warning: {warehouse}")
+                frappe.logger().info(f"Warehouse mixing warning: {warehouse} ({len(items)} rows)")
                 
             elif action == "allow":
                 frappe.logger().info(f"Warehouse {warehouse} usage allowed for {customer}")
+        
+        # All status changes of the document in one statement, committed with the submit
+        flush_warehouse_status_updates()
+    
+    except WarehouseMixingError:
+        raise
                 
     except Exception as e:
         frappe.log_error(f"Error in incoming transaction handler: {str(e)}", "Warehouse Control")
@@ -232,41 +678,112 @@ def handle_incoming_transaction(doc, method):
 def handle_outgoing_transaction(doc, method):
     """
     Handle outgoing transactions (Delivery Note, Stock Entry Material Issue)
+    
+    Each source warehouse is checked once, with the state of all touched
+    warehouses loaded in one query.
     """
+    # Fast path: documents touching no controlled warehouse exit before any row work
+    warehouses = get_document_controlled_warehouses(doc, "outgoing")
+    if warehouses is not None and not warehouses:
+        increment_hook_stat(doc.doctype, "skipped")
+        return
+    
+    increment_hook_stat(doc.doctype, "processed")
     frappe.logger().info(f"Warehouse Control: Processing outgoing {doc.doctype} - {doc.name}")
     
     try:
-        for item in doc.get("items", []):
-            warehouse = get_warehouse_from_item(item.__dict__, "outgoing")
-            if not warehouse:
-                continue
+        groups = group_items_by_warehouse(doc, "outgoing", warehouses)
+        if not groups:
+            return
+        
+        summaries = get_warehouse_summaries(warehouse for warehouse, customer in groups)
+        posted_qty = None
+        
+        for warehouse, customer in groups:
+            warehouse_info = summaries[warehouse]
             
-            if not is_control_enabled(warehouse):
+            if warehouse_info.get("error"):
                 continue
             
-            # Check if warehouse should be released
-            warehouse_info = get_warehouse_summary(warehouse)
-            
-            if warehouse_info.get("error"):
+            if not is_control_mode_enabled(warehouse_info.get("control_mode")):
                 continue
             
-            total_qty_before = warehouse_info["total_qty"]
+            # Stock is already posted on submit: the summary is the quantity after the transaction
+            total_qty_after = warehouse_info["total_qty"]
             assigned_customer = warehouse_info["assigned_customer"]
             
-            # Recalculate after transaction
-            total_qty_after = get_total_qty(warehouse)
-            
             if total_qty_after == 0 and assigned_customer:
                 # Release warehouse
-                if release_warehouse(warehouse):
+                if release_warehouse(warehouse, defer=True, expected_customer=assigned_customer):
+                    if posted_qty is None:
+                        # Only read when a warehouse is released
+                        posted_qty = get_document_posted_qty(doc)
+                    
+                    # Logged with the quantity before this document, as the replay does
                     log_release(
                         warehouse=warehouse,
                         released_customer=assigned_customer,
                         transaction_type=doc.doctype,
                         transaction_name=doc.name,
-                        qty_before=total_qty_before
+                        qty_before=flt(total_qty_after - posted_qty.get(warehouse, 0.0), QTY_PRECISION)
                     )
                     frappe.logger().info(f"Warehouse {warehouse} released from {assigned_customer}")
+        
+        # All releases of the document in one statement, committed with the submit
+        flush_warehouse_status_updates()
                     
     except Exception as e:
         frappe.log_error(f"Error in outgoing transaction handler: {str(e)}", "Warehouse Control")
+
+# Stock Entry fields that can change what the warehouse control decides
+STOCK_ENTRY_WAREHOUSE_FIELDS = ["from_warehouse", "to_warehouse"]
+STOCK_ENTRY_ITEM_WAREHOUSE_FIELDS = ["item_code", "s_warehouse", "t_warehouse", "transfer_qty"]
+
+# Repeated updates of a Stock Entry with the same warehouse fingerprint are
+# processed once within this window
+UPDATE_DEBOUNCE_SECONDS = 30
+
+def get_warehouse_fingerprint(doc) -> Optional[str]:
+    """
+    Hash of the warehouse-relevant fields of a Stock Entry
+    
+    Args:
+        doc: Stock Entry document (or its before-save copy)
+        
+    Returns:
+        Fingerprint string, or None if there is no document
+    """
+    if not doc:
+        return None
+    
+    values = [doc.get(field) for field in STOCK_ENTRY_WAREHOUSE_FIELDS]
+    values.append(sorted(
+        tuple(str(item.get(field) or "") for field in STOCK_ENTRY_ITEM_WAREHOUSE_FIELDS)
+        for item in doc.get("items", [])
+    ))
+    
+    return hashlib.md5(repr(values).encode()).hexdigest()
+
+def handle_stock_entry_update_after_submit(doc, method):
+    """
+    Stock Entry on_update_after_submit hook
+    
+    Post-submit edits (remarks, custom fields...) do not move stock: the
+    outgoing handler only runs when warehouse-relevant fields changed, and
+    once per fingerprint within UPDATE_DEBOUNCE_SECONDS.
+    """
+    fingerprint = get_warehouse_fingerprint(doc)
+    
+    if fingerprint == get_warehouse_fingerprint(doc.get_doc_before_save()):
+        increment_hook_stat(doc.doctype, "skipped")
+        return
+    
+    cache = frappe.cache()
+    debounce_key = f"warehouse_control_update:{doc.name}"
+    
+    if cache.get_value(debounce_key, expires=True) == fingerprint:
+        increment_hook_stat(doc.doctype, "skipped")
+        return
+    
+    cache.set_value(debounce_key, fingerprint, expires_in_sec=UPDATE_DEBOUNCE_SECONDS)
+    handle_outgoing_transaction(doc, method)